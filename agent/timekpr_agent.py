@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Reference agent pushing timekpr state to the TimeKpr web UI.
+
+Runs on the client computer next to timekpr-nExT and posts the output of
+`timekpra --userinfo` for the given users to /api/ingest whenever it
+changes, and at least every --heartbeat seconds. Only the Python standard
+library is used.
+
+Each batch has a sequence number kept in --state-file. A batch that could
+not be delivered is resent with the same number, so the server applies it
+at most once. When the state file was lost, the server answers 409 with
+its last applied number and the batch is resent numbered after it.
+
+Usage:
+    TIMEKPR_AGENT_TOKEN=<token> python3 timekpr_agent.py \\
+        --server http://webui:5000 alice bob
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+PAYLOAD_VERSION = 1
+
+logger = logging.getLogger('timekpr-agent')
+
+
+def read_userinfo(username):
+    """Raw `timekpra --userinfo` output, or None when the command fails"""
+    try:
+        result = subprocess.run(
+            ['timekpra', '--userinfo', username],
+            capture_output=True, text=True, timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("timekpra failed for %s: %s", username, e)
+        return None
+    return result.stdout
+
+
+def strip_volatile(output):
+    """Drop the lines that change every second so unchanged state is not resent"""
+    volatile = ('TIME_LEFT_DAY', 'TIME_SPENT_DAY', 'TIME_SPENT_BALANCE', 'ACTUAL_')
+    return '\n'.join(line for line in output.splitlines() if not line.startswith(volatile))
+
+
+class StateFile:
+    """Persisted sequence number and the last batch not yet acknowledged"""
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self.pending = None
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.seq = data.get('seq', 0)
+            self.pending = data.get('pending')
+    
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'seq': self.seq, 'pending': self.pending}, f)
+        os.replace(tmp, self.path)
+
+
+def post_batch(server, token, batch, timeout=15):
+    request = urllib.request.Request(
+        server.rstrip('/') + '/api/ingest',
+        data=json.dumps(batch).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'},
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+def run(args, token):
+    state = StateFile(args.state_file)
+    last_sent = {}  # username -> state without volatile counters
+    last_push = 0
+    
+    while True:
+        if state.pending is None:
+            reports = []
+            for username in args.users:
+                output = read_userinfo(username)
+                if output is None:
+                    continue
+                stable = strip_volatile(output)
+                changed = last_sent.get(username) != stable
+                if changed or time.time() - last_push >= args.heartbeat:
+                    reports.append({'username': username, 'userinfo': output})
+                    last_sent[username] = stable
+            if reports:
+                state.seq += 1
+                state.pending = {'version': PAYLOAD_VERSION, 'seq': state.seq, 'reports': reports}
+                state.save()
+        
+        if state.pending is not None:
+            try:
+                result = post_batch(args.server, token, state.pending)
+                logger.info("Batch %d delivered: %s", state.pending['seq'], result)
+                state.pending = None
+                state.save()
+                last_push = time.time()
+            except urllib.error.HTTPError as e:
+                body = e.read()
+                if e.code == 409:
+                    # The server applied later batches than ours (state file lost or reset): renumber and resend
+                    state.seq = json.loads(body)['seq'] + 1
+                    logger.warning("Batch %d is behind the server, resending as %d", state.pending['seq'], state.seq)
+                    state.pending['seq'] = state.seq
+                    state.save()
+                    continue
+                logger.error("Server rejected batch %d: %s %s", state.pending['seq'], e.code, body[:200])
+                if e.code == 400:
+                    state.pending = None  # Malformed: resending will not help
+                    state.save()
+            except (urllib.error.URLError, OSError) as e:
+                logger.warning("Server unreachable, will retry: %s", e)
+        
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Push timekpr user state to the TimeKpr web UI')
+    parser.add_argument('users', nargs='+', help='Usernames managed by timekpr on this computer')
+    parser.add_argument('--server', required=True, help='Web UI base URL, e.g. http://webui:5000')
+    parser.add_argument('--interval', type=int, default=10, help='Seconds between checks (default 10)')
+    parser.add_argument('--heartbeat', type=int, default=60,
+                        help='Push at least this often even without changes (default 60)')
+    parser.add_argument('--state-file', default=os.path.expanduser('~/.timekpr-agent.json'))
+    parser.add_argument('--once', action='store_true', help='Push once and exit')
+    args = parser.parse_args()
+    
+    token = os.environ.get('TIMEKPR_AGENT_TOKEN')
+    if not token:
+        parser.error('TIMEKPR_AGENT_TOKEN is not set')
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run(args, token)
+
+
+if __name__ == '__main__':
+    main()
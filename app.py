@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, abort, send_from_directory
 import os
+import hmac
 from datetime import datetime, date, timedelta
 import json
 import logging
@@ -8,19 +9,33 @@ import pytz
 from src.database import (
     db,
     ManagedUser,
-    UserTimeUsage,
     Settings,
     UserWeeklySchedule,
     UserDailyTimeInterval,
-    coerce_time_spent_day,
+    Job,
+    RemoteCommand,
+    SchedulePolicy,
+    Agent,
 )
-from src.ssh_helper import SSHClient
 from src.task_manager import BackgroundTaskManager
 from src.migrator import run_migrations
+from src.events import broker
+from src.http_cache import conditional_json
+from src.intervals import validate_day
+from src.ingest import ingest_batch, IngestError, SequenceConflict
+from src.usage_query import usage_series, earliest_usage_date, UsageQueryError, DEFAULT_MAX_POINTS, MAX_POINTS
+from src import metrics
+from src.request_profiler import RequestProfiler
+from src.cycle_profiles import MAX_CYCLES, NAME_RE as PROFILE_NAME_RE
+from src.sync_trace import tracer
+from src.assets import StaticAssets
+from src.compression import ResponseCompressor
+from src.fragment_cache import FragmentCache
+from src.history_io import export_chunks, export_filename, import_usage, read_rows, text_lines, detect_format, FORMATS
 
-# Configure logging
+# Configure logging; per-command detail is in the sync traces (/api/sync-traces) or at LOG_LEVEL=DEBUG
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
@@ -36,12 +51,25 @@ except pytz.exceptions.UnknownTimeZoneError:
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///timekpr.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///timekpr.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize the database
 db.init_app(app)
 
+# Opt-in per-request timing and SQL statement counts (see /api/request-profile)
+app.config['REQUEST_PROFILING'] = os.environ.get('REQUEST_PROFILING') == '1'
+if os.environ.get('REQUEST_QUERY_BUDGET'):
+    app.config['REQUEST_QUERY_BUDGET'] = int(os.environ['REQUEST_QUERY_BUDGET'])
+request_profiler = RequestProfiler(app, db)
+
+# Fingerprinted static files (asset_url in templates, see build_assets.py) and gzip for HTML/JSON
+static_assets = StaticAssets(app)
+response_compressor = ResponseCompressor(app)
+
+# Compiled templates cached under instance/jinja_cache, rendered per-user fragments in memory
+fragment_cache = FragmentCache(app)
+
 # Initialize background task manager
 task_manager = BackgroundTaskManager()
 task_manager.init_app(app)
@@ -70,6 +98,95 @@ def inject_timezone():
     """Inject timezone info into all templates"""
     return {'timezone': TIMEZONE_STR}
 
+def format_time_left(seconds):
+    """Format TIME_LEFT_DAY seconds as '1h 30m' for display"""
+    if seconds is None:
+        return "Unknown"
+    return f"{seconds // 3600}h {(seconds % 3600) // 60}m"
+
+def format_pending_adjustment(seconds):
+    """Describe a net queued time adjustment, or None when nothing is pending"""
+    if not seconds:
+        return None
+    return f"{'+' if seconds > 0 else '-'}{abs(seconds) // 60} minutes"
+
+DASHBOARD_PAGE_SIZE = 24  # User cards per dashboard page
+MAX_PAGE_SIZE = 100  # Largest page (and batch of user ids) the dashboard APIs accept
+DASHBOARD_STATES = ('online', 'offline', 'low')
+
+def parse_user_ids(value):
+    """Comma-separated user ids from a query string, at most MAX_PAGE_SIZE"""
+    ids = []
+    for part in (value or '').split(','):
+        if part.strip().isdigit():
+            ids.append(int(part))
+    return ids[:MAX_PAGE_SIZE]
+
+DAY_NAMES = ['', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WEEK_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+def parse_intervals_payload(intervals_data):
+    """
+    Parse {"1": [{"start_hour": 9, ...}, ...], ...} into {day: [(sh, sm, eh, em), ...]}.
+    Returns: (intervals_by_day, error_message)
+    """
+    intervals_by_day = {}
+    for day_str, day_list in intervals_data.items():
+        try:
+            day_of_week = int(day_str)
+            if not (1 <= day_of_week <= 7):
+                continue
+
+            for interval_data in day_list:
+                sh = int(interval_data.get('start_hour', 9))
+                sm = int(interval_data.get('start_minute', 0))
+                eh = int(interval_data.get('end_hour', 17))
+                em = int(interval_data.get('end_minute', 0))
+
+                interval = UserDailyTimeInterval(
+                    day_of_week=day_of_week,
+                    start_hour=sh,
+                    start_minute=sm,
+                    end_hour=eh,
+                    end_minute=em,
+                )
+                if not interval.is_valid_interval():
+                    return None, (f'Invalid interval on {DAY_NAMES[day_of_week]}: '
+                                  f'{sh:02d}:{sm:02d}–{eh:02d}:{em:02d} (start must be before end)')
+
+                intervals_by_day.setdefault(day_of_week, []).append((sh, sm, eh, em))
+
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return None, f'Invalid data: {str(e)}'
+
+    # Overlaps are merged; a day must still compile to one range per hour for timekpr
+    for day_of_week, bounds_list in intervals_by_day.items():
+        error = validate_day(bounds_list)
+        if error:
+            return None, f'Invalid intervals on {DAY_NAMES[day_of_week]}: {error}'
+    return intervals_by_day, None
+
+def parse_schedule_payload(submitted):
+    """
+    Parse {"monday": 2, ...} daily limits in hours, clamped to 0-24.
+    Returns: (schedule_dict, error_message)
+    """
+    schedule_data = {}
+    for day in WEEK_DAYS:
+        try:
+            hours = float(submitted.get(day, 0))
+        except (TypeError, ValueError):
+            return None, f'Invalid hours for {day}'
+        schedule_data[day] = min(max(hours, 0), 24)
+    return schedule_data, None
+
+def get_user_revision_or_404(user_id):
+    """Fetch only the user's data_revision, used as a cheap version token for ETags"""
+    revision = db.session.query(ManagedUser.data_revision).filter_by(id=user_id).scalar()
+    if revision is None:
+        abort(404)
+    return revision
+
 @app.route('/', methods=['GET', 'POST'])
 def login():
     error = None
@@ -95,48 +212,58 @@ def dashboard():
         flash('Please login first', 'warning')
         return redirect(url_for('login'))
     
-    # Get all valid users - make sure we're getting fresh data by expiring SQLAlchemy's cache
+    # One page of valid users matching the filters - make sure we're getting fresh data by expiring SQLAlchemy's cache
     db.session.expire_all()
-    users = ManagedUser.query.filter_by(is_valid=True).all()
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'host': request.args.get('host', '').strip(),
+        'state': request.args.get('state', '') if request.args.get('state') in DASHBOARD_STATES else '',
+    }
+    per_page = min(max(request.args.get('per_page', DASHBOARD_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    query = ManagedUser.query_dashboard(filters['q'], filters['host'], filters['state'])
+    page = query.paginate(page=request.args.get('page', 1, type=int), per_page=per_page, error_out=False)
+    if not page.items and page.page > 1 and page.pages:
+        # Past the end (e.g. users were removed): show the last page
+        page = query.paginate(page=page.pages, per_page=per_page, error_out=False)
+    hosts = [host for (host,) in db.session.query(ManagedUser.system_ip).filter(
+        ManagedUser.is_valid == True
+    ).distinct().order_by(ManagedUser.system_ip)]
     
     # Track users with pending time adjustments
     pending_adjustments = {}
+    queued_adjustments = RemoteCommand.pending_adjustments()
     
-    # Prepare user data for the dashboard
+    # Prepare user data for the dashboard; usage charts are fetched for visible cards only
     user_data = []
-    for user in users:
-        # Get usage data for charts
-        usage_data = user.get_recent_usage(days=7)
-        
+    for user in page.items:
         # Get time left today if available
-        time_left = user.get_config_value('TIME_LEFT_DAY')
-        if time_left is not None:
-            time_left_hours = time_left // 3600
-            time_left_minutes = (time_left % 3600) // 60
-            time_left_formatted = f"{time_left_hours}h {time_left_minutes}m"
-        else:
-            time_left_formatted = "Unknown"
+        time_left_formatted = format_time_left(user.get_config_value('TIME_LEFT_DAY'))
         
         # Do NOT format last_checked time - pass the datetime object directly
         # So the template can format it
         
         # Check for pending time adjustments
-        if user.pending_time_adjustment is not None and user.pending_time_operation is not None:
-            minutes = user.pending_time_adjustment // 60
-            operation = user.pending_time_operation
-            pending_adjustments[str(user.id)] = f"{operation}{minutes} minutes"
+        pending = format_pending_adjustment(queued_adjustments.get(user.id))
+        if pending:
+            pending_adjustments[str(user.id)] = pending
         
         user_data.append({
             'id': user.id,
             'username': user.username,
             'system_ip': user.system_ip,
             'last_checked': user.last_checked,  # Keep as datetime object
-            'usage_data': usage_data,
             'time_left': time_left_formatted,
-            'weekly_schedule': user.weekly_schedule
+            'data_revision': user.data_revision,
         })
     
-    return render_template('dashboard.html', users=user_data, pending_adjustments=pending_adjustments)
+    # Query string of the current filters, for the pagination links
+    page_args = {key: value for key, value in filters.items() if value}
+    if per_page != DASHBOARD_PAGE_SIZE:
+        page_args['per_page'] = per_page
+    
+    return render_template('dashboard.html', users=user_data, pending_adjustments=pending_adjustments,
+                           page=page, filters=filters, hosts=hosts, page_args=page_args,
+                           usage_from=date.today() - timedelta(days=6))
 
 @app.route('/admin')
 def admin():
@@ -146,7 +273,13 @@ def admin():
     
     # Get all managed users
     users = ManagedUser.query.all()
-    return render_template('admin.html', users=users)
+    return render_template(
+        'admin.html',
+        users=users,
+        profiles=task_manager.cycle_profiler.list_profiles(),
+        profiling_pending=task_manager.cycle_profiler.pending,
+        max_profile_cycles=MAX_CYCLES,
+    )
 
 @app.route('/settings', methods=['GET', 'POST'])
 def settings():
@@ -186,11 +319,247 @@ def get_task_status():
         return jsonify({'success': False, 'message': 'Not authenticated'}), 401
     
     status = task_manager.get_status()
+    return conditional_json(
+        json.dumps(status, sort_keys=True),
+        lambda: jsonify({
+            'success': True,
+            'status': status
+        })
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Poller, SSH and database metrics in the Prometheus text format (session or METRICS_TOKEN bearer)"""
+    token = os.environ.get('METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(token) and hmac.compare_digest(auth, f'Bearer {token}')
+    if not token_ok and not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    metrics.outbox_depth.set(RemoteCommand.query.count())
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/request-profile')
+def get_request_profile():
+    """Per-route timing and SQL statement summary of recent requests (REQUEST_PROFILING=1)"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
     return jsonify({
         'success': True,
-        'status': status
+        'enabled': request_profiler.enabled,
+        'routes': request_profiler.summary(),
+        'recent': request_profiler.recent(request.args.get('limit', 50, type=int)),
     })
 
+@app.route('/api/sync-traces')
+def get_sync_traces():
+    """Recent per-user sync traces: phase timings, remote commands and outcome, newest first"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user_id = request.args.get('user_id', type=int)
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({'success': True, 'traces': tracer.traces(user_id, limit)})
+
+@app.route('/api/dashboard/status')
+def get_dashboard_status():
+    """Sync state, pending adjustments and time left for the dashboard users (?ids=1,2,3 or all) in one response"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    status = task_manager.get_status()
+    user_filter = [ManagedUser.is_valid == True]
+    if request.args.get('ids') is not None:
+        user_filter.append(ManagedUser.id.in_(parse_user_ids(request.args['ids'])))
+    
+    # Version token from one aggregate query: any revision bump, added/removed user
+    # or change of a displayed last_checked minute invalidates the cached response
+    version = db.session.query(
+        db.func.count(ManagedUser.id),
+        db.func.sum(ManagedUser.data_revision),
+        db.func.sum(db.cast(db.func.strftime('%s', ManagedUser.last_checked), db.Integer) / 60)
+    ).filter(*user_filter).one()
+    
+    def build():
+        # One query for users and their schedules instead of one request per user card
+        rows = db.session.query(ManagedUser, UserWeeklySchedule).outerjoin(
+            UserWeeklySchedule, UserWeeklySchedule.user_id == ManagedUser.id
+        ).filter(*user_filter).all()
+        queued_adjustments = RemoteCommand.pending_adjustments()
+        
+        users = {}
+        for user, schedule in rows:
+            users[str(user.id)] = {
+                # No schedule means no sync needed
+                'is_synced': not user.needs_sync(),
+                'has_schedule': schedule is not None,
+                'pending_adjustment': format_pending_adjustment(queued_adjustments.get(user.id)),
+                'last_checked': (localtime_filter(user.last_checked).strftime('%H:%M')
+                                 if user.last_checked else None),
+                'time_left': format_time_left(user.get_config_value('TIME_LEFT_DAY')),
+            }
+        
+        return jsonify({
+            'success': True,
+            'task_status': status,
+            'users': users
+        })
+    
+    return conditional_json((tuple(version), json.dumps(status, sort_keys=True), request.args.get('ids')), build)
+
+@app.route('/api/usage')
+def get_usage():
+    """
+    Usage totals of several users: ?ids=1,2&from=YYYY-MM-DD|all&to=YYYY-MM-DD&bucket=day|week|month|year
+    &max_points=N. Ranges needing more than max_points buckets are returned with a coarser bucket.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    revisions = db.session.query(ManagedUser.id, ManagedUser.data_revision).filter(
+        ManagedUser.id.in_(parse_user_ids(request.args.get('ids')))
+    ).order_by(ManagedUser.id).all()
+    user_ids = [user_id for user_id, _ in revisions]
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        if request.args.get('from') == 'all':
+            start = min(earliest_usage_date(user_ids) or end, end)
+        elif request.args.get('from'):
+            start = date.fromisoformat(request.args['from'])
+        else:
+            start = end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'from and to must be YYYY-MM-DD dates'}), 400
+    bucket = request.args.get('bucket', 'day')
+    max_points = request.args.get('max_points', DEFAULT_MAX_POINTS, type=int)
+    
+    def build():
+        try:
+            series = usage_series(user_ids, start, end, bucket, max_points)
+        except UsageQueryError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        series['users'] = {str(user_id): values for user_id, values in series['users'].items()}
+        return jsonify({'success': True, **series})
+    
+    # Ranges ending today grow with the date, so it is part of the version
+    return conditional_json(
+        ('usage-series', tuple(revisions), start, end, bucket, max_points, date.today().isoformat()), build
+    )
+
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events stream of live updates published by the background tasks"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    q = broker.subscribe()
+    if q is None:
+        # Every stream holds a worker thread: past the cap the page polls instead
+        return jsonify({'success': False, 'message': 'Too many open event streams'}), 503, {'Retry-After': '60'}
+    response = Response(
+        stream_with_context(broker.stream(q)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so events arrive immediately
+        }
+    )
+    # Also frees the slot when the stream is closed before it started
+    response.call_on_close(lambda: broker.unsubscribe(q))
+    return response
+
+@app.route('/profile-tasks', methods=['POST'])
+def profile_tasks():
+    """Profile the next background task cycles with cProfile (saved under instance/profiles)"""
+    if not session.get('logged_in'):
+        flash('Please login first', 'warning')
+        return redirect(url_for('login'))
+    
+    try:
+        cycles = int(request.form.get('cycles', 1))
+    except ValueError:
+        cycles = 0
+    if not 1 <= cycles <= MAX_CYCLES:
+        flash(f'Choose between 1 and {MAX_CYCLES} cycles to profile', 'danger')
+    elif task_manager.cycle_profiler.request(cycles):
+        flash(f'Profiling the next {cycles} background cycle(s); the result appears below when done', 'success')
+    else:
+        flash('A profile capture is already running', 'warning')
+    return redirect(url_for('admin'))
+
+@app.route('/profiles/<name>')
+def download_profile(name):
+    """Download a saved cycle profile (.pstats or .txt summary)"""
+    if not session.get('logged_in'):
+        flash('Please login first', 'warning')
+        return redirect(url_for('login'))
+    
+    if not PROFILE_NAME_RE.match(name):
+        abort(404)
+    return send_from_directory(task_manager.cycle_profiler.directory, name, as_attachment=name.endswith('.pstats'))
+
+@app.route('/export/<kind>')
+def export_history(kind):
+    """
+    Stream usage history or schedules: /export/usage|schedules?format=csv|ndjson&ids=1,2
+    (&from=YYYY-MM-DD&to=YYYY-MM-DD for usage). All users when ids is omitted.
+    """
+    if not session.get('logged_in'):
+        flash('Please login first', 'warning')
+        return redirect(url_for('login'))
+    
+    if kind not in ('usage', 'schedules'):
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        flash(f"Export format must be one of {', '.join(FORMATS)}", 'danger')
+        return redirect(url_for('admin'))
+    filters = {'user_ids': parse_user_ids(request.args.get('ids'))}
+    if kind == 'usage':
+        try:
+            filters['start'] = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            filters['end'] = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except ValueError:
+            flash('from and to must be YYYY-MM-DD dates', 'danger')
+            return redirect(url_for('admin'))
+    
+    return Response(
+        stream_with_context(export_chunks(kind, fmt, **filters)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(kind, fmt)}"'},
+    )
+
+@app.route('/import-usage', methods=['POST'])
+def import_history():
+    """Bulk load an uploaded usage export (CSV or NDJSON, as made by /export/usage)"""
+    if not session.get('logged_in'):
+        flash('Please login first', 'warning')
+        return redirect(url_for('login'))
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or NDJSON file to import', 'danger')
+        return redirect(url_for('admin'))
+    fmt = detect_format(upload.filename, upload.mimetype)
+    try:
+        result = import_usage(
+            read_rows(text_lines(upload.stream), fmt),
+            create_users=request.form.get('create_users') == 'on',
+        )
+    except UnicodeDecodeError:
+        db.session.rollback()
+        flash('The file is not UTF-8 text', 'danger')
+        return redirect(url_for('admin'))
+    
+    message = f"Imported {result['imported']} usage rows for {result['users']} users"
+    if result['created_users']:
+        message += f", {result['created_users']} users added"
+    if result['skipped']:
+        message += f"; skipped {result['skipped']} rows ({'; '.join(result['errors'][:3])})"
+    flash(message, 'warning' if result['skipped'] else 'success')
+    return redirect(url_for('admin'))
+
 @app.route('/restart-tasks')
 def restart_tasks():
     """Restart the background task manager"""
@@ -239,41 +608,15 @@ def add_user():
         flash(f'User {username} on {system_ip} already exists', 'warning')
         return redirect(url_for('admin'))
     
-    # Create new user
-    new_user = ManagedUser(username=username, system_ip=system_ip)
-    
-    # Validate with timekpr
-    ssh_client = SSHClient(hostname=system_ip)
-    is_valid, message, config_dict = ssh_client.validate_user(username)
-    
-    new_user.is_valid = is_valid
-    new_user.last_checked = datetime.utcnow()
-    
-    if is_valid and config_dict:
-        new_user.last_config = json.dumps(config_dict)
-        
-        # Add the user to get an ID first
-        db.session.add(new_user)
-        db.session.commit()
-        
-        # Add today's usage data
-        today = date.today()
-        time_spent = coerce_time_spent_day(config_dict.get('TIME_SPENT_DAY', 0))
-        
-        usage = UserTimeUsage(
-            user_id=new_user.id,
-            date=today,
-            time_spent=time_spent
-        )
-        db.session.add(usage)
-        db.session.commit()
-        
-        flash(f'User {username} added and validated successfully', 'success')
-    else:
-        db.session.add(new_user)
-        db.session.commit()
-        flash(f'User {username} added but validation failed: {message}', 'warning')
+    # Create new user; validation with timekpr runs in the background
+    new_user = ManagedUser(username=username, system_ip=system_ip, is_valid=False)
+    db.session.add(new_user)
+    db.session.flush()
+    Job.enqueue('validate_user', new_user.id)
+    db.session.commit()
+    task_manager.wake()
     
+    flash(f'User {username} added, validation is running in the background', 'info')
     return redirect(url_for('admin'))
 
 @app.route('/users/validate/<int:user_id>')
@@ -283,43 +626,12 @@ def validate_user(user_id):
     
     user = ManagedUser.query.get_or_404(user_id)
     
-    # Validate with timekpr
-    ssh_client = SSHClient(hostname=user.system_ip)
-    is_valid, message, config_dict = ssh_client.validate_user(user.username)
-    
-    user.is_valid = is_valid
-    user.last_checked = datetime.utcnow()
-    
-    if is_valid and config_dict:
-        user.last_config = json.dumps(config_dict)
-        
-        # Update today's usage data
-        today = date.today()
-        time_spent = coerce_time_spent_day(config_dict.get('TIME_SPENT_DAY', 0))
-        
-        # Look for an existing record for today
-        usage = UserTimeUsage.query.filter_by(
-            user_id=user.id,
-            date=today
-        ).first()
-        
-        if usage:
-            usage.time_spent = time_spent
-        else:
-            # Create a new record
-            usage = UserTimeUsage(
-                user_id=user.id,
-                date=today,
-                time_spent=time_spent
-            )
-            db.session.add(usage)
-        
-        db.session.commit()
-        flash(f'User {user.username} validated successfully', 'success')
-    else:
-        db.session.commit()
-        flash(f'User validation failed: {message}', 'danger')
+    # Validate with timekpr in the background
+    Job.enqueue('validate_user', user.id)
+    db.session.commit()
+    task_manager.wake()
     
+    flash(f'Validation of {user.username} queued, the page will update when it completes', 'info')
     return redirect(url_for('admin'))
 
 @app.route('/users/delete/<int:user_id>', methods=['POST'])
@@ -332,6 +644,7 @@ def delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    fragment_cache.invalidate(user_id)
     
     flash(f'User {username} removed successfully', 'success')
     return redirect(url_for('admin'))
@@ -342,24 +655,26 @@ def get_user_usage(user_id):
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Not authenticated'}), 401
     
-    user = ManagedUser.query.get_or_404(user_id)
-    days = request.args.get('days', 7, type=int)
-    
-    usage_data = user.get_recent_usage(days=days)
+    days = min(max(request.args.get('days', 7, type=int), 1), MAX_POINTS)
+    revision = get_user_revision_or_404(user_id)
     
-    # Format for chart.js
-    labels = list(usage_data.keys())
-    values = list(usage_data.values())
-    
-    # Convert seconds to hours for better readability
-    values_hours = [round(v / 3600, 1) for v in values]
+    def build():
+        user = ManagedUser.query.get_or_404(user_id)
+        today = date.today()
+        # Long ranges come back in weeks or months rather than thousands of days
+        series = usage_series([user.id], today - timedelta(days=days - 1), today, 'day')
+        
+        return jsonify({
+            'success': True,
+            'labels': series['buckets'],
+            'bucket': series['bucket'],
+            # Convert seconds to hours for better readability
+            'values': [round(v / 3600, 1) for v in series['users'][user.id]],
+            'username': user.username
+        })
     
-    return jsonify({
-        'success': True,
-        'labels': labels,
-        'values': values_hours,
-        'username': user.username
-    })
+    # The window ends today, so the date is part of the version
+    return conditional_json(('usage', user_id, revision, days, date.today().isoformat()), build)
 
 @app.route('/weekly-schedule/<int:user_id>')
 def weekly_schedule_user(user_id):
@@ -375,6 +690,7 @@ def weekly_schedule_user(user_id):
     if not user.weekly_schedule:
         schedule = UserWeeklySchedule(user_id=user.id)
         db.session.add(schedule)
+        user.bump_revision()
         db.session.commit()
     
     return render_template('weekly_schedule_single.html', user=user)
@@ -424,11 +740,16 @@ def update_weekly_schedule():
     else:
         schedule = user.weekly_schedule
     
-    # Update the schedule
+    # Update the schedule; a user on a schedule policy now keeps their own limits
     schedule.set_schedule_from_dict(schedule_data)
+    if user.policy_id is not None:
+        user.override_limits = True
+    RemoteCommand.queue_push(user, RemoteCommand.WEEKLY_LIMITS)
+    user.bump_revision()
     
     try:
         db.session.commit()
+        broker.publish('user_updated', {'user_id': user.id})
         flash(f'Weekly schedule updated for {user.username}', 'success')
     except Exception as e:
         db.session.rollback()
@@ -442,32 +763,37 @@ def get_user_intervals(user_id):
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Not authenticated'}), 401
     
-    user = ManagedUser.query.get_or_404(user_id)
+    revision = get_user_revision_or_404(user_id)
     
-    # Get all intervals for this user, ordered by day and sort_order
-    intervals = UserDailyTimeInterval.query.filter_by(user_id=user.id).order_by(
-        UserDailyTimeInterval.day_of_week,
-        UserDailyTimeInterval.sort_order
-    ).all()
-
-    # Format intervals as a list per day
-    intervals_dict = {str(d): [] for d in range(1, 8)}
-    for interval in intervals:
-        intervals_dict[str(interval.day_of_week)].append({
-            'id': interval.id,
-            'start_hour': interval.start_hour,
-            'start_minute': interval.start_minute,
-            'end_hour': interval.end_hour,
-            'end_minute': interval.end_minute,
-            'is_synced': interval.is_synced,
-            'time_range': interval.get_time_range_string(),
-        })
+    def build():
+        user = ManagedUser.query.get_or_404(user_id)
+        
+        # Get all intervals for this user, ordered by day and sort_order
+        intervals = UserDailyTimeInterval.query.filter_by(user_id=user.id).order_by(
+            UserDailyTimeInterval.day_of_week,
+            UserDailyTimeInterval.sort_order
+        ).all()
 
-    return jsonify({
-        'success': True,
-        'intervals': intervals_dict,
-        'username': user.username
-    })
+        # Format intervals as a list per day
+        intervals_dict = {str(d): [] for d in range(1, 8)}
+        for interval in intervals:
+            intervals_dict[str(interval.day_of_week)].append({
+                'id': interval.id,
+                'start_hour': interval.start_hour,
+                'start_minute': interval.start_minute,
+                'end_hour': interval.end_hour,
+                'end_minute': interval.end_minute,
+                'is_synced': interval.is_synced,
+                'time_range': interval.get_time_range_string(),
+            })
+
+        return jsonify({
+            'success': True,
+            'intervals': intervals_dict,
+            'username': user.username
+        })
+    
+    return conditional_json(('intervals', user_id, revision), build)
 
 @app.route('/api/user/<int:user_id>/intervals/update', methods=['POST'])
 def update_user_intervals(user_id):
@@ -484,52 +810,30 @@ def update_user_intervals(user_id):
 
         intervals_data = data.get('intervals', {})
 
-        # Delete all existing intervals for this user and replace entirely
-        UserDailyTimeInterval.query.filter_by(user_id=user.id).delete()
-
-        for day_str, day_list in intervals_data.items():
-            try:
-                day_of_week = int(day_str)
-                if not (1 <= day_of_week <= 7):
-                    continue
-
-                for sort_idx, interval_data in enumerate(day_list):
-                    sh = int(interval_data.get('start_hour', 9))
-                    sm = int(interval_data.get('start_minute', 0))
-                    eh = int(interval_data.get('end_hour', 17))
-                    em = int(interval_data.get('end_minute', 0))
-
-                    interval = UserDailyTimeInterval(
-                        user_id=user.id,
-                        day_of_week=day_of_week,
-                        start_hour=sh,
-                        start_minute=sm,
-                        end_hour=eh,
-                        end_minute=em,
-                        is_enabled=True,
-                        is_synced=False,
-                        sort_order=sort_idx,
-                    )
-                    if not interval.is_valid_interval():
-                        day_names = ['', 'Monday', 'Tuesday', 'Wednesday',
-                                     'Thursday', 'Friday', 'Saturday', 'Sunday']
-                        return jsonify({
-                            'success': False,
-                            'message': f'Invalid interval on {day_names[day_of_week]}: '
-                                       f'{sh:02d}:{sm:02d}–{eh:02d}:{em:02d} (start must be before end)'
-                        }), 400
-
-                    db.session.add(interval)
-
-            except (ValueError, KeyError) as e:
-                return jsonify({'success': False, 'message': f'Invalid data: {str(e)}'}), 400
+        # Parse and validate everything before touching the stored intervals
+        intervals_by_day, error = parse_intervals_payload(intervals_data)
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
 
+        # A user on a schedule policy now keeps their own intervals: every day must be resent
+        if user.policy_id is not None and not user.override_intervals:
+            user.override_intervals = True
+            RemoteCommand.queue_push(user, RemoteCommand.ALLOWED_HOURS)
+
+        # Only rewrite (and push) the days that actually changed
+        changed_days = user.set_time_intervals(intervals_by_day)
+        if changed_days:
+            RemoteCommand.queue_push(user, RemoteCommand.ALLOWED_HOURS, days=changed_days)
+            user.bump_revision()
         db.session.commit()
+        if changed_days:
+            broker.publish('user_updated', {'user_id': user.id})
 
         return jsonify({
             'success': True,
             'message': f'Time intervals updated for {user.username}',
-            'username': user.username
+            'username': user.username,
+            'changed_days': sorted(changed_days)
         })
 
     except Exception as e:
@@ -544,29 +848,17 @@ def get_intervals_sync_status(user_id):
     
     user = ManagedUser.query.get_or_404(user_id)
     
-    # Get all intervals for this user
-    intervals = UserDailyTimeInterval.query.filter_by(user_id=user.id).all()
-    
-    # Check if any intervals need sync
-    needs_sync = any(not interval.is_synced for interval in intervals)
-    
-    # Get last sync time (most recent among all intervals)
-    last_synced = None
-    if intervals:
-        synced_intervals = [i for i in intervals if i.last_synced]
-        if synced_intervals:
-            last_synced = max(i.last_synced for i in synced_intervals)
-            last_synced = last_synced.strftime('%Y-%m-%d %H:%M')
-    
-    # Count enabled vs total intervals
-    enabled_count = sum(1 for i in intervals if i.is_enabled)
-    total_count = len(intervals)
+    # Count enabled vs total intervals in SQL instead of loading every row
+    total_count, enabled_count = db.session.query(
+        db.func.count(UserDailyTimeInterval.id),
+        db.func.sum(db.cast(UserDailyTimeInterval.is_enabled, db.Integer))
+    ).filter(UserDailyTimeInterval.user_id == user.id).one()
     
     return jsonify({
         'success': True,
-        'needs_sync': needs_sync,
-        'last_synced': last_synced,
-        'enabled_intervals': enabled_count,
+        'needs_sync': user.needs_sync(),
+        'last_synced': user.last_applied.strftime('%Y-%m-%d %H:%M') if user.last_applied else None,
+        'enabled_intervals': enabled_count or 0,
         'total_intervals': total_count,
         'username': user.username
     })
@@ -577,29 +869,34 @@ def get_schedule_sync_status(user_id):
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Not authenticated'}), 401
     
-    user = ManagedUser.query.get_or_404(user_id)
+    revision = get_user_revision_or_404(user_id)
     
-    if user.weekly_schedule:
-        schedule_dict = user.weekly_schedule.get_schedule_dict()
-        last_synced = None
-        if user.weekly_schedule.last_synced:
-            last_synced = user.weekly_schedule.last_synced.strftime('%Y-%m-%d %H:%M')
+    def build():
+        user = ManagedUser.query.get_or_404(user_id)
         
-        return jsonify({
-            'success': True,
-            'is_synced': user.weekly_schedule.is_synced,
-            'schedule': schedule_dict,
-            'last_synced': last_synced,
-            'last_modified': user.weekly_schedule.last_modified.strftime('%Y-%m-%d %H:%M') if user.weekly_schedule.last_modified else None
-        })
-    else:
-        return jsonify({
-            'success': True,
-            'is_synced': True,  # No schedule means no sync needed
-            'schedule': None,
-            'last_synced': None,
-            'last_modified': None
-        })
+        if user.weekly_schedule:
+            schedule_dict = user.weekly_schedule.get_schedule_dict()
+            last_synced = None
+            if user.weekly_schedule.last_synced:
+                last_synced = user.weekly_schedule.last_synced.strftime('%Y-%m-%d %H:%M')
+            
+            return jsonify({
+                'success': True,
+                'is_synced': not user.needs_sync(),
+                'schedule': schedule_dict,
+                'last_synced': last_synced,
+                'last_modified': user.weekly_schedule.last_modified.strftime('%Y-%m-%d %H:%M') if user.weekly_schedule.last_modified else None
+            })
+        else:
+            return jsonify({
+                'success': True,
+                'is_synced': True,  # No schedule means no sync needed
+                'schedule': None,
+                'last_synced': None,
+                'last_modified': None
+            })
+    
+    return conditional_json(('schedule-sync', user_id, revision), build)
 
 @app.route('/stats/<int:user_id>')
 def user_stats(user_id):
@@ -610,18 +907,19 @@ def user_stats(user_id):
 
     user = ManagedUser.query.get_or_404(user_id)
 
-    daily_30   = user.get_recent_usage(days=30)
-    weekly_13  = user.get_usage_weekly_grouped(weeks=13)
-    monthly_12 = user.get_usage_monthly_grouped(months=12)
-    all_monthly = user.get_all_usage_monthly()
-
-    return render_template('stats.html',
-        user=user,
-        daily_30=daily_30,
-        weekly_13=weekly_13,
-        monthly_12=monthly_12,
-        all_monthly=all_monthly,
-    )
+    # The charts fetch their data from /api/usage when their tab is opened
+    today = date.today()
+    this_monday = today - timedelta(days=today.weekday())
+    # First day of the month 11 months ago, so the monthly chart shows 12 months
+    months_back = date(today.year - (today.month <= 11), (today.month - 12) % 12 + 1, 1)
+    usage_urls = {
+        'daily': url_for('get_usage', ids=user.id, bucket='day', **{'from': today - timedelta(days=29), 'to': today}),
+        'weekly': url_for('get_usage', ids=user.id, bucket='week', **{'from': this_monday - timedelta(weeks=12), 'to': today}),
+        'monthly': url_for('get_usage', ids=user.id, bucket='month', **{'from': months_back, 'to': today}),
+        'alltime': url_for('get_usage', ids=user.id, bucket='month', **{'from': 'all', 'to': today}),
+    }
+
+    return render_template('stats.html', user=user, usage_urls=usage_urls)
 
 @app.route('/api/modify-time', methods=['POST'])
 def modify_time():
@@ -650,48 +948,280 @@ def modify_time():
     # Get user from database
     user = ManagedUser.query.get_or_404(user_id)
     
-    # Create SSH client
-    ssh_client = SSHClient(hostname=user.system_ip)
-    
-    # Execute the command
-    success, message = ssh_client.modify_time_left(user.username, operation, seconds)
-    
-    if success:
-        # Update user info to reflect changes
-        is_valid, _, config_dict = ssh_client.validate_user(user.username)
-        if is_valid and config_dict:
-            user.last_checked = datetime.utcnow()
-            user.last_config = json.dumps(config_dict)
-            # Clear any pending adjustments since we succeeded
-            user.pending_time_adjustment = None
-            user.pending_time_operation = None
-            db.session.commit()
-            
-        return jsonify({
-            'success': True,
-            'message': message,
-            'username': user.username,
-            'refresh': True
-        })
-    else:
-        # Store as pending adjustment if it failed
-        # First clear any existing pending adjustment
-        user.pending_time_adjustment = seconds
-        user.pending_time_operation = operation
+    # Queue the change; the background task manager applies it over SSH
+    job = Job.enqueue('modify_time', user.id, operation=operation, seconds=seconds)
+    db.session.commit()
+    task_manager.wake()
+    
+    return jsonify({
+        'success': True,
+        'message': 'Time adjustment queued',
+        'username': user.username,
+        'job_id': job.id,
+    }), 202
+
+@app.route('/api/jobs/<int:job_id>')
+def get_job(job_id):
+    """Get the status of a background job"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+def resolve_bulk_users(selection):
+    """
+    Turn a bulk request's user selection ("all" or a list of ids) into users.
+    Returns: (users, error_message)
+    """
+    if selection == 'all':
+        return ManagedUser.query.filter_by(is_valid=True).order_by(ManagedUser.id).all(), None
+    if not isinstance(selection, list) or not selection:
+        return None, "users must be 'all' or a non-empty list of user ids"
+    try:
+        user_ids = {int(user_id) for user_id in selection}
+    except (TypeError, ValueError):
+        return None, 'Invalid user id'
+    users = ManagedUser.query.filter(ManagedUser.id.in_(user_ids)).order_by(ManagedUser.id).all()
+    missing = user_ids - {user.id for user in users}
+    if missing:
+        return None, f"Unknown user ids: {', '.join(str(i) for i in sorted(missing))}"
+    return users, None
+
+def stream_bulk_results(users, user_result):
+    """
+    Deliver the queued commands of all affected computers in parallel and stream
+    one NDJSON line per user as each computer finishes, then a summary line.
+    user_result(user) returns the operation-specific part of a user's line.
+    """
+    by_host = {}
+    for user in users:
+        by_host.setdefault(user.system_ip, []).append(user.id)
+    
+    def generate():
+        pending = 0
+        for hostname, reachable in task_manager.deliver_now(list(by_host)):
+            # Delivery ran in other threads: reload what it changed
+            db.session.expire_all()
+            for user_id in by_host[hostname]:
+                user = db.session.get(ManagedUser, user_id)
+                result = user_result(user)
+                pending += result['status'] == 'pending'
+                result.update({
+                    'user_id': user.id,
+                    'username': user.username,
+                    'system_ip': hostname,
+                    'reachable': reachable,
+                })
+                yield json.dumps(result) + '\n'
+        yield json.dumps({
+            'done': True,
+            'users': len(users),
+            'hosts': len(by_host),
+            'pending': pending,
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/bulk/modify-time', methods=['POST'])
+def bulk_modify_time():
+    """Add or remove time for many users at once, e.g. {"users": "all", "operation": "+", "seconds": 1800}"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    users, error = resolve_bulk_users(data.get('users'))
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    operation = data.get('operation')
+    if operation not in ['+', '-']:
+        return jsonify({'success': False, 'message': "Operation must be '+' or '-'"}), 400
+    try:
+        seconds = int(data.get('seconds'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid parameter format'}), 400
+    
+    for user in users:
+        RemoteCommand.queue_time_adjustment(user, operation, seconds)
+        user.bump_revision()
+    db.session.commit()
+    
+    def user_result(user):
+        queued = RemoteCommand.query.filter_by(user_id=user.id, kind=RemoteCommand.TIME_ADJUSTMENT).first()
+        if queued is None:
+            return {'status': 'applied'}
+        return {'status': 'pending', 'pending_adjustment': format_pending_adjustment(queued.seconds)}
+    
+    return stream_bulk_results(users, user_result)
+
+@app.route('/api/bulk/weekly-schedule', methods=['POST'])
+def bulk_weekly_schedule():
+    """Apply one weekly schedule to many users, e.g. {"users": [1, 2], "schedule": {"monday": 2, ...}}"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    users, error = resolve_bulk_users(data.get('users'))
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    schedule_data, error = parse_schedule_payload(data.get('schedule') or {})
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    for user in users:
+        if user.policy_id is not None:
+            user.override_limits = True
+        if not user.weekly_schedule:
+            user.weekly_schedule = UserWeeklySchedule(user_id=user.id)
+        user.weekly_schedule.set_schedule_from_dict(schedule_data)
+        RemoteCommand.queue_push(user, RemoteCommand.WEEKLY_LIMITS)
+        user.bump_revision()
+    db.session.commit()
+    for user in users:
+        broker.publish('user_updated', {'user_id': user.id})
+    
+    def user_result(user):
+        return {'status': 'pending' if user.needs_sync() else 'applied'}
+    
+    return stream_bulk_results(users, user_result)
+
+def apply_policy_payload(policy, data):
+    """Set a policy's limits and/or intervals from a request body; returns an error message or None"""
+    if 'schedule' in data:
+        schedule_data, error = parse_schedule_payload(data.get('schedule') or {})
+        if error:
+            return error
+        policy.set_schedule_from_dict(schedule_data)
+    if 'intervals' in data:
+        intervals_by_day, error = parse_intervals_payload(data.get('intervals') or {})
+        if error:
+            return error
+        policy.set_intervals(intervals_by_day)
+    return None
+
+@app.route('/api/policies', methods=['GET', 'POST'])
+def schedule_policies():
+    """List schedule policies, or create one from {"name", "schedule", "intervals"}"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    if request.method == 'GET':
+        policies = SchedulePolicy.query.order_by(SchedulePolicy.name).all()
+        return jsonify({'success': True, 'policies': [policy.to_dict() for policy in policies]})
+    
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'success': False, 'message': 'Policy name is required'}), 400
+    if SchedulePolicy.query.filter_by(name=name).first():
+        return jsonify({'success': False, 'message': f'Policy {name} already exists'}), 400
+    
+    policy = SchedulePolicy(name=name)
+    error = apply_policy_payload(policy, data)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    db.session.add(policy)
+    db.session.commit()
+    return jsonify({'success': True, 'policy': policy.to_dict()}), 201
+
+@app.route('/api/policies/<int:policy_id>', methods=['PUT', 'DELETE'])
+def schedule_policy(policy_id):
+    """Update a schedule policy (marks every subscriber dirty) or delete it"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    policy = SchedulePolicy.query.get_or_404(policy_id)
+    
+    if request.method == 'DELETE':
+        # Subscribers fall back to their own schedule and intervals
+        subscribers = list(policy.subscribers)
+        for user in subscribers:
+            user.policy_id = None
+            user.override_limits = False
+            user.override_intervals = False
+            user.mark_config_dirty()
+            user.bump_revision()
+        db.session.delete(policy)
         db.session.commit()
-        
-        return jsonify({
-            'success': True,  # We report success since we stored it for later
-            'message': f"Computer seems to be offline. Time adjustment of {operation}{seconds} seconds has been queued and will be applied when the computer comes online.",
-            'username': user.username,
-            'pending': True,
-            'refresh': True
-        })
+        for user in subscribers:
+            broker.publish('user_updated', {'user_id': user.id})
+        return jsonify({'success': True, 'message': f'Policy {policy.name} deleted'})
+    
+    data = request.get_json(silent=True) or {}
+    if 'name' in data:
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'success': False, 'message': 'Policy name is required'}), 400
+        policy.name = name
+    error = apply_policy_payload(policy, data)
+    if error:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': error}), 400
+    
+    dirty = policy.mark_changed()
+    db.session.commit()
+    broker.publish('policy_updated', {'policy_id': policy.id, 'subscribers': dirty})
+    return jsonify({'success': True, 'policy': policy.to_dict(), 'dirty_users': dirty})
+
+@app.route('/api/user/<int:user_id>/policy', methods=['POST'])
+def set_user_policy(user_id):
+    """Subscribe a user to a policy ({"policy_id": 3} or null) with optional override flags"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user = ManagedUser.query.get_or_404(user_id)
+    data = request.get_json(silent=True) or {}
+    
+    policy_id = data.get('policy_id')
+    if policy_id is not None:
+        policy = db.session.get(SchedulePolicy, policy_id) if isinstance(policy_id, int) else None
+        if policy is None:
+            return jsonify({'success': False, 'message': 'Policy not found'}), 404
+    
+    user.policy_id = policy_id
+    user.override_limits = bool(data.get('override_limits', False))
+    user.override_intervals = bool(data.get('override_intervals', False))
+    user.mark_config_dirty()
+    user.bump_revision()
+    db.session.commit()
+    broker.publish('user_updated', {'user_id': user.id})
+    
+    return jsonify({
+        'success': True,
+        'message': f'Schedule policy updated for {user.username}',
+        'policy_id': user.policy_id,
+        'override_limits': user.override_limits,
+        'override_intervals': user.override_intervals,
+    })
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest():
+    """Receive a batch of timekpr state pushed by a client agent (bearer token auth, no session)"""
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+    agent = Agent.from_token(token)
+    if agent is None:
+        return jsonify({'success': False, 'message': 'Invalid agent token'}), 401
+    
+    try:
+        return jsonify(ingest_batch(agent, request.get_json(silent=True)))
+    except SequenceConflict as e:
+        # The agent lost its state: it renumbers the batch from seq and resends
+        return jsonify({'success': False, 'message': str(e), 'seq': e.last_seq}), 409
+    except IngestError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
 
 # With app context
 with app.app_context():
     db.create_all()
     print("Database tables verified")
+    metrics.instrument_database(db.engine)
     run_migrations(app)
     print("Database migrations applied")
     
@@ -700,9 +1230,10 @@ with app.app_context():
         Settings.set_admin_password('admin')
         print("Admin password initialized")
     
-    # Start background tasks automatically
-    task_manager.start()
-    print("Background tasks started automatically")
+    # Start background tasks automatically (benchmarks and scripts importing the app opt out)
+    if os.environ.get('DISABLE_BACKGROUND_TASKS') != '1':
+        task_manager.start()
+        print("Background tasks started automatically")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
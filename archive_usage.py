@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Manually archive old daily usage rows into yearly records.
+
+The background task manager runs the same job once a day; this script is
+useful after raising or lowering USAGE_ARCHIVE_DAYS.
+
+Usage: python archive_usage.py [horizon_days]
+"""
+import sys
+
+from flask import Flask
+from src.database import db
+from src.archiver import archive_usage, get_horizon_days
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///timekpr.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+if __name__ == '__main__':
+    horizon = int(sys.argv[1]) if len(sys.argv) > 1 else get_horizon_days()
+    with app.app_context():
+        db.create_all()
+        archived = archive_usage(horizon_days=horizon)
+        print(f"Archived {archived} daily usage rows older than {horizon} days")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark the background poll cycle against a fleet of fake computers.
+
+Starts a FakeFleet (see fake_timekpr.py), registers its users in a
+scratch database and runs BackgroundTaskManager._update_user_data a few
+times, as the task loop would. Reports per cycle: wall time, SSH
+connections opened, remote commands run and database writes (INSERT /
+UPDATE / DELETE statements and commits).
+
+Usage:
+    python benchmarks/bench_poll_cycle.py --hosts 20 --users 3 --latency 0.02
+    python benchmarks/bench_poll_cycle.py --hosts 10 --offline 3 --loss 0.05 --adjustments 5
+    python benchmarks/bench_poll_cycle.py --hosts 20 --record fleet.jsonl.gz
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import paramiko  # noqa: E402
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from benchmarks.fake_timekpr import FakeFleet  # noqa: E402
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class WriteCounter:
+    """Counts data-modifying statements and commits on an engine"""
+    def __init__(self, engine):
+        self.writes = 0
+        self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in WRITE_PREFIXES:
+            self.writes += 1
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def snapshot(self):
+        return self.writes, self.commits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the poll cycle against fake timekpr computers')
+    parser.add_argument('--hosts', type=int, default=10)
+    parser.add_argument('--users', type=int, default=3, help='Users per computer')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds per round trip')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability a command drops the connection')
+    parser.add_argument('--offline', type=int, default=0, help='Computers refusing connections')
+    parser.add_argument('--adjustments', type=int, default=0, help='Time adjustments queued before each cycle')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', metavar='PATH', help='Write an SSH transcript for bench_replay.py')
+    parser.add_argument('--verbose', action='store_true', help='Show the task manager log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    scratch = tempfile.TemporaryDirectory()
+
+    # Any key is accepted by the fake servers; it only has to exist
+    key_path = os.path.join(scratch.name, 'client_key')
+    paramiko.RSAKey.generate(2048).write_private_key_file(key_path)
+    os.environ['TIMEKPR_SSH_KEY'] = key_path
+
+    from src.database import db, ManagedUser, RemoteCommand
+    from src.task_manager import BackgroundTaskManager
+    from src.ssh_helper import start_recording, stop_transcript
+    if args.record:
+        start_recording(args.record)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(scratch.name, 'bench.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    rng = random.Random(args.seed)
+
+    with FakeFleet(args.hosts, args.users, args.latency, args.loss, args.offline, args.seed) as fleet, \
+            app.app_context():
+        db.create_all()
+        for host in fleet.hosts:
+            for username in host.users:
+                db.session.add(ManagedUser(username=username, system_ip=host.address, is_valid=True))
+        db.session.commit()
+        user_ids = [user_id for (user_id,) in db.session.query(ManagedUser.id).all()]
+
+        manager = BackgroundTaskManager(app)  # Not started: cycles are driven from here
+        counter = WriteCounter(db.engine)
+        print(f'{args.hosts} computers ({args.offline} offline), {len(user_ids)} users, '
+              f'latency {args.latency * 1000:.0f} ms, loss {args.loss:.0%}')
+        print(f"\n{'cycle':>5}{'seconds':>10}{'ssh conns':>11}{'commands':>10}{'db writes':>11}{'commits':>9}")
+
+        rows = []
+        for cycle in range(1, args.cycles + 1):
+            for user_id in rng.sample(user_ids, min(args.adjustments, len(user_ids))):
+                RemoteCommand.queue_time_adjustment(db.session.get(ManagedUser, user_id), '+', 900)
+            db.session.commit()
+
+            connections, commands = fleet.counters()
+            writes, commits = counter.snapshot()
+            started = time.perf_counter()
+            manager._update_user_data()
+            elapsed = time.perf_counter() - started
+            new_connections, new_commands = fleet.counters()
+            new_writes, new_commits = counter.snapshot()
+
+            row = (elapsed, new_connections - connections, new_commands - commands,
+                   new_writes - writes, new_commits - commits)
+            rows.append(row)
+            print(f'{cycle:>5}{row[0]:>10.3f}{row[1]:>11}{row[2]:>10}{row[3]:>11}{row[4]:>9}')
+
+        manager.sessions.close_all()
+        stop_transcript()
+
+    times = [row[0] for row in rows]
+    print(f'\ncycle time: mean {statistics.mean(times):.3f}s, median {statistics.median(times):.3f}s, '
+          f'max {max(times):.3f}s')
+    print(f'per cycle: {statistics.mean(r[1] for r in rows):.1f} connections, '
+          f'{statistics.mean(r[3] for r in rows):.1f} db writes, {statistics.mean(r[4] for r in rows):.1f} commits')
+    scratch.cleanup()
+
+
+if __name__ == '__main__':
+    main()
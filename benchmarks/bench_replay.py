@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded SSH transcript through the poll cycle, without network.
+
+Record a transcript against real computers (TIMEKPR_SSH_RECORD=path while
+the app runs) or the fake fleet (bench_poll_cycle.py --record path). The
+users to register are taken from the transcript's --userinfo commands.
+With the default speed 0 every command answers instantly, so the timings
+cover parsing, diffing and database writes only; --speed 1 replays at the
+recorded pace.
+
+Usage:
+    python benchmarks/bench_replay.py fleet.jsonl.gz --cycles 20
+    python benchmarks/bench_replay.py fleet.jsonl.gz --profile 25
+"""
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+
+from benchmarks.bench_poll_cycle import WriteCounter  # noqa: E402
+
+USERINFO_PREFIX = 'timekpra --userinfo '
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay an SSH transcript through the poll cycle')
+    parser.add_argument('transcript')
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--speed', type=float, default=0, help='0 = instant, 1 = recorded pace, 2 = twice as fast')
+    parser.add_argument('--profile', type=int, metavar='N', default=0,
+                        help='Profile the cycles and print the N most expensive functions')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    from src.database import db, ManagedUser
+    from src.task_manager import BackgroundTaskManager
+    from src.ssh_helper import start_replay, stop_transcript
+
+    replayer = start_replay(args.transcript, args.speed)
+    scratch = tempfile.TemporaryDirectory()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(scratch.name, 'replay.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        for address in replayer.addresses():
+            for command in replayer.commands(address):
+                if command.startswith(USERINFO_PREFIX):
+                    username = command[len(USERINFO_PREFIX):]
+                    db.session.add(ManagedUser(username=username, system_ip=address, is_valid=True))
+        db.session.commit()
+        user_count = ManagedUser.query.count()
+        print(f'{len(replayer.addresses())} computers, {user_count} users from {args.transcript}')
+
+        manager = BackgroundTaskManager(app)
+        counter = WriteCounter(db.engine)
+        profiler = cProfile.Profile() if args.profile else None
+        times = []
+        writes, commits = counter.snapshot()
+        for _ in range(args.cycles):
+            started = time.perf_counter()
+            if profiler:
+                profiler.runcall(manager._update_user_data)
+            else:
+                manager._update_user_data()
+            times.append(time.perf_counter() - started)
+        new_writes, new_commits = counter.snapshot()
+        stop_transcript()
+
+    print(f'{args.cycles} cycles: mean {statistics.mean(times) * 1000:.1f} ms, '
+          f'median {statistics.median(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms')
+    print(f'per cycle: {(new_writes - writes) / args.cycles:.1f} db writes, '
+          f'{(new_commits - commits) / args.cycles:.1f} commits, '
+          f'{statistics.mean(times) / max(user_count, 1) * 1e6:.0f} us per user')
+    if profiler:
+        print()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile)
+    scratch.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Benchmark the dashboard, stats, usage and interval routes on a synthetic database.
+
+Generates a scratch database with generate_data.py (or uses --db), then
+requests each route through the Flask test client and reports the median
+and 95th percentile wall time and the SQL statements per request. Results
+are compared with the tracked baseline in benchmarks/baselines/routes.json:
+a route running more SQL statements than its baseline fails the run (exit
+status 1). Timings are printed next to the baseline's for reference only,
+since wall time recorded on another machine (or under other load) says
+little about this run. Baselines are only compared at the scale they were
+recorded at.
+
+Usage:
+    python benchmarks/bench_routes.py
+    python benchmarks/bench_routes.py --users 500 --years 5 --repeat 50
+    python benchmarks/bench_routes.py --db sqlite:////tmp/bench.db
+    python benchmarks/bench_routes.py --save-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'routes.json')
+SAMPLE_USERS = 20  # Users the per-user routes rotate through
+
+# Two interval sets update_user_intervals alternates between, so every request writes
+INTERVALS_A = {str(day): [{'start_hour': 15, 'start_minute': 0, 'end_hour': 20, 'end_minute': 0}] for day in range(1, 8)}
+INTERVALS_B = {str(day): [{'start_hour': 9, 'start_minute': 0, 'end_hour': 12, 'end_minute': 0},
+                          {'start_hour': 14, 'start_minute': 0, 'end_hour': 21, 'end_minute': 0}] for day in range(1, 8)}
+
+
+class QueryCounter:
+    """Counts SQL statements run on an engine"""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def route_cases(user_ids):
+    """(name, make_request(client, n)) for every benchmarked route"""
+    def user(n):
+        return user_ids[n % len(user_ids)]
+
+    def update_intervals(client, n):
+        # Each user sees A and B in turn: a real change on every request
+        payload = INTERVALS_A if (n // len(user_ids)) % 2 else INTERVALS_B
+        return client.post(f'/api/user/{user(n)}/intervals/update', json={'intervals': payload})
+
+    return [
+        ('dashboard', lambda client, n: client.get('/dashboard')),
+        ('user_stats', lambda client, n: client.get(f'/stats/{user(n)}')),
+        ('get_user_usage', lambda client, n: client.get(f'/api/user/{user(n)}/usage?days=30')),
+        ('get_usage', lambda client, n: client.get(
+            f"/api/usage?ids={','.join(str(user(n + i)) for i in range(5))}&from=all&bucket=month")),
+        ('get_user_intervals', lambda client, n: client.get(f'/api/user/{user(n)}/intervals')),
+        ('update_user_intervals', update_intervals),
+    ]
+
+
+def run_case(client, counter, make_request, repeat, warmup):
+    for n in range(warmup):
+        make_request(client, n)
+    times = []
+    queries = counter.count
+    for n in range(warmup, warmup + repeat):
+        started = time.perf_counter()
+        response = make_request(client, n)
+        times.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.status_code} from {response.request.path}: {response.get_data(as_text=True)[:200]}')
+    times.sort()
+    return {
+        'median_ms': round(statistics.median(times) * 1000, 2),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 2),
+        'queries': round((counter.count - queries) / repeat, 1),
+    }
+
+
+def compare(results, baseline):
+    """Print the results next to the baseline. Returns: names of routes running more SQL statements"""
+    regressed = []
+    print(f"{'route':24} {'median ms':>10} {'p95 ms':>10} {'queries':>8} {'baseline':>10} {'ratio':>6}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        line = f"{name:24} {result['median_ms']:10.2f} {result['p95_ms']:10.2f} {result['queries']:8.1f}"
+        if base:
+            ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else 0
+            line += f" {base['median_ms']:10.2f} {ratio:6.2f}"
+            # Averages shift slightly with --repeat; a new statement per request does not hide in 0.5
+            if result['queries'] > base['queries'] + 0.5:
+                regressed.append(name)
+                line += '  REGRESSION'
+        print(line)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stats and dashboard routes at scale')
+    parser.add_argument('--db', help='Existing database URI made with generate_data.py (default: generate a scratch one)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--repeat', type=int, default=30, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Record these results as the new baseline')
+    args = parser.parse_args()
+
+    scratch = None
+    uri = args.db
+    if uri is None:
+        from benchmarks.generate_data import create_app, generate
+        from src.database import db
+        scratch = tempfile.TemporaryDirectory()
+        uri = f"sqlite:///{os.path.join(scratch.name, 'bench.db')}"
+        with create_app(uri).app_context():
+            db.create_all()
+            started = time.perf_counter()
+            generate(args.users, args.years, progress=lambda message: None)
+        print(f'Generated {args.users} users x {args.years:g} years in {time.perf_counter() - started:.1f}s')
+
+    # The app reads these at import time
+    os.environ['DATABASE_URI'] = uri
+    os.environ['DISABLE_BACKGROUND_TASKS'] = '1'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app as webapp
+
+    from src.database import db, ManagedUser
+    with webapp.app.app_context():
+        user_ids = [user_id for (user_id,) in db.session.query(ManagedUser.id).order_by(ManagedUser.id).limit(SAMPLE_USERS)]
+        user_count = ManagedUser.query.count()
+        counter = QueryCounter(db.engine)
+    if not user_ids:
+        sys.exit(f'No users in {uri}; fill it with benchmarks/generate_data.py')
+
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+
+    results = {}
+    for name, make_request in route_cases(user_ids):
+        results[name] = run_case(client, counter, make_request, args.repeat, args.warmup)
+
+    scale = {'users': user_count, 'years': args.years if args.db is None else None}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+        if recorded.get('scale') == scale:
+            baseline = recorded['routes']
+        else:
+            print(f"Baseline was recorded at {recorded.get('scale')}, not {scale}; not comparing")
+
+    regressed = compare(results, baseline)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'scale': scale, 'routes': results}, f, indent=2)
+            f.write('\n')
+        print(f'Saved baseline to {args.baseline}')
+    if scratch:
+        scratch.cleanup()
+    if regressed and not args.save_baseline:
+        sys.exit(f"More SQL statements than the baseline: {', '.join(regressed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark and round-trip check for the userinfo parser.
+
+Uses the recorded `timekpra --userinfo` outputs in userinfo_samples/ plus
+randomly generated ones. Before timing, every output is checked to parse
+into a typed snapshot whose canonical JSON loads back to an equal
+snapshot, independent of line order and spacing.
+
+Usage: python benchmarks/bench_userinfo.py [--random N] [--seed S]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.userinfo import SCHEMA, parse_userinfo, load_userinfo, format_hours  # noqa: E402
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'userinfo_samples')
+
+
+def legacy_parse(output):
+    """The per-line regex parser used before typed snapshots, for comparison"""
+    config_dict = {}
+    for line in output.split('\n'):
+        match = re.search(r'([A-Z_]+):\s*(.*)', line)
+        if match:
+            value = match.group(2).strip()
+            if value.isdigit():
+                value = int(value)
+            elif ';' in value:
+                value = value.split(';')
+                if all(item.isdigit() for item in value):
+                    value = [int(item) for item in value]
+            elif value.lower() == 'true':
+                value = True
+            elif value.lower() == 'false':
+                value = False
+            config_dict[match.group(1)] = value
+    return config_dict
+
+
+def load_samples():
+    samples = {}
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        with open(os.path.join(SAMPLES_DIR, name)) as f:
+            samples[name] = f.read()
+    return samples
+
+
+def random_output(rng):
+    """A userinfo output with random values for a random subset of the schema"""
+    lines = ['# user "random" configuration:']
+    for key, converter in SCHEMA.items():
+        if rng.random() < 0.2:
+            continue
+        name = converter.__name__
+        if name == '_to_int':
+            value = str(rng.randint(-10000, 700000))
+        elif name == '_to_int_list':
+            value = ';'.join(str(rng.randint(0, 86400)) for _ in range(rng.randint(0, 7)))
+        elif name == '_to_bool':
+            value = rng.choice(['True', 'False'])
+        else:
+            value = rng.choice(['', 'terminate', '[steam[Steam]];[x[X]]'])
+        lines.append(f'{key}:{" " * rng.randint(0, 2)}{value}')
+    for day in range(1, 8):
+        if rng.random() < 0.8:
+            hours = {}
+            for hour in rng.sample(range(24), rng.randint(0, 24)):
+                start = rng.choice([0, 0, rng.randint(0, 59)])
+                hours[hour] = (start, rng.choice([59, rng.randint(start, 59)]))
+            lines.append(f'ALLOWED_HOURS_{day}: {format_hours(hours)}')
+    if rng.random() < 0.3:
+        lines.append('SOME_FUTURE_KEY: 1;two')
+    return lines
+
+
+def check_round_trip(output):
+    info = parse_userinfo(output)
+    text = info.dumps()
+    loaded = load_userinfo(text)
+    assert loaded == info, f'round trip changed the snapshot:\n{text}\n{loaded.dumps()}'
+    assert loaded.dumps() == text, 'canonical JSON is not stable'
+    for key, converter in SCHEMA.items():
+        value = info.get(key)
+        if value is None:
+            continue
+        expected = {'_to_int': int, '_to_int_list': list, '_to_bool': bool, '_to_str': str}[converter.__name__]
+        assert type(value) is expected, f'{key} is {type(value).__name__}, expected {expected.__name__}'
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the timekpra --userinfo parser')
+    parser.add_argument('--random', type=int, default=500, help='Random outputs to check (default 500)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--number', type=int, default=2000, help='Iterations per timing')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    samples = load_samples()
+    for name, output in samples.items():
+        check_round_trip(output)
+    for _ in range(args.random):
+        lines = random_output(rng)
+        info = check_round_trip('\n'.join(lines))
+        rng.shuffle(lines)
+        assert parse_userinfo('\n'.join(lines)).dumps() == info.dumps(), 'line order changed the snapshot'
+    print(f'Round trip OK: {len(samples)} recorded, {args.random} random outputs')
+
+    print(f'\n{"sample":<22}{"legacy parse":>14}{"typed parse":>14}{"json.loads":>14}{"load cached":>14}   (us/op)')
+    for name, output in samples.items():
+        legacy_text = json.dumps(legacy_parse(output))
+        typed_text = parse_userinfo(output).dumps()
+        timings = [
+            timeit.timeit(lambda: legacy_parse(output), number=args.number),
+            timeit.timeit(lambda: parse_userinfo(output), number=args.number),
+            timeit.timeit(lambda: json.loads(legacy_text), number=args.number),
+            timeit.timeit(lambda: load_userinfo(typed_text), number=args.number),
+        ]
+        print(f'{name:<22}' + ''.join(f'{t / args.number * 1e6:>14.1f}' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Hermetic fake timekpr computers for benchmarks.
+
+FakeFleet starts one paramiko SSH server per virtual computer on
+127.0.0.1, each on its own port, so managed users can point at
+"127.0.0.1:<port>". Any public key is accepted. The servers emulate the
+timekpra commands the web UI sends (--userinfo, --settimeleft,
+--setalloweddays, --settimelimits, --setallowedhours, with or without
+sudo) against in-memory per-user state. Active users accumulate usage in
+real time, so every poll sees fresh numbers.
+
+Network conditions are configurable per fleet:
+- latency: seconds added to the handshake and to every command
+- loss: probability that a command drops the connection
+- offline: number of computers whose port refuses connections
+
+Run standalone to get servers for manual testing against the UI:
+    python benchmarks/fake_timekpr.py --hosts 3 --users 2
+"""
+import argparse
+import random
+import shlex
+import socket
+import threading
+import time
+from datetime import date
+
+import paramiko
+
+WHOLE_DAY = ';'.join(str(hour) for hour in range(24))
+
+
+class FakeUser:
+    """timekpr state of one user on a fake computer"""
+    def __init__(self, username, rng):
+        self.username = username
+        self.allowed_days = [1, 2, 3, 4, 5, 6, 7]
+        self.limits = [rng.choice([3600, 5400, 7200, 10800]) for _ in range(7)]
+        self.allowed_hours = {day: WHOLE_DAY for day in range(1, 8)}
+        self.adjustment = 0  # Net --settimeleft changes today
+        self.base_spent = rng.randint(0, 3600)
+        self.active = rng.random() < 0.5  # Active users accumulate usage while the fleet runs
+        self.started = time.time()
+
+    def spent_today(self):
+        elapsed = int(time.time() - self.started) if self.active else 0
+        return self.base_spent + elapsed
+
+    def limit_today(self):
+        weekday = date.today().isoweekday()
+        return self.limits[self.allowed_days.index(weekday)] if weekday in self.allowed_days else 0
+
+    def userinfo(self):
+        spent = self.spent_today()
+        limit = self.limit_today()
+        left = max(0, limit + self.adjustment - spent)
+        lines = [f'# user "{self.username}" configuration:']
+        lines += [f'ALLOWED_HOURS_{day}: {self.allowed_hours[day]}' for day in range(1, 8)]
+        lines += [
+            f"ALLOWED_WEEKDAYS: {';'.join(map(str, self.allowed_days))}",
+            f"LIMITS_PER_WEEKDAYS: {';'.join(map(str, self.limits))}",
+            f'LIMIT_PER_WEEK: {sum(self.limits)}',
+            'LIMIT_PER_MONTH: 2678400',
+            'TRACK_INACTIVE: False',
+            'HIDE_TRAY_ICON: False',
+            'LOCKOUT_TYPE: terminate',
+            'WAKEUP_HOUR_INTERVAL: 0;23',
+            f'TIME_SPENT_BALANCE: {spent - limit}',
+            f'TIME_SPENT_DAY: {spent}',
+            f'TIME_SPENT_WEEK: {spent * 3}',
+            f'TIME_SPENT_MONTH: {spent * 10}',
+            f'TIME_LEFT_DAY: {left}',
+            'PLAYTIME_ENABLED: False',
+            'PLAYTIME_LIMIT_OVERRIDE_ENABLED: False',
+            'PLAYTIME_UNACCOUNTED_INTERMEDIATE_PROCESSES_ENABLED: False',
+            'PLAYTIME_ALLOWED_WEEKDAYS: 1;2;3;4;5;6;7',
+            'PLAYTIME_LIMITS_PER_WEEKDAYS: 0;0;0;0;0;0;0',
+            'PLAYTIME_ACTIVITIES: ',
+            f'ACTUAL_TIME_SPENT_DAY: {spent}',
+            f'ACTUAL_TIME_LEFT_DAY: {left}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class FakeHost:
+    """One virtual computer: its users, command handling and counters"""
+    def __init__(self, fleet, index, usernames):
+        self.fleet = fleet
+        self.index = index
+        self.users = {name: FakeUser(name, fleet.rng) for name in usernames}
+        self.port = None
+        self.connections = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._socket = None
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.port}'
+
+    def run_command(self, command):
+        """Execute a timekpra command line. Returns (exit_status, stdout, stderr)"""
+        with self._lock:
+            self.commands += 1
+            try:
+                args = shlex.split(command)
+            except ValueError as e:
+                return 2, '', f'{e}\n'
+            if args and args[0] == 'sudo':
+                args = args[1:]
+            if len(args) < 3 or args[0] != 'timekpra':
+                return 127, '', f'unsupported command: {command}\n'
+            option, username, rest = args[1], args[2], args[3:]
+            user = self.users.get(username)
+            if user is None:
+                return 1, f'User "{username}" configuration is not found\n', ''
+            try:
+                return self._apply(user, option, rest)
+            except (ValueError, IndexError) as e:
+                return 1, '', f'invalid arguments for {option}: {e}\n'
+
+    def _apply(self, user, option, rest):
+        if option == '--userinfo':
+            return 0, user.userinfo(), ''
+        if option == '--settimeleft':
+            operation, seconds = rest[0], int(rest[1])
+            if operation == '=':
+                user.adjustment = seconds + user.spent_today() - user.limit_today()
+            else:
+                user.adjustment += seconds if operation == '+' else -seconds
+            return 0, 'time left set\n', ''
+        if option == '--setalloweddays':
+            user.allowed_days = [int(day) for day in rest[0].split(';')]
+            return 0, 'allowed days set\n', ''
+        if option == '--settimelimits':
+            limits = [int(limit) for limit in rest[0].split(';')]
+            if len(limits) != len(user.allowed_days):
+                return 1, '', 'limit count does not match allowed days\n'
+            user.limits = limits
+            return 0, 'time limits set\n', ''
+        if option == '--setallowedhours':
+            day = int(rest[0])
+            if not 1 <= day <= 7:
+                raise ValueError(f'day {day}')
+            user.allowed_hours[day] = rest[1]
+            return 0, 'allowed hours set\n', ''
+        return 2, '', f'unknown option {option}\n'
+
+    def start(self, host_key):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', 0))
+        self.port = self._socket.getsockname()[1]
+        self._socket.listen(16)
+        threading.Thread(target=self._accept_loop, args=(host_key,), daemon=True).start()
+
+    def start_offline(self):
+        """Reserve a port nobody listens on, so connections are refused"""
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.bind(('127.0.0.1', 0))
+        self.port = probe.getsockname()[1]
+        probe.close()
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _accept_loop(self, host_key):
+        while self._socket is not None:
+            try:
+                sock, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock, host_key), daemon=True).start()
+
+    def _serve(self, sock, host_key):
+        if self.fleet.latency:
+            time.sleep(self.fleet.latency)  # Handshake round trips
+        # Without this, Nagle and delayed ACKs add ~40 ms per command on loopback
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(host_key)
+        try:
+            transport.start_server(server=_ServerInterface(self, transport))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, host, transport):
+        self.host = host
+        self.transport = transport
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        with self.host._lock:
+            self.host.connections += 1
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._exec, args=(channel, command.decode('utf-8')), daemon=True).start()
+        return True
+
+    def _exec(self, channel, command):
+        fleet = self.host.fleet
+        if fleet.latency:
+            time.sleep(fleet.latency)
+        if fleet.loss and fleet.rng.random() < fleet.loss:
+            self.transport.close()  # Lost: the client sees the connection drop
+            return
+        exit_status, output, error = self.host.run_command(command)
+        try:
+            channel.sendall(output.encode('utf-8'))
+            channel.sendall_stderr(error.encode('utf-8'))
+            channel.send_exit_status(exit_status)
+            # EOF instead of close: closing could overtake the reply to the exec request,
+            # which the client reports as a closed channel. The client closes it.
+            channel.shutdown_write()
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+
+
+class FakeFleet:
+    """
+    N fake computers with users_per_host users each (user0, user1, ...).
+    Use as a context manager or call start()/stop().
+    """
+    def __init__(self, hosts=10, users_per_host=3, latency=0.0, loss=0.0, offline=0, seed=0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.loss = loss
+        self.offline = offline
+        self.hosts = [
+            FakeHost(self, index, [f'user{n}' for n in range(users_per_host)])
+            for index in range(hosts)
+        ]
+        self._host_key = None
+
+    def start(self):
+        self._host_key = paramiko.RSAKey.generate(2048)
+        for host in self.hosts:
+            if host.index < self.offline:
+                host.start_offline()
+            else:
+                host.start(self._host_key)
+        return self
+
+    def stop(self):
+        for host in self.hosts:
+            host.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def counters(self):
+        """(connections accepted, commands run) over all computers"""
+        return (
+            sum(host.connections for host in self.hosts),
+            sum(host.commands for host in self.hosts),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run fake timekpr computers on localhost')
+    parser.add_argument('--hosts', type=int, default=3)
+    parser.add_argument('--users', type=int, default=2, help='Users per computer')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per round trip')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability a command drops the connection')
+    parser.add_argument('--offline', type=int, default=0, help='Computers refusing connections')
+    args = parser.parse_args()
+
+    with FakeFleet(args.hosts, args.users, args.latency, args.loss, args.offline) as fleet:
+        for host in fleet.hosts:
+            state = 'offline' if host.index < args.offline else 'online'
+            print(f"{host.address}  {state}  users: {', '.join(host.users)}")
+        print('Add these as computers in the UI; Ctrl+C to stop.')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
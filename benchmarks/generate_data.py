@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Fill a fresh database with synthetic users for performance work.
+
+Creates users spread over computers, each with a weekly schedule, allowed
+hours (school days, weekends), a stored timekpr snapshot and daily usage
+going back --years years: weekday and weekend sessions of varying length,
+some days without any use and quieter holiday weeks. Rows go through the
+app's models, so the result opens in the web UI like a production
+database. Old usage is compacted into the yearly archive as the task
+manager would do (--no-archive keeps every daily row).
+
+Usage:
+    python benchmarks/generate_data.py --users 500 --years 5
+    python benchmarks/generate_data.py --db sqlite:////tmp/bench.db --users 50 --reset
+
+The default database is the app's own instance/timekpr.db; point the app
+at another one with DATABASE_URI.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask  # noqa: E402
+
+DEFAULT_DB = 'sqlite:///timekpr.db'
+INSERT_CHUNK = 20000  # Usage rows per INSERT batch
+USERNAMES = ('alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi', 'ivan', 'judy')
+
+# (start_hour, start_minute, end_hour, end_minute) per day type
+SCHOOL_DAY_INTERVALS = [[(15, 0, 20, 30)], [(7, 0, 7, 45), (15, 30, 21, 0)], [(16, 0, 19, 0)]]
+WEEKEND_INTERVALS = [[(9, 0, 12, 0), (14, 0, 21, 0)], [(8, 0, 22, 0)], [(10, 0, 20, 0)]]
+
+
+def create_app(uri):
+    """Minimal app bound to the database being generated"""
+    from src.database import db
+    app = Flask(__name__, instance_path=os.path.join(ROOT, 'instance'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _daily_usage(rng, day, weekday_hours, weekend_hours):
+    """Seconds used on one day: 0 on idle days, shorter in holiday weeks"""
+    if rng.random() < 0.08:
+        return 0
+    weekend = day.isoweekday() >= 6
+    hours = weekend_hours if weekend else weekday_hours
+    if day.month in (7, 8) or (day.month == 12 and day.day >= 22):
+        hours *= 0.7  # Outdoors or away
+    seconds = rng.gauss(hours * 3600 * 0.8, hours * 3600 * 0.25)
+    return int(min(max(seconds, 60), hours * 3600))
+
+
+def _snapshot(weekday_hours, used_today):
+    """Stored timekpr state as the poller would have written it today"""
+    from src.userinfo import UserInfo
+    limit = int(weekday_hours * 3600)
+    return UserInfo.from_dict({
+        'ALLOWED_WEEKDAYS': '1;2;3;4;5;6;7',
+        'LIMITS_PER_WEEKDAYS': ';'.join([str(limit)] * 5 + [str(limit * 2)] * 2),
+        'TIME_SPENT_DAY': str(used_today),
+        'TIME_LEFT_DAY': str(max(limit - used_today, 0)),
+        'TIME_SPENT_WEEK': str(used_today * 4),
+        'TRACK_INACTIVE': 'False',
+        'HIDE_TRAY_ICON': 'False',
+    }).dumps()
+
+
+def generate(users=500, years=5, users_per_host=3, seed=1, archive=True, progress=print):
+    """
+    Add `users` synthetic users with `years` of daily usage to the current app's database.
+    Returns: number of daily usage rows generated
+    """
+    from src.database import db, ManagedUser, UserTimeUsage, UserWeeklySchedule, UserDailyTimeInterval
+    from src.archiver import archive_usage
+
+    rng = random.Random(seed)
+    today = date.today()
+    first_day = today - timedelta(days=int(years * 365.25))
+    days = [first_day + timedelta(days=n) for n in range((today - first_day).days + 1)]
+    usage_rows = 0
+    pending = []
+
+    def flush():
+        if pending:
+            db.session.execute(db.insert(UserTimeUsage), pending)
+            db.session.commit()
+            pending.clear()
+
+    for index in range(users):
+        weekday_hours = rng.choice((1, 1.5, 2, 2.5, 3))
+        weekend_hours = weekday_hours + rng.choice((0.5, 1, 2))
+        usage = [_daily_usage(rng, day, weekday_hours, weekend_hours) for day in days]
+
+        user = ManagedUser(
+            username=f'{USERNAMES[index % len(USERNAMES)]}{index // len(USERNAMES) or ""}',
+            system_ip=f'10.0.{index // users_per_host // 250}.{index // users_per_host % 250 + 1}',
+            is_valid=True,
+            date_added=datetime.combine(first_day, datetime.min.time()),
+            last_config=_snapshot(weekday_hours, usage[-1]),
+        )
+        schedule = UserWeeklySchedule()
+        schedule.set_weekdays_hours(weekday_hours)
+        schedule.saturday_hours = schedule.sunday_hours = weekend_hours
+        schedule.mark_synced()
+        user.weekly_schedule = schedule
+
+        school_day = rng.choice(SCHOOL_DAY_INTERVALS)
+        weekend = rng.choice(WEEKEND_INTERVALS)
+        for day_of_week in range(1, 8):
+            for sort_order, (sh, sm, eh, em) in enumerate(weekend if day_of_week >= 6 else school_day):
+                user.time_intervals.append(UserDailyTimeInterval(
+                    day_of_week=day_of_week, start_hour=sh, start_minute=sm, end_hour=eh, end_minute=em,
+                    sort_order=sort_order, is_synced=True,
+                ))
+        db.session.add(user)
+        db.session.flush()
+
+        for day, seconds in zip(days, usage):
+            if seconds:
+                pending.append({'user_id': user.id, 'date': day, 'time_spent': seconds})
+        usage_rows += sum(1 for seconds in usage if seconds)
+        if len(pending) >= INSERT_CHUNK:
+            flush()
+        if (index + 1) % 50 == 0:
+            progress(f'  {index + 1}/{users} users, {usage_rows} usage rows')
+    flush()
+    db.session.commit()
+
+    if archive:
+        archived = archive_usage(vacuum=False)
+        progress(f'  archived {archived} daily rows older than the archive horizon')
+    return usage_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a fresh database with synthetic users and usage')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'SQLAlchemy database URI (default: {DEFAULT_DB})')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--users-per-host', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-archive', action='store_true', help='Keep every daily usage row')
+    parser.add_argument('--reset', action='store_true', help='Drop all existing data first')
+    args = parser.parse_args()
+
+    from src.database import db, ManagedUser
+    from src.migrator import run_migrations
+
+    app = create_app(args.db)
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        run_migrations(app)
+        if ManagedUser.query.count():
+            sys.exit(f'{args.db} already has users; use --reset to replace them')
+
+        started = time.perf_counter()
+        rows = generate(args.users, args.years, args.users_per_host, args.seed, not args.no_archive)
+    print(f'{args.users} users, {rows} daily usage rows over {args.years:g} years '
+          f'in {time.perf_counter() - started:.1f}s -> {args.db}')
+
+
+if __name__ == '__main__':
+    main()
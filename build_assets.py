@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Fingerprint and precompress the static files for production.
+
+Writes static/dist/ (hashed copies, .gz and, with the brotli package
+installed, .br variants, manifest.json). The app serves them with
+long-lived cache headers from its next start; run this again after
+changing anything under static/.
+
+Usage: python build_assets.py
+"""
+import os
+
+from src.assets import build, brotli
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+if __name__ == '__main__':
+    manifest = build(STATIC_FOLDER)
+    for path, entry in sorted(manifest.items()):
+        print(f"{path} -> {entry['file']} {' '.join(entry['encodings'])}")
+    print(f"Built {len(manifest)} files into static/dist"
+          f"{'' if brotli else ' (gzip only: pip install brotli for .br files)'}")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Create (or replace) the ingestion token of a client agent.
+
+The token is printed once; only its hash is stored. Configure it on the
+client together with the server URL, see agent/timekpr_agent.py.
+
+Usage: python create_agent_token.py <system_ip> [--keep-polling]
+"""
+import sys
+
+from flask import Flask
+from src.database import db, Agent
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///timekpr.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) != 1:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    
+    with app.app_context():
+        db.create_all()
+        agent, token = Agent.create(args[0])
+        agent.disable_polling = '--keep-polling' not in sys.argv
+        db.session.commit()
+        print(f"Agent token for {agent.system_ip}: {token}")
+        print("Store it on the client, e.g.: TIMEKPR_AGENT_TOKEN=<token> python3 timekpr_agent.py ...")
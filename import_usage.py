@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Bulk load daily usage exported from /export/usage (CSV or NDJSON).
+
+Rows are upserted in chunks, so a day already stored is overwritten and a
+file can be loaded again safely. Rows of users that do not exist are
+skipped unless --create-users is given.
+
+Usage: python import_usage.py <file.csv|file.ndjson|-> [--format csv|ndjson] [--create-users]
+"""
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+from src.database import db
+from src.history_io import import_usage, read_rows, detect_format, FORMATS
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///timekpr.db')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load exported daily usage')
+    parser.add_argument('file', help="CSV or NDJSON export, '-' for standard input")
+    parser.add_argument('--format', choices=list(FORMATS), help='Default: from the file extension, else csv')
+    parser.add_argument('--create-users', action='store_true', help='Add users that do not exist yet')
+    args = parser.parse_args()
+    
+    fmt = args.format or detect_format(args.file)
+    source = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8-sig')
+    with app.app_context(), source:
+        db.create_all()
+        started = time.perf_counter()
+        result = import_usage(read_rows(source, fmt), create_users=args.create_users)
+    
+    print(f"Imported {result['imported']} of {result['rows']} rows for {result['users']} users "
+          f"in {time.perf_counter() - started:.1f}s ({result['created_users']} users added, "
+          f"{result['archived']} rows archived)")
+    for error in result['errors']:
+        print(f"  {error}")
+    if result['skipped'] > len(result['errors']):
+        print(f"  ... {result['skipped'] - len(result['errors'])} more rows skipped")
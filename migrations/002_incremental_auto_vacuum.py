@@ -0,0 +1,12 @@
+MIGRATION_ID = 2
+DESCRIPTION = "Switch database to incremental auto_vacuum for usage archival"
+
+
+def up(conn):
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        return  # already INCREMENTAL
+
+    # auto_vacuum only takes effect on an existing database after a full VACUUM
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
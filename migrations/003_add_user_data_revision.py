@@ -0,0 +1,10 @@
+MIGRATION_ID = 3
+DESCRIPTION = "Add data_revision column to managed_user"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(managed_user)").fetchall()]
+    if not cols or 'data_revision' in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    conn.execute("ALTER TABLE managed_user ADD COLUMN data_revision INTEGER NOT NULL DEFAULT 0")
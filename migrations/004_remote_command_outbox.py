@@ -0,0 +1,41 @@
+MIGRATION_ID = 4
+DESCRIPTION = "Move pending time adjustments and unsynced pushes into the remote_command outbox"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(managed_user)").fetchall()]
+    if not cols or 'pending_time_adjustment' not in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    # db.create_all has already built remote_command
+    conn.executescript("""
+        BEGIN;
+
+        INSERT INTO remote_command (user_id, kind, seconds, attempts, created_at, updated_at)
+            SELECT id, 'time_adjustment',
+                   CASE WHEN pending_time_operation = '-' THEN -pending_time_adjustment
+                        ELSE pending_time_adjustment END,
+                   0, datetime('now'), datetime('now')
+            FROM managed_user
+            WHERE pending_time_adjustment IS NOT NULL AND pending_time_operation IS NOT NULL
+              AND pending_time_adjustment != 0;
+
+        INSERT INTO remote_command (user_id, kind, attempts, created_at, updated_at)
+            SELECT s.user_id, 'weekly_limits', 0, datetime('now'), datetime('now')
+            FROM user_weekly_schedule s
+            WHERE NOT s.is_synced
+              AND NOT EXISTS (SELECT 1 FROM remote_command c
+                              WHERE c.user_id = s.user_id AND c.kind = 'weekly_limits');
+
+        INSERT INTO remote_command (user_id, kind, attempts, created_at, updated_at)
+            SELECT DISTINCT i.user_id, 'allowed_hours', 0, datetime('now'), datetime('now')
+            FROM user_daily_time_interval i
+            WHERE NOT i.is_synced
+              AND NOT EXISTS (SELECT 1 FROM remote_command c
+                              WHERE c.user_id = i.user_id AND c.kind = 'allowed_hours');
+
+        ALTER TABLE managed_user DROP COLUMN pending_time_adjustment;
+        ALTER TABLE managed_user DROP COLUMN pending_time_operation;
+
+        COMMIT;
+    """)
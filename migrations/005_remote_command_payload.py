@@ -0,0 +1,10 @@
+MIGRATION_ID = 5
+DESCRIPTION = "Add payload column to remote_command"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(remote_command)").fetchall()]
+    if not cols or 'payload' in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    conn.execute("ALTER TABLE remote_command ADD COLUMN payload TEXT")
@@ -0,0 +1,39 @@
+MIGRATION_ID = 6
+DESCRIPTION = "Add desired/applied config revisions to managed_user and remote_command"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(managed_user)").fetchall()]
+    if cols and 'desired_revision' not in cols:
+        conn.execute("ALTER TABLE managed_user ADD COLUMN desired_revision INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE managed_user ADD COLUMN applied_revision INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE managed_user ADD COLUMN last_applied DATETIME")
+
+        # Users with unsynced rows or a queued push start one revision behind
+        conn.execute("""
+            UPDATE managed_user SET desired_revision = 1
+            WHERE id IN (SELECT user_id FROM user_weekly_schedule WHERE NOT is_synced)
+               OR id IN (SELECT user_id FROM user_daily_time_interval WHERE NOT is_synced)
+               OR id IN (SELECT user_id FROM remote_command
+                         WHERE kind IN ('weekly_limits', 'allowed_hours'))
+        """)
+        conn.execute("""
+            UPDATE managed_user SET last_applied = (
+                SELECT MAX(last_synced) FROM user_weekly_schedule WHERE user_id = managed_user.id
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS ix_managed_user_needs_sync
+            ON managed_user (id) WHERE desired_revision > applied_revision
+        """)
+
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(remote_command)").fetchall()]
+    if cols and 'revision' not in cols:
+        conn.execute("ALTER TABLE remote_command ADD COLUMN revision INTEGER")
+    if cols:
+        conn.execute("""
+            UPDATE remote_command SET revision = (
+                SELECT desired_revision FROM managed_user WHERE id = remote_command.user_id
+            )
+            WHERE revision IS NULL AND kind IN ('weekly_limits', 'allowed_hours')
+        """)
@@ -0,0 +1,14 @@
+MIGRATION_ID = 7
+DESCRIPTION = "Add schedule policy subscription columns to managed_user"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(managed_user)").fetchall()]
+    if not cols or 'policy_id' in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    # schedule_policy and schedule_policy_interval are new tables built by db.create_all
+    conn.execute("ALTER TABLE managed_user ADD COLUMN policy_id INTEGER REFERENCES schedule_policy(id)")
+    conn.execute("ALTER TABLE managed_user ADD COLUMN override_limits BOOLEAN NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE managed_user ADD COLUMN override_intervals BOOLEAN NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_managed_user_policy_id ON managed_user (policy_id)")
@@ -0,0 +1,12 @@
+MIGRATION_ID = 8
+DESCRIPTION = "Add last_seen column to managed_user"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(managed_user)").fetchall()]
+    if not cols or 'last_seen' in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    conn.execute("ALTER TABLE managed_user ADD COLUMN last_seen DATETIME")
+    # Users with a stored snapshot were last seen when they were last checked
+    conn.execute("UPDATE managed_user SET last_seen = last_checked WHERE last_config IS NOT NULL")
@@ -0,0 +1,10 @@
+MIGRATION_ID = 9
+DESCRIPTION = "Add last_batch_hash column to agent"
+
+
+def up(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(agent)").fetchall()]
+    if not cols or 'last_batch_hash' in cols:
+        return  # table absent (db.create_all will build it) or already migrated
+
+    conn.execute("ALTER TABLE agent ADD COLUMN last_batch_hash VARCHAR(64)")
@@ -0,0 +1,90 @@
+"""
+Cold-history archival for UserTimeUsage.
+
+Daily usage rows older than the archive horizon are folded into one
+UserTimeUsageArchive row per user per year (a packed array of per-day
+seconds) and removed from the hot table. The stats queries on ManagedUser
+merge both sources, so archival is invisible to the UI.
+
+The horizon is read from the USAGE_ARCHIVE_DAYS environment variable
+(default 730 days, 0 disables archival). After moving rows the database
+runs an incremental VACUUM so freed pages are returned to the filesystem;
+migration 002 switches the database to auto_vacuum=INCREMENTAL for this.
+"""
+import logging
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from src.database import db, UserTimeUsage, UserTimeUsageArchive
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = 730
+
+
+def get_horizon_days():
+    """Archive horizon in days, 0 when archival is disabled"""
+    try:
+        return max(0, int(os.environ.get('USAGE_ARCHIVE_DAYS', DEFAULT_HORIZON_DAYS)))
+    except ValueError:
+        logger.warning("Invalid USAGE_ARCHIVE_DAYS, using %d", DEFAULT_HORIZON_DAYS)
+        return DEFAULT_HORIZON_DAYS
+
+
+def archive_usage(horizon_days=None, vacuum=True):
+    """
+    Move daily usage rows older than the horizon into the yearly archive.
+    Must be called inside an app context.
+
+    Returns: number of daily rows archived
+    """
+    if horizon_days is None:
+        horizon_days = get_horizon_days()
+    if horizon_days <= 0:
+        return 0
+
+    cutoff = date.today() - timedelta(days=horizon_days)
+
+    rows = db.session.query(
+        UserTimeUsage.user_id, UserTimeUsage.date, UserTimeUsage.time_spent
+    ).filter(UserTimeUsage.date < cutoff).order_by(
+        UserTimeUsage.user_id, UserTimeUsage.date
+    ).all()
+    if not rows:
+        return 0
+
+    # Group by (user, year) so each archive row is loaded and packed once
+    pending = {}
+    for user_id, day, seconds in rows:
+        key = (user_id, day.year)
+        if key not in pending:
+            archive = UserTimeUsageArchive.query.filter_by(user_id=user_id, year=day.year).first()
+            if archive is None:
+                archive = UserTimeUsageArchive(user_id=user_id, year=day.year)
+                archive.set_values([0] * archive.days_in_year(day.year))
+                db.session.add(archive)
+            pending[key] = (archive, archive.get_values())
+        values = pending[key][1]
+        values[day.timetuple().tm_yday - 1] = seconds or 0
+
+    for archive, values in pending.values():
+        archive.set_values(values)
+
+    UserTimeUsage.query.filter(UserTimeUsage.date < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    logger.info("Archived %d usage rows older than %s into %d yearly records",
+                len(rows), cutoff, len(pending))
+
+    if vacuum:
+        incremental_vacuum()
+
+    return len(rows)
+
+
+def incremental_vacuum():
+    """Release free pages back to the filesystem (no-op unless auto_vacuum=INCREMENTAL)"""
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA incremental_vacuum'))
+        conn.commit()
@@ -0,0 +1,149 @@
+"""
+Fingerprinted, precompressed static assets.
+
+build_assets.py copies every file under static/ into static/dist/ with a
+content hash in its name (css/style.3f2a9c1b0d4e.css), writes .gz and,
+when the optional brotli package is installed, .br siblings of text files,
+and records the mapping in static/dist/manifest.json.
+
+Templates call asset_url(): built files get a hashed /assets/ URL served
+with Cache-Control: immutable and the best precompressed encoding the
+browser accepts. Files changed since the last build, or never built, keep
+their plain /static/ URL, so the app also runs without the build step.
+Third-party scripts are committed under static/vendor/, so pages need no
+internet access.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are built without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # Preferred first
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH]
+
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and
+                         os.path.join(root, d) != os.path.join(static_folder, DIST_DIR))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+
+def build(static_folder):
+    """
+    Rebuild static/dist: hashed copies, precompressed variants and the manifest.
+    Returns: the manifest ({path: {'file', 'hash', 'encodings'}})
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for path, source in _source_files(static_folder):
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        stem, extension = os.path.splitext(path)
+        hashed = f'{stem}.{digest}{extension}'
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+
+        encodings = []
+        if extension in COMPRESSIBLE_EXTENSIONS:
+            variants = [('gzip', '.gz', gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ('br', '.br', brotli.compress(data, quality=11)))
+            for encoding, suffix, compressed in variants:
+                # Not worth a second request path when it barely shrinks
+                if len(compressed) < len(data) * 0.9:
+                    with open(target + suffix, 'wb') as f:
+                        f.write(compressed)
+                    encodings.append(encoding)
+        manifest[path] = {'file': hashed, 'hash': digest, 'encodings': encodings}
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self._urls = {}  # source path -> hashed file
+        self._files = {}  # hashed file -> encodings available
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.dist = os.path.join(app.static_folder, DIST_DIR)
+        self._load_manifest()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.dist, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Ignoring unreadable %s, run build_assets.py", MANIFEST)
+            return
+        stale = []
+        for path, entry in manifest.items():
+            source = os.path.join(self.static_folder, path)
+            if os.path.exists(source) and file_hash(source) == entry['hash']:
+                self._urls[path] = entry['file']
+                self._files[entry['file']] = entry['encodings']
+            else:
+                stale.append(path)
+        if stale:
+            logger.warning("Static files changed since the last build_assets.py, served unhashed: %s",
+                           ', '.join(stale))
+
+    def url(self, path):
+        """URL of a static file: fingerprinted when built, else /static/"""
+        hashed = self._urls.get(path)
+        if hashed:
+            return url_for('assets', filename=hashed)
+        return url_for('static', filename=path)
+
+    def serve(self, filename):
+        """A fingerprinted file, precompressed when the browser accepts it; cached for good"""
+        encodings = self._files.get(filename)
+        if encodings is None:
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                response = send_from_directory(self.dist, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, filename, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
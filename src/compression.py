@@ -0,0 +1,46 @@
+"""
+On-the-fly gzip for HTML and JSON responses.
+
+Pages with large inline scripts and the bigger API payloads shrink several
+times over; responses below COMPRESS_MIN_SIZE are not worth the CPU.
+Streamed responses (event stream, exports, bulk NDJSON) and files are left
+alone: static files are precompressed by build_assets.py instead.
+A strong ETag becomes weak, since the compressed bytes differ from the
+identity ones while meaning the same.
+"""
+import gzip
+
+from flask import request
+
+COMPRESS_MIN_SIZE = 1024  # Bytes
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_TYPES = ('text/html', 'application/json')
+
+
+class ResponseCompressor:
+    def __init__(self, app=None):
+        self.min_size = COMPRESS_MIN_SIZE
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)
+        app.after_request(self._compress)
+
+    def _compress(self, response):
+        if (response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code != 200 or not request.accept_encodings['gzip']:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(gzip.compress(data, COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
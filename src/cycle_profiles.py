@@ -0,0 +1,112 @@
+"""
+On-demand cProfile captures of background poll cycles.
+
+The admin page asks the task manager to profile its next N cycles. The
+task thread runs those cycles under one cProfile.Profile and then writes
+the result to instance/profiles/: a .pstats file (load it with pstats,
+snakeviz or gprof2dot for a flame graph) and a .txt summary sorted by
+cumulative time. Only the newest PROFILE_RETENTION captures are kept.
+
+Only the task thread is profiled; bulk deliveries running in worker
+threads do not show up.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_RETENTION = 10  # Captures kept on disk
+MAX_CYCLES = 20  # Largest capture that can be requested
+SUMMARY_LINES = 60  # Functions listed in the .txt summary
+NAME_RE = re.compile(r'^cycles-\d{8}-\d{6}\.(pstats|txt)$')
+
+
+class CycleProfiler:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._profile = None
+        self._remaining = 0
+        self._cycles = 0
+
+    @property
+    def pending(self):
+        """Cycles still to be profiled for the current request"""
+        return self._remaining
+
+    def request(self, cycles):
+        """Profile the next `cycles` cycles. Returns False while a capture is already running."""
+        with self._lock:
+            if self._remaining:
+                return False
+            self._profile = cProfile.Profile()
+            self._remaining = self._cycles = cycles
+            return True
+
+    @contextmanager
+    def cycle(self):
+        """Wrap one poll cycle; profiles it when a capture was requested"""
+        profile = self._profile if self._remaining else None
+        if profile is None:
+            yield
+            return
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._remaining -= 1
+                done = self._remaining == 0
+            if done:
+                self._profile = None
+                try:
+                    self._save(profile)
+                except OSError as e:
+                    logger.error(f"Could not save cycle profile: {str(e)}")
+
+    def _save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, datetime.now().strftime('cycles-%Y%m%d-%H%M%S'))
+        profile.dump_stats(base + '.pstats')
+
+        summary = io.StringIO()
+        summary.write(f"{self._cycles} poll cycle(s) profiled at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        with open(base + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        logger.info("Saved cycle profile %s", base)
+        self._prune()
+
+    def _prune(self):
+        """Delete all but the newest PROFILE_RETENTION captures"""
+        captures = sorted({name.rsplit('.', 1)[0] for name in os.listdir(self.directory) if NAME_RE.match(name)})
+        for stale in captures[:-PROFILE_RETENTION]:
+            for extension in ('.pstats', '.txt'):
+                path = os.path.join(self.directory, stale + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list_profiles(self):
+        """Saved captures, newest first: [{'name', 'files', 'created'}]"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        captures = {}
+        for name in os.listdir(self.directory):
+            if NAME_RE.match(name):
+                captures.setdefault(name.rsplit('.', 1)[0], []).append(name)
+        return [
+            {
+                'name': capture,
+                'files': sorted(files),
+                'created': datetime.strptime(capture, 'cycles-%Y%m%d-%H%M%S'),
+            }
+            for capture, files in sorted(captures.items(), reverse=True)
+        ]
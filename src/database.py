@@ -1,25 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
+from collections import defaultdict
+import calendar
+import hashlib
 import json
+import secrets
+import struct
 import bcrypt
 
+from src.intervals import compile_day, IntervalError
+from src.userinfo import load_userinfo
+
 db = SQLAlchemy()
 
+ONLINE_WINDOW = timedelta(minutes=5)  # A user with a snapshot this recent counts as online
+LOW_TIME_LEFT = 30 * 60  # Seconds left today below which the dashboard flags a user
+
 
-def coerce_time_spent_day(value):
-    """Normalise TIME_SPENT_DAY (sortie timekpra) en entier pour la colonne time_spent."""
-    if value is None:
-        return 0
-    if isinstance(value, bool):
-        return 0
-    if isinstance(value, int):
-        return value
-    if isinstance(value, (list, tuple)):
-        return coerce_time_spent_day(value[0]) if value else 0
+def _compiled_or_none(bounds_list):
+    """timekpr specs for a day's intervals, or None if stored data cannot be compiled"""
     try:
-        return int(str(value).strip())
-    except (TypeError, ValueError):
-        return 0
+        return compile_day(bounds_list)
+    except IntervalError:
+        return None
 
 
 class Settings(db.Model):
@@ -95,122 +98,206 @@ class ManagedUser(db.Model):
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
     last_checked = db.Column(db.DateTime, nullable=True)
     last_config = db.Column(db.Text, nullable=True) # Store the full config JSON
-    pending_time_adjustment = db.Column(db.Integer, nullable=True) # Pending time adjustment in seconds
-    pending_time_operation = db.Column(db.String(1), nullable=True) # + or -
+    last_seen = db.Column(db.DateTime, nullable=True) # Last userinfo snapshot received (poll or agent push)
+    data_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Bumped whenever user-visible data changes
+    # Schedule/interval config: bumped on every edit, advanced once the computer has it
+    desired_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    applied_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_applied = db.Column(db.DateTime, nullable=True)
+    # Shared schedule policy; the override flags keep the user's own limits / intervals instead
+    policy_id = db.Column(db.Integer, db.ForeignKey('schedule_policy.id'), nullable=True, index=True)
+    override_limits = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    override_intervals = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     # Relationship with usage data and weekly schedules
     usage_data = db.relationship('UserTimeUsage', backref='user', lazy=True, cascade="all, delete-orphan")
+    usage_archive = db.relationship('UserTimeUsageArchive', backref='user', lazy=True, cascade="all, delete-orphan")
+    jobs = db.relationship('Job', backref='user', lazy=True, cascade="all, delete-orphan")
+    outbox = db.relationship('RemoteCommand', backref='user', lazy=True, cascade="all, delete-orphan",
+                             order_by='RemoteCommand.id')
     weekly_schedule = db.relationship('UserWeeklySchedule', backref='user', uselist=False, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Only users with unsynced config are indexed, so finding them stays cheap
+        db.Index('ix_managed_user_needs_sync', 'id',
+                 sqlite_where=db.text('desired_revision > applied_revision')),
+    )
+    
     def __repr__(self):
         return f'<ManagedUser {self.username}@{self.system_ip}>'
     
+    @classmethod
+    def query_dashboard(cls, search=None, host=None, state=None):
+        """
+        Valid users for the dashboard, filtered by a name/host substring, an exact host
+        and a state ('online', 'offline' or 'low' time left), ordered by name
+        """
+        query = cls.query.filter(cls.is_valid == True)
+        if search:
+            pattern = f"%{search.replace('%', '').replace('_', '')}%"
+            query = query.filter(db.or_(cls.username.ilike(pattern), cls.system_ip.ilike(pattern)))
+        if host:
+            query = query.filter(cls.system_ip == host)
+        online_since = datetime.utcnow() - ONLINE_WINDOW
+        if state == 'online':
+            query = query.filter(cls.last_seen >= online_since)
+        elif state == 'offline':
+            query = query.filter(db.or_(cls.last_seen.is_(None), cls.last_seen < online_since))
+        elif state == 'low':
+            time_left = db.cast(db.func.json_extract(cls.last_config, '$.TIME_LEFT_DAY'), db.Integer)
+            query = query.filter(time_left < LOW_TIME_LEFT)
+        return query.order_by(cls.username, cls.system_ip, cls.id)
+    
+    @classmethod
+    def query_needs_sync(cls):
+        """Users whose schedule or intervals have not reached their computer yet"""
+        return cls.query.filter(cls.desired_revision > cls.applied_revision)
+    
+    def needs_sync(self):
+        """True while an edit to the schedule or intervals is not applied remotely"""
+        return (self.desired_revision or 0) > (self.applied_revision or 0)
+    
+    def mark_config_dirty(self):
+        """Record a config change that the poller must push (desired_revision + 1)"""
+        self.desired_revision = (self.desired_revision or 0) + 1
+    
+    def follows_policy(self):
+        """True when both limits and intervals come from the user's policy"""
+        return self.policy_id is not None and not self.override_limits and not self.override_intervals
+    
+    def get_effective_schedule_dict(self):
+        """Weekly limits enforced on the computer: the policy's unless overridden"""
+        if self.policy is not None and not self.override_limits:
+            return self.policy.get_schedule_dict()
+        return self.weekly_schedule.get_schedule_dict() if self.weekly_schedule else None
+    
+    def get_effective_intervals(self):
+        """Allowed-hours intervals enforced on the computer: the policy's unless overridden"""
+        if self.policy is not None and not self.override_intervals:
+            return list(self.policy.intervals)
+        return list(self.time_intervals)
+    
+    def mark_applied(self, revision):
+        """Record that config up to `revision` is on the remote computer"""
+        self.applied_revision = max(self.applied_revision or 0, revision)
+        self.last_applied = datetime.utcnow()
+    
+    def bump_revision(self):
+        """Mark the user's data as changed so cached API responses are revalidated"""
+        self.data_revision = (self.data_revision or 0) + 1
+    
+    def set_time_intervals(self, intervals_by_day):
+        """
+        Replace the user's allowed hours with intervals_by_day ({day: [(sh, sm, eh, em), ...]}).
+        Only days whose intervals actually change are rewritten and marked unsynced.
+        Returns: set of changed days
+        """
+        current = defaultdict(list)
+        for interval in sorted(self.time_intervals, key=lambda i: (i.sort_order or 0, i.id or 0)):
+            current[interval.day_of_week].append(interval)
+        
+        changed = set()
+        for day in range(1, 8):
+            rows = current.get(day, [])
+            wanted = [tuple(bounds) for bounds in intervals_by_day.get(day, [])]
+            if [row.get_bounds() for row in rows] == wanted and all(row.is_enabled for row in rows):
+                continue  # Unchanged: keep its sync state
+            
+            # Rows can change without changing what the computer enforces (e.g. an interval split in two)
+            same_spec = _compiled_or_none([row.get_bounds() for row in rows if row.is_enabled]) == \
+                _compiled_or_none(wanted)
+            day_synced = same_spec and all(row.is_synced for row in rows)
+            if not same_spec:
+                changed.add(day)
+            # Reuse existing rows in order, then add or drop the difference
+            for sort_idx, (sh, sm, eh, em) in enumerate(wanted):
+                if sort_idx < len(rows):
+                    interval = rows[sort_idx]
+                else:
+                    interval = UserDailyTimeInterval(user_id=self.id, day_of_week=day)
+                    self.time_intervals.append(interval)
+                interval.start_hour, interval.start_minute = sh, sm
+                interval.end_hour, interval.end_minute = eh, em
+                interval.is_enabled = True
+                interval.sort_order = sort_idx
+                interval.mark_modified()
+                interval.is_synced = day_synced
+            for interval in rows[len(wanted):]:
+                self.time_intervals.remove(interval)
+        return changed
+    
+    def record_user_info(self, info):
+        """
+        Store a fresh timekpra --userinfo snapshot (UserInfo) and today's usage.
+        Returns: True when the stored data changed
+        """
+        new_config = info.dumps()
+        changed = new_config != self.last_config
+        self.last_checked = self.last_seen = datetime.utcnow()
+        self.last_config = new_config
+        self.is_valid = True
+        
+        # Update or create today's usage data
+        today = date.today()
+        time_spent = info.time_spent_day or 0
+        usage = UserTimeUsage.query.filter_by(user_id=self.id, date=today).first()
+        if usage:
+            changed = changed or usage.time_spent != time_spent
+            usage.time_spent = time_spent
+        else:
+            usage = UserTimeUsage(user_id=self.id, date=today, time_spent=time_spent)
+            db.session.add(usage)
+            changed = True
+        
+        if changed:
+            self.bump_revision()
+        return changed
+    
+    def get_usage_between(self, start_date, end_date):
+        """Get {date: seconds} for recorded days in [start_date, end_date], merging archived years"""
+        usage = {}
+
+        archives = UserTimeUsageArchive.query.filter_by(user_id=self.id).filter(
+            UserTimeUsageArchive.year >= start_date.year,
+            UserTimeUsageArchive.year <= end_date.year
+        ).all()
+        for archive in archives:
+            for day, seconds in archive.iter_days():
+                if seconds and start_date <= day <= end_date:
+                    usage[day] = seconds
+
+        records = db.session.query(UserTimeUsage.date, UserTimeUsage.time_spent).filter(
+            UserTimeUsage.user_id == self.id,
+            UserTimeUsage.date >= start_date,
+            UserTimeUsage.date <= end_date
+        ).all()
+        for day, seconds in records:
+            usage[day] = seconds or 0
+
+        return usage
+
     def get_recent_usage(self, days=7):
         """Get usage data for the last n days"""
         today = datetime.utcnow().date()
         start_date = today - timedelta(days=days-1)
         
-        # Get the usage records for the specified period
-        records = UserTimeUsage.query.filter_by(user_id=self.id).filter(
-            UserTimeUsage.date >= start_date,
-            UserTimeUsage.date <= today
-        ).order_by(UserTimeUsage.date).all()
+        usage = self.get_usage_between(start_date, today)
         
         # Create a dict with all days in the period
         usage_dict = {}
         for i in range(days):
-            date = start_date + timedelta(days=i)
-            usage_dict[date.strftime('%Y-%m-%d')] = 0
-        
-        # Fill in the actual data
-        for record in records:
-            date_str = record.date.strftime('%Y-%m-%d')
-            usage_dict[date_str] = record.time_spent
+            day = start_date + timedelta(days=i)
+            usage_dict[day.strftime('%Y-%m-%d')] = usage.get(day, 0)
         
         return usage_dict
-    
-    def get_usage_weekly_grouped(self, weeks=13):
-        """Get usage totals grouped by week (Monday-Sunday) for the last N weeks"""
-        today = datetime.utcnow().date()
-        # Start from Monday of the week N-1 weeks ago
-        days_since_monday = today.weekday()  # 0=Monday
-        current_monday = today - timedelta(days=days_since_monday)
-        start_date = current_monday - timedelta(weeks=weeks - 1)
-
-        records = UserTimeUsage.query.filter_by(user_id=self.id).filter(
-            UserTimeUsage.date >= start_date,
-            UserTimeUsage.date <= today
-        ).order_by(UserTimeUsage.date).all()
-
-        result = []
-        for i in range(weeks):
-            week_start = start_date + timedelta(weeks=i)
-            week_end = week_start + timedelta(days=6)
-            total = sum(r.time_spent for r in records if week_start <= r.date <= week_end)
-            result.append({
-                'label': week_start.strftime('%d %b'),
-                'week_start': week_start.strftime('%Y-%m-%d'),
-                'total': total,
-            })
-        return result
-
-    def get_usage_monthly_grouped(self, months=12):
-        """Get usage totals grouped by calendar month for the last N months"""
-        today = datetime.utcnow().date()
-
-        result = []
-        for i in range(months - 1, -1, -1):
-            # Walk back i months from current month
-            month = today.month - i
-            year = today.year
-            while month <= 0:
-                month += 12
-                year -= 1
-            month_start = today.replace(year=year, month=month, day=1)
-            if month == 12:
-                month_end = today.replace(year=year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                month_end = today.replace(year=year, month=month + 1, day=1) - timedelta(days=1)
-
-            records = UserTimeUsage.query.filter_by(user_id=self.id).filter(
-                UserTimeUsage.date >= month_start,
-                UserTimeUsage.date <= month_end
-            ).all()
-            total = sum(r.time_spent for r in records)
-            result.append({
-                'label': month_start.strftime('%b %Y'),
-                'month': month_start.strftime('%Y-%m'),
-                'total': total,
-            })
-        return result
-
-    def get_all_usage_monthly(self):
-        """Get all recorded usage grouped by calendar month, oldest first"""
-        records = UserTimeUsage.query.filter_by(user_id=self.id).order_by(UserTimeUsage.date).all()
-        if not records:
-            return []
-
-        from collections import defaultdict
-        buckets = defaultdict(int)
-        for r in records:
-            key = r.date.strftime('%Y-%m')
-            buckets[key] += r.time_spent
-
-        result = []
-        for key in sorted(buckets):
-            year, month = int(key[:4]), int(key[5:])
-            label = datetime(year, month, 1).strftime('%b %Y')
-            result.append({'label': label, 'month': key, 'total': buckets[key]})
-        return result
 
     def get_config_value(self, key):
         """Extract a specific value from the stored config"""
         if not self.last_config:
             return None
         try:
-            config = json.loads(self.last_config)
-            return config.get(key)
-        except:
+            return load_userinfo(self.last_config).get(key)
+        except (ValueError, AttributeError):
             return None
 
 class UserTimeUsage(db.Model):
@@ -227,6 +314,376 @@ class UserTimeUsage(db.Model):
     def __repr__(self):
         return f'<UserTimeUsage {self.user.username} {self.date}: {self.time_spent}>'
 
+class UserTimeUsageArchive(db.Model):
+    """Cold usage history: one row per user per year, days packed as little-endian uint32 seconds"""
+    __tablename__ = 'user_time_usage_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('managed_user.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    days = db.Column(db.LargeBinary, nullable=False)  # one slot per day of year, index 0 = Jan 1st
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', name='user_year_uc'),
+    )
+
+    def __repr__(self):
+        return f'<UserTimeUsageArchive {self.user_id} {self.year}>'
+
+    @staticmethod
+    def days_in_year(year):
+        return 366 if calendar.isleap(year) else 365
+
+    def get_values(self):
+        """Unpack the per-day seconds into a list indexed by day of year - 1"""
+        count = self.days_in_year(self.year)
+        if not self.days:
+            return [0] * count
+        return list(struct.unpack(f'<{count}I', self.days))
+
+    def set_values(self, values):
+        """Pack a list of per-day seconds (index 0 = Jan 1st)"""
+        self.days = struct.pack(f'<{len(values)}I', *values)
+
+    def iter_days(self):
+        """Yield (date, seconds) for every day of the archived year"""
+        first = date(self.year, 1, 1)
+        for offset, seconds in enumerate(self.get_values()):
+            yield first + timedelta(days=offset), seconds
+
+class Job(db.Model):
+    """Remote action queued by a web request and executed by the background task manager"""
+    __tablename__ = 'job'
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # modify_time, validate_user
+    user_id = db.Column(db.Integer, db.ForeignKey('managed_user.id'), nullable=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON arguments
+    status = db.Column(db.String(10), nullable=False, default=QUEUED, index=True)
+    message = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON result
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+    
+    @classmethod
+    def enqueue(cls, kind, user_id, **payload):
+        """Add a queued job to the session; the caller commits"""
+        job = cls(kind=kind, user_id=user_id, payload=json.dumps(payload), status=cls.QUEUED)
+        db.session.add(job)
+        return job
+    
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+    
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+    
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'status': self.status,
+            'message': self.message,
+            'result': self.get_result(),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
+
+class RemoteCommand(db.Model):
+    """
+    Change waiting to be delivered to a managed computer.
+    Commands are delivered in id (sequence) order, all of a host's commands in one session.
+    """
+    __tablename__ = 'remote_command'
+    TIME_ADJUSTMENT = 'time_adjustment'  # net --settimeleft change, in seconds
+    WEEKLY_LIMITS = 'weekly_limits'      # push the stored weekly schedule
+    ALLOWED_HOURS = 'allowed_hours'      # push the stored time intervals of the changed days
+    PUSH_KINDS = (WEEKLY_LIMITS, ALLOWED_HOURS)
+    
+    id = db.Column(db.Integer, primary_key=True)  # Sequence number
+    user_id = db.Column(db.Integer, db.ForeignKey('managed_user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    seconds = db.Column(db.Integer, nullable=True)  # Signed net adjustment for time_adjustment
+    payload = db.Column(db.Text, nullable=True)  # JSON, e.g. {"days": [1, 3]} for allowed_hours
+    revision = db.Column(db.Integer, nullable=True)  # User's desired_revision this push brings the computer to
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RemoteCommand {self.id} {self.kind} user={self.user_id}>'
+    
+    @classmethod
+    def queue_time_adjustment(cls, user, operation, seconds):
+        """
+        Queue a time change, folding it into the user's last queued command when that is
+        also a time adjustment. Returns the command, or None when the changes cancel out.
+        """
+        signed = seconds if operation == '+' else -seconds
+        last = cls.query.filter_by(user_id=user.id).order_by(cls.id.desc()).first()
+        if last is not None and last.kind == cls.TIME_ADJUSTMENT:
+            # Add in SQL so an amount being delivered concurrently is not lost
+            updated = cls.query.filter_by(id=last.id).update(
+                {'seconds': cls.seconds + signed, 'updated_at': datetime.utcnow()},
+                synchronize_session=False,
+            )
+            if updated:
+                db.session.refresh(last)
+                if last.seconds == 0:
+                    db.session.delete(last)
+                    return None
+                return last
+        
+        command = cls(user_id=user.id, kind=cls.TIME_ADJUSTMENT, seconds=signed)
+        db.session.add(command)
+        return command
+    
+    @classmethod
+    def queue_push(cls, user, kind, days=None):
+        """
+        Queue a schedule or interval push unless one is already waiting.
+        The data is read when the command is delivered, so one queued push covers any number of edits.
+        days limits an allowed_hours push to those days (None = all days); queued days are merged.
+        Bumps the user's desired_revision; the command carries it.
+        """
+        # Earlier changes no queued push covers (e.g. a policy edit) would be marked applied by this push
+        uncovered = user.needs_sync() and not cls.query.filter(
+            cls.user_id == user.id,
+            cls.kind.in_(cls.PUSH_KINDS),
+            cls.revision >= user.desired_revision,
+        ).first()
+        
+        user.mark_config_dirty()
+        command = cls._merge_push(user, kind, days)
+        if uncovered:
+            # ...so resend everything
+            for other in cls.PUSH_KINDS:
+                cls._merge_push(user, other, None)
+        return command
+    
+    @classmethod
+    def _merge_push(cls, user, kind, days):
+        command = cls.query.filter_by(user_id=user.id, kind=kind).first()
+        if command is None:
+            command = cls(user_id=user.id, kind=kind, revision=user.desired_revision)
+            if days is not None:
+                command.payload = json.dumps({'days': sorted(days)})
+            db.session.add(command)
+        else:
+            queued = command.get_days()
+            if queued is not None:
+                merged = None if days is None else sorted(set(queued) | set(days))
+                command.payload = json.dumps({'days': merged}) if merged else None
+            command.revision = user.desired_revision
+            command.updated_at = datetime.utcnow()
+        return command
+    
+    @classmethod
+    def pending_adjustments(cls):
+        """Net queued time adjustment in seconds per user id"""
+        rows = db.session.query(cls.user_id, db.func.sum(cls.seconds)).filter(
+            cls.kind == cls.TIME_ADJUSTMENT
+        ).group_by(cls.user_id).all()
+        return {user_id: total for user_id, total in rows if total}
+    
+    def acknowledge(self, sent):
+        """
+        Remove a delivered command unless it changed while it was being sent.
+        sent is the (seconds, updated_at) snapshot taken before delivery.
+        Returns: True when the command is gone
+        """
+        seconds, updated_at = sent
+        query = RemoteCommand.query.filter_by(id=self.id)
+        if self.kind == self.TIME_ADJUSTMENT:
+            # Keep whatever was added on top of the delivered amount
+            query.update({'seconds': RemoteCommand.seconds - seconds}, synchronize_session=False)
+            query = query.filter(RemoteCommand.seconds == 0)
+        else:
+            query = query.filter_by(updated_at=updated_at)
+        return query.delete(synchronize_session=False) > 0
+    
+    def get_days(self):
+        """Days an allowed_hours push covers, or None for all days"""
+        return json.loads(self.payload).get('days') if self.payload else None
+    
+    def get_operation(self):
+        """Split a time adjustment into the (operation, seconds) pair used by timekpra"""
+        return ('+' if self.seconds >= 0 else '-'), abs(self.seconds)
+
+class Agent(db.Model):
+    """Client-side agent pushing timekpr state for one computer instead of being polled over SSH"""
+    __tablename__ = 'agent'
+    id = db.Column(db.Integer, primary_key=True)
+    system_ip = db.Column(db.String(50), unique=True, nullable=False)  # Computer the agent reports for
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the bearer token
+    last_seq = db.Column(db.Integer, nullable=False, default=0)  # Highest batch sequence applied
+    last_batch_hash = db.Column(db.String(64), nullable=True)  # sha256 of the reports of batch last_seq
+    last_seen = db.Column(db.DateTime, nullable=True)
+    disable_polling = db.Column(db.Boolean, nullable=False, default=True)  # Skip SSH --userinfo while pushing
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Agent {self.system_ip}>'
+    
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def create(cls, system_ip):
+        """
+        Register an agent (or replace its token) and return (agent, token).
+        The plain token is only available here; the caller commits.
+        """
+        token = secrets.token_urlsafe(32)
+        agent = cls.query.filter_by(system_ip=system_ip).first()
+        if agent is None:
+            agent = cls(system_ip=system_ip)
+            db.session.add(agent)
+        agent.token_hash = cls.hash_token(token)
+        agent.last_seq = 0
+        agent.last_batch_hash = None
+        return agent, token
+    
+    @classmethod
+    def from_token(cls, token):
+        if not token:
+            return None
+        return cls.query.filter_by(token_hash=cls.hash_token(token)).first()
+    
+    def is_pushing(self, stale_after):
+        """True when the agent reported within stale_after seconds"""
+        return self.last_seen is not None and \
+            (datetime.utcnow() - self.last_seen).total_seconds() < stale_after
+
+class SchedulePolicy(db.Model):
+    """Named weekly limits and allowed hours shared by several users"""
+    __tablename__ = 'schedule_policy'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    
+    # Time limits per day in hours (0 = no limit/disabled)
+    monday_hours = db.Column(db.Float, default=0)
+    tuesday_hours = db.Column(db.Float, default=0)
+    wednesday_hours = db.Column(db.Float, default=0)
+    thursday_hours = db.Column(db.Float, default=0)
+    friday_hours = db.Column(db.Float, default=0)
+    saturday_hours = db.Column(db.Float, default=0)
+    sunday_hours = db.Column(db.Float, default=0)
+    
+    revision = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every change
+    last_modified = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    subscribers = db.relationship('ManagedUser', backref='policy', lazy=True)
+    intervals = db.relationship('SchedulePolicyInterval', backref='policy', lazy=True,
+                                cascade='all, delete-orphan',
+                                order_by='(SchedulePolicyInterval.day_of_week, SchedulePolicyInterval.sort_order)')
+    
+    def __repr__(self):
+        return f'<SchedulePolicy {self.name}>'
+    
+    def get_schedule_dict(self):
+        """Get the weekly limits as a dictionary of day name -> hours"""
+        return {
+            'monday': self.monday_hours,
+            'tuesday': self.tuesday_hours,
+            'wednesday': self.wednesday_hours,
+            'thursday': self.thursday_hours,
+            'friday': self.friday_hours,
+            'saturday': self.saturday_hours,
+            'sunday': self.sunday_hours
+        }
+    
+    def set_schedule_from_dict(self, schedule_dict):
+        """Set the weekly limits from a dictionary of day name -> hours"""
+        self.monday_hours = schedule_dict.get('monday', 0)
+        self.tuesday_hours = schedule_dict.get('tuesday', 0)
+        self.wednesday_hours = schedule_dict.get('wednesday', 0)
+        self.thursday_hours = schedule_dict.get('thursday', 0)
+        self.friday_hours = schedule_dict.get('friday', 0)
+        self.saturday_hours = schedule_dict.get('saturday', 0)
+        self.sunday_hours = schedule_dict.get('sunday', 0)
+    
+    def set_intervals(self, intervals_by_day):
+        """Replace the allowed hours with intervals_by_day ({day: [(sh, sm, eh, em), ...]})"""
+        self.intervals = [
+            SchedulePolicyInterval(
+                day_of_week=day, start_hour=sh, start_minute=sm,
+                end_hour=eh, end_minute=em, sort_order=sort_idx,
+            )
+            for day, bounds_list in sorted(intervals_by_day.items())
+            for sort_idx, (sh, sm, eh, em) in enumerate(bounds_list)
+        ]
+    
+    def mark_changed(self):
+        """
+        Bump the policy revision and mark every subscriber that uses it dirty, in one UPDATE.
+        The caller commits.
+        """
+        self.revision = (self.revision or 0) + 1
+        self.last_modified = datetime.utcnow()
+        return ManagedUser.query.filter(
+            ManagedUser.policy_id == self.id,
+            db.or_(ManagedUser.override_limits == False, ManagedUser.override_intervals == False),
+        ).update({
+            'desired_revision': ManagedUser.desired_revision + 1,
+            'data_revision': ManagedUser.data_revision + 1,
+        }, synchronize_session=False)
+    
+    def to_dict(self):
+        intervals = {}
+        for interval in self.intervals:
+            intervals.setdefault(str(interval.day_of_week), []).append({
+                'start_hour': interval.start_hour,
+                'start_minute': interval.start_minute,
+                'end_hour': interval.end_hour,
+                'end_minute': interval.end_minute,
+            })
+        return {
+            'id': self.id,
+            'name': self.name,
+            'revision': self.revision,
+            'schedule': self.get_schedule_dict(),
+            'intervals': intervals,
+            'subscribers': len(self.subscribers),
+        }
+
+class SchedulePolicyInterval(db.Model):
+    """One allowed-hours interval of a schedule policy"""
+    __tablename__ = 'schedule_policy_interval'
+    id = db.Column(db.Integer, primary_key=True)
+    policy_id = db.Column(db.Integer, db.ForeignKey('schedule_policy.id'), nullable=False, index=True)
+    day_of_week = db.Column(db.Integer, nullable=False)  # 1-7
+    start_hour = db.Column(db.Integer, nullable=False)
+    start_minute = db.Column(db.Integer, default=0)
+    end_hour = db.Column(db.Integer, nullable=False)
+    end_minute = db.Column(db.Integer, default=0)
+    sort_order = db.Column(db.Integer, default=0)
+    
+    # Policy intervals are always enabled; kept so sync code can treat them like user intervals
+    is_enabled = True
+    
+    def get_bounds(self):
+        """(start_hour, start_minute, end_hour, end_minute) for comparing intervals"""
+        return (self.start_hour, self.start_minute or 0, self.end_hour, self.end_minute or 0)
+    
+    def is_valid_interval(self):
+        start_minutes = self.start_hour * 60 + (self.start_minute or 0)
+        end_minutes = self.end_hour * 60 + (self.end_minute or 0)
+        return start_minutes < end_minutes and 0 <= start_minutes < 1440 and 0 <= end_minutes < 1440
+
 class UserWeeklySchedule(db.Model):
     __tablename__ = 'user_weekly_schedule'
     id = db.Column(db.Integer, primary_key=True)
@@ -323,6 +780,10 @@ class UserDailyTimeInterval(db.Model):
     def __repr__(self):
         return f'<UserDailyTimeInterval {self.user_id} Day{self.day_of_week} {self.start_hour:02d}:{self.start_minute:02d}-{self.end_hour:02d}:{self.end_minute:02d}>'
     
+    def get_bounds(self):
+        """(start_hour, start_minute, end_hour, end_minute) for comparing intervals"""
+        return (self.start_hour, self.start_minute or 0, self.end_hour, self.end_minute or 0)
+    
     def get_time_range_string(self):
         """Get formatted time range string (e.g., '09:00-17:30')"""
         return f"{self.start_hour:02d}:{self.start_minute:02d}-{self.end_hour:02d}:{self.end_minute:02d}"
@@ -347,41 +808,3 @@ class UserDailyTimeInterval(db.Model):
         """Mark the interval as modified (needs sync)"""
         self.is_synced = False
         self.last_modified = datetime.utcnow()
-    
-    def to_timekpr_format(self):
-        """Convert interval to timekpr hour specification format"""
-        if not self.is_enabled:
-            return None
-        
-        # If full hour intervals, just return the hour numbers
-        if self.start_minute == 0 and self.end_minute == 0:
-            hours = list(range(self.start_hour, self.end_hour))
-            return [str(h) for h in hours]
-        
-        # If partial hours, include minute specifications
-        result = []
-        current_hour = self.start_hour
-        
-        # First hour (potentially partial)
-        if current_hour == self.end_hour:
-            # Same hour, use minute range
-            result.append(f"{current_hour}[{self.start_minute}-{self.end_minute}]")
-        else:
-            # Multiple hours
-            if self.start_minute == 0:
-                result.append(str(current_hour))
-            else:
-                result.append(f"{current_hour}[{self.start_minute}-59]")
-            
-            current_hour += 1
-            
-            # Full hours in between
-            while current_hour < self.end_hour:
-                result.append(str(current_hour))
-                current_hour += 1
-            
-            # Last hour (potentially partial)
-            if self.end_minute > 0:
-                result.append(f"{self.end_hour}[0-{self.end_minute}]")
-        
-        return result
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+In-process publish/subscribe for live UI updates.
+
+The background task manager and the write routes publish small events
+(user_updated, sync_completed, task_status, ...) to the module-level
+``broker``. Each open Server-Sent Events connection holds one subscriber
+queue and receives every event published after it subscribed.
+
+Events only reach subscribers in the same process, which matches the
+single-process deployment (one gunicorn worker running the poller).
+Every open stream holds one of that worker's threads, so at most
+SSE_MAX_SUBSCRIBERS streams (default 8 of the 16 threads) are accepted;
+pages refused a stream fall back to polling.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15  # Comment line sent on idle streams so proxies keep them open
+DEFAULT_MAX_SUBSCRIBERS = 8
+
+
+def get_max_subscribers():
+    """Open event streams allowed at once (SSE_MAX_SUBSCRIBERS)"""
+    try:
+        return max(0, int(os.environ.get('SSE_MAX_SUBSCRIBERS', DEFAULT_MAX_SUBSCRIBERS)))
+    except ValueError:
+        logger.warning("Invalid SSE_MAX_SUBSCRIBERS, using %d", DEFAULT_MAX_SUBSCRIBERS)
+        return DEFAULT_MAX_SUBSCRIBERS
+
+
+class EventBroker:
+    def __init__(self, max_queue=100, max_subscribers=None):
+        self.max_queue = max_queue
+        self.max_subscribers = get_max_subscribers() if max_subscribers is None else max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a new subscriber and return its event queue, or None when max_subscribers are open"""
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data=None):
+        """Send an event to all subscribers without ever blocking the publisher"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        message = (event, data or {})
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop the event, it will catch up on the next one
+                logger.debug("Dropping %s event for a slow subscriber", event)
+
+    def stream(self, q, keepalive=KEEPALIVE_SECONDS):
+        """Generator yielding Server-Sent Events for one subscriber until it disconnects"""
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event, data = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        finally:
+            self.unsubscribe(q)
+
+
+broker = EventBroker()
@@ -0,0 +1,58 @@
+"""
+Rendered-HTML cache for per-user template fragments.
+
+Templates wrap a section in
+
+    {% call cached_fragment('user-card', user.id, user.data_revision, ...) %} ... {% endcall %}
+
+The first argument names the fragment, the second is the user it belongs
+to and the rest is its version: the user's data_revision, which the
+poller and every edit bump when the user's data changes, plus whatever
+else the fragment shows that changes without a bump (last poll time,
+queued adjustments). One entry is kept per fragment and user, so a new
+version re-renders and replaces the old HTML; invalidate() drops a
+deleted user's fragments.
+
+The Jinja2 bytecode cache (compiled templates shared by all workers and
+restarts) lives next to it in instance/jinja_cache.
+"""
+import os
+import threading
+
+from jinja2 import FileSystemBytecodeCache
+
+from src import metrics
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self._entries = {}  # (fragment name, user id) -> (version, html)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        directory = os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+        app.jinja_env.globals['cached_fragment'] = self.fragment
+
+    def fragment(self, name, owner, *version, caller):
+        """The cached HTML of a {% call %} block, rendered again when its version changed"""
+        key = (name, owner)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            metrics.template_fragments.inc('hit')
+            return entry[1]
+        html = caller()
+        with self._lock:
+            self._entries[key] = (version, html)
+        metrics.template_fragments.inc('miss')
+        return html
+
+    def invalidate(self, owner):
+        """Forget every fragment of a user (its id may be reused)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == owner]:
+                del self._entries[key]
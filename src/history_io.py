@@ -0,0 +1,271 @@
+"""
+Streaming export and bulk import of usage history and schedules.
+
+Exports are generators yielding CSV or NDJSON text in chunks of about
+EXPORT_BUFFER bytes, so a download of any size runs in constant memory:
+users are walked one at a time and their daily rows are fetched with
+yield_per. Archived years are unpacked back into daily rows, so an export
+holds the complete history. Users are identified by username and
+system_ip (ids differ between installations).
+
+The importer reads the same formats from any iterable of text lines and
+upserts UserTimeUsage in chunks of IMPORT_CHUNK rows, one executemany
+INSERT ... ON CONFLICT (user_id, date) DO UPDATE per chunk. Imported days
+older than the archive horizon are folded into the archive afterwards.
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from src.database import db, ManagedUser, UserTimeUsage, UserTimeUsageArchive, UserDailyTimeInterval
+from src.archiver import archive_usage, get_horizon_days
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+USAGE_FIELDS = ('username', 'system_ip', 'date', 'time_spent')
+SCHEDULE_FIELDS = ('username', 'system_ip', 'day_of_week', 'hours', 'intervals')
+WEEK_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+EXPORT_BUFFER = 64 * 1024  # Bytes of output collected before yielding a chunk
+EXPORT_FETCH = 5000  # Daily rows fetched per round trip
+IMPORT_CHUNK = 10000  # Rows per executemany upsert (and commit)
+MAX_REPORTED_ERRORS = 20
+
+# Sent straight to the driver's executemany: building SQLAlchemy parameters per row costs more than the insert
+UPSERT_USAGE_SQL = (
+    'INSERT INTO user_time_usage (user_id, date, time_spent) VALUES (?, ?, ?) '
+    'ON CONFLICT (user_id, date) DO UPDATE SET time_spent = excluded.time_spent'
+)
+
+
+class TransferError(ValueError):
+    """Unknown format or unreadable input"""
+
+
+def detect_format(name=None, mimetype=None):
+    """Format from an explicit name, a file name or a mimetype; defaults to csv"""
+    if name in FORMATS:
+        return name
+    if name:
+        if name.lower().endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        if name.lower().endswith('.csv'):
+            return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        return 'ndjson'
+    return 'csv'
+
+
+def _export_users(user_ids=None):
+    query = db.session.query(ManagedUser.id, ManagedUser.username, ManagedUser.system_ip)
+    if user_ids:
+        query = query.filter(ManagedUser.id.in_(user_ids))
+    return query.order_by(ManagedUser.id).all()
+
+
+def iter_usage(user_ids=None, start=None, end=None):
+    """Yield {'username', 'system_ip', 'date', 'time_spent'} for every day with usage, per user in date order"""
+    for user_id, username, system_ip in _export_users(user_ids):
+        # Archived days are all older than the user's daily rows
+        archives = UserTimeUsageArchive.query.filter_by(user_id=user_id)
+        if start:
+            archives = archives.filter(UserTimeUsageArchive.year >= start.year)
+        if end:
+            archives = archives.filter(UserTimeUsageArchive.year <= end.year)
+        for archive in archives.order_by(UserTimeUsageArchive.year):
+            for day, seconds in archive.iter_days():
+                if seconds and (start is None or day >= start) and (end is None or day <= end):
+                    yield {'username': username, 'system_ip': system_ip, 'date': day.isoformat(), 'time_spent': seconds}
+
+        rows = db.session.query(UserTimeUsage.date, UserTimeUsage.time_spent).filter(UserTimeUsage.user_id == user_id)
+        if start:
+            rows = rows.filter(UserTimeUsage.date >= start)
+        if end:
+            rows = rows.filter(UserTimeUsage.date <= end)
+        for day, seconds in rows.order_by(UserTimeUsage.date).yield_per(EXPORT_FETCH):
+            if seconds:
+                yield {'username': username, 'system_ip': system_ip, 'date': day.isoformat(), 'time_spent': seconds}
+
+
+def iter_schedules(user_ids=None):
+    """Yield one row per user and day: weekly hours limit and allowed intervals ('HH:MM-HH:MM')"""
+    for user_id, username, system_ip in _export_users(user_ids):
+        user = db.session.get(ManagedUser, user_id)
+        hours = user.weekly_schedule.get_schedule_dict() if user.weekly_schedule else {}
+        intervals = {}
+        for interval in UserDailyTimeInterval.query.filter_by(user_id=user_id, is_enabled=True).order_by(
+            UserDailyTimeInterval.day_of_week, UserDailyTimeInterval.sort_order
+        ):
+            intervals.setdefault(interval.day_of_week, []).append(interval.get_time_range_string())
+        for day_of_week, day_name in enumerate(WEEK_DAYS, 1):
+            yield {
+                'username': username,
+                'system_ip': system_ip,
+                'day_of_week': day_of_week,
+                'hours': hours.get(day_name) or 0,
+                'intervals': intervals.get(day_of_week, []),
+            }
+        # The session would otherwise keep every user loaded so far
+        db.session.expunge_all()
+
+
+def _csv_chunks(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([';'.join(value) if isinstance(value, list) else value
+                         for value in (row[field] for field in fields)])
+        if buffer.tell() >= EXPORT_BUFFER:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, separators=(',', ':')) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER:
+            yield ''.join(lines)
+            lines, size = [], 0
+    yield ''.join(lines)
+
+
+def export_chunks(kind, fmt, **filters):
+    """Text chunks of a 'usage' or 'schedules' export in csv or ndjson"""
+    if fmt not in FORMATS:
+        raise TransferError(f"format must be one of {', '.join(FORMATS)}")
+    if kind == 'usage':
+        rows, fields = iter_usage(**filters), USAGE_FIELDS
+    elif kind == 'schedules':
+        rows, fields = iter_schedules(**filters), SCHEDULE_FIELDS
+    else:
+        raise TransferError(f'Unknown export {kind}')
+    return _csv_chunks(fields, rows) if fmt == 'csv' else _ndjson_chunks(rows)
+
+
+def text_lines(binary):
+    """Decode an iterable of UTF-8 byte lines (an uploaded file or request body), dropping a BOM"""
+    return codecs.iterdecode(binary, 'utf-8-sig')
+
+
+def read_rows(lines, fmt):
+    """Yield dict rows from an iterable of CSV or NDJSON text lines"""
+    if fmt == 'csv':
+        reader = csv.reader(lines)
+        header = next(reader, [])
+        for values in reader:
+            if values:
+                yield dict(zip(header, values))
+    elif fmt == 'ndjson':
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # Counted as an unreadable row, the rest still loads
+    else:
+        raise TransferError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def _parse_usage_row(row):
+    """(username, system_ip, date, seconds) or ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('not a usage row')
+    try:
+        username = str(row['username']).strip()
+        system_ip = str(row['system_ip']).strip()
+        day = date.fromisoformat(str(row['date']).strip())
+        seconds = int(row['time_spent'])
+    except KeyError as e:
+        raise ValueError(f'missing {e.args[0]}')
+    except TypeError:
+        raise ValueError('time_spent must be a number of seconds')
+    if not username or not system_ip:
+        raise ValueError('username and system_ip are required')
+    if not 0 <= seconds <= 86400:
+        raise ValueError('time_spent must be between 0 and 86400 seconds')
+    return username, system_ip, day, seconds
+
+
+def _upsert_usage(values):
+    db.session.connection().exec_driver_sql(UPSERT_USAGE_SQL, values)
+    db.session.commit()
+
+
+def import_usage(rows, create_users=False, chunk_size=IMPORT_CHUNK):
+    """
+    Upsert daily usage rows ({'username', 'system_ip', 'date', 'time_spent'}) into UserTimeUsage.
+    A day already stored for the user is overwritten. Rows of unknown users are skipped unless
+    create_users is set, which adds them unvalidated (the next poll validates them).
+    Must be called inside an app context.
+
+    Returns: {'rows', 'imported', 'skipped', 'users', 'created_users', 'archived', 'errors': [...]}
+    """
+    user_ids = {(username, system_ip): user_id for user_id, username, system_ip in
+                db.session.query(ManagedUser.id, ManagedUser.username, ManagedUser.system_ip)}
+    result = {'rows': 0, 'imported': 0, 'skipped': 0, 'users': 0, 'created_users': 0, 'archived': 0, 'errors': []}
+    touched = set()
+    oldest = None
+    pending = []
+
+    def skip(number, message):
+        result['skipped'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append(f'Row {number}: {message}')
+
+    number = 0
+    for number, row in enumerate(rows, 1):
+        try:
+            username, system_ip, day, seconds = _parse_usage_row(row)
+        except ValueError as e:
+            skip(number, str(e))
+            continue
+
+        user_id = user_ids.get((username, system_ip))
+        if user_id is None:
+            if not create_users:
+                skip(number, f'unknown user {username}@{system_ip}')
+                continue
+            user = ManagedUser(username=username, system_ip=system_ip, is_valid=False)
+            db.session.add(user)
+            db.session.flush()
+            user_id = user_ids[(username, system_ip)] = user.id
+            result['created_users'] += 1
+
+        pending.append((user_id, day.isoformat(), seconds))
+        touched.add(user_id)
+        if oldest is None or day < oldest:
+            oldest = day
+        if len(pending) >= chunk_size:
+            _upsert_usage(pending)
+            result['imported'] += len(pending)
+            pending = []
+
+    if pending:
+        _upsert_usage(pending)
+        result['imported'] += len(pending)
+    result['rows'] = number
+
+    touched = sorted(touched)
+    for offset in range(0, len(touched), 500):
+        ManagedUser.query.filter(ManagedUser.id.in_(touched[offset:offset + 500])).update({
+            'data_revision': ManagedUser.data_revision + 1,
+        }, synchronize_session=False)
+    db.session.commit()
+    result['users'] = len(touched)
+
+    # Old days would otherwise sit next to their archived year until the daily archive job
+    horizon = get_horizon_days()
+    if oldest and horizon and (date.today() - oldest).days > horizon:
+        result['archived'] = archive_usage(horizon_days=horizon, vacuum=False)
+    return result
+
+
+def export_filename(kind, fmt):
+    return f"timekpr-{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
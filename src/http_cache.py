@@ -0,0 +1,37 @@
+"""
+Conditional GET support for the JSON API.
+
+Endpoints compute a cheap version token (a per-user data_revision, a
+timestamp, the task manager status, ...) before doing any real work and
+hand it to ``conditional_json`` together with a callable that builds the
+full response. When the client's If-None-Match matches, a bodyless 304 is
+returned and the builder never runs.
+"""
+import hashlib
+
+from flask import request, Response
+
+
+def make_etag(*parts):
+    """Derive a short opaque ETag from the given version parts"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def conditional_json(version, build):
+    """
+    Serve build() with a weak ETag derived from `version`.
+    build must return a Flask response or a (response, status) tuple.
+    """
+    etag = make_etag(*version) if isinstance(version, tuple) else make_etag(version)
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+        if isinstance(response, tuple) or response.status_code != 200:
+            return response  # Errors are never cached
+
+    response.set_etag(etag, weak=True)
+    # Allow the browser to keep the body but make it revalidate on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,105 @@
+"""
+Push ingestion for client-side agents (see agent/timekpr_agent.py).
+
+An agent posts batches of raw ``timekpra --userinfo`` output for the users
+of its computer. Batches carry a payload version and a per-agent sequence
+number. Resending the last applied batch (same sequence, same reports) is
+a retry and is acknowledged without writing. Any other sequence not above
+the last applied one is refused with SequenceConflict, which tells the
+agent the server's last sequence: its state file was lost or reset, and
+it must renumber the batch instead of having reports silently dropped.
+Reports are parsed into UserInfo snapshots and stored through
+ManagedUser.record_user_info, the same write path the SSH poller uses.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from src.database import db, ManagedUser
+from src.events import broker
+from src.userinfo import parse_userinfo
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_VERSION = 1
+MAX_REPORTS = 100  # Reports accepted in one batch
+
+
+class IngestError(ValueError):
+    """Malformed or unsupported ingestion payload"""
+
+
+class SequenceConflict(IngestError):
+    """Batch sequence at or below the last applied one, and not a replay of it"""
+    def __init__(self, last_seq):
+        super().__init__(f'seq must be above {last_seq}, the last batch applied')
+        self.last_seq = last_seq
+
+
+def ingest_batch(agent, payload):
+    """
+    Apply one agent batch atomically.
+    Returns: result dict for the JSON response
+    """
+    if not isinstance(payload, dict):
+        raise IngestError('Payload must be a JSON object')
+    if payload.get('version') != PAYLOAD_VERSION:
+        raise IngestError(f"Unsupported payload version {payload.get('version')!r}, expected {PAYLOAD_VERSION}")
+    seq = payload.get('seq')
+    if not isinstance(seq, int) or seq < 1:
+        raise IngestError('seq must be a positive integer')
+    reports = payload.get('reports', [])
+    if not isinstance(reports, list) or len(reports) > MAX_REPORTS:
+        raise IngestError(f'reports must be a list of at most {MAX_REPORTS} entries')
+    
+    digest = hashlib.sha256(json.dumps(reports, sort_keys=True).encode('utf-8')).hexdigest()
+    agent.last_seen = datetime.utcnow()
+    if seq == agent.last_seq and digest == agent.last_batch_hash:
+        # Retry of the batch already applied: only counts as a heartbeat
+        db.session.commit()
+        return {'success': True, 'duplicate': True, 'seq': agent.last_seq, 'applied': 0}
+    if seq <= agent.last_seq:
+        db.session.commit()
+        raise SequenceConflict(agent.last_seq)
+    
+    users = {
+        user.username: user
+        for user in ManagedUser.query.filter_by(system_ip=agent.system_ip).all()
+    }
+    changed_ids = []
+    unknown = []
+    applied = 0
+    for report in reports:
+        if not isinstance(report, dict) or not isinstance(report.get('userinfo'), str):
+            raise IngestError('Each report needs a username and the userinfo text')
+        username = report.get('username')
+        user = users.get(username)
+        output = report['userinfo']
+        if user is None or f'User "{username}" configuration is not found' in output:
+            unknown.append(username)
+            continue
+        info = parse_userinfo(output)
+        if not info:
+            unknown.append(username)
+            continue
+        if user.record_user_info(info):
+            changed_ids.append(user.id)
+        applied += 1
+    
+    agent.last_seq = seq
+    agent.last_batch_hash = digest
+    db.session.commit()
+    for user_id in changed_ids:
+        broker.publish('user_updated', {'user_id': user_id})
+    if unknown:
+        logger.warning("Agent %s reported unknown users: %s", agent.system_ip, ', '.join(map(str, unknown)))
+    
+    return {
+        'success': True,
+        'duplicate': False,
+        'seq': seq,
+        'applied': applied,
+        'changed': len(changed_ids),
+        'unknown_users': unknown,
+    }
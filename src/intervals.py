@@ -0,0 +1,105 @@
+"""
+Allowed-hours engine.
+
+A day of intervals is represented as a 1440-bit integer, one bit per
+minute. Validation and compilation to timekpr hour specs ("9",
+"14[30-59]", "16[0-15]") are done with shifts and masks on that integer
+instead of per-minute loops; overlapping intervals simply merge.
+
+Interval bounds are (start_hour, start_minute, end_hour, end_minute)
+tuples with an exclusive end, as stored in UserDailyTimeInterval.
+Compiled specs are cached by interval content, so the sync code and the
+interval diff share one compilation per distinct day.
+"""
+from functools import lru_cache
+
+MINUTES_PER_DAY = 1440
+HOUR_MASK = (1 << 60) - 1
+
+
+class IntervalError(ValueError):
+    """Intervals that cannot be expressed as a timekpr allowed-hours spec"""
+
+
+def interval_mask(start, end):
+    """Bitmap with minutes [start, end) set"""
+    return ((1 << (end - start)) - 1) << start
+
+
+def bounds_to_minutes(bounds):
+    sh, sm, eh, em = bounds
+    return sh * 60 + sm, eh * 60 + em
+
+
+def day_mask(bounds_list):
+    """Union of a day's intervals as a minute bitmap; overlapping intervals merge"""
+    mask = 0
+    for bounds in bounds_list:
+        start, end = bounds_to_minutes(bounds)
+        if not (0 <= start < end < MINUTES_PER_DAY):
+            raise IntervalError(f"{_format(start)}-{_format(end)}: start must be before end")
+        mask |= interval_mask(start, end)
+    return mask
+
+
+def mask_to_runs(mask):
+    """Split a bitmap into sorted (start, end) minute runs"""
+    runs = []
+    offset = 0
+    while mask:
+        # Skip to the lowest set bit, then measure the run of ones
+        skip = (mask & -mask).bit_length() - 1
+        mask >>= skip
+        offset += skip
+        length = (~mask & (mask + 1)).bit_length() - 1
+        runs.append((offset, offset + length))
+        mask >>= length
+        offset += length
+    return runs
+
+
+def _format(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _hour_spec(hour, bits):
+    """timekpr spec for one hour's 60 minute bits"""
+    if bits == HOUR_MASK:
+        return str(hour)
+    runs = mask_to_runs(bits)
+    if len(runs) > 1:
+        raise IntervalError(
+            f"{hour:02d}:00-{hour:02d}:59 has more than one allowed range; timekpr allows one per hour"
+        )
+    start, end = runs[0]
+    # A range that reaches the end of the hour is written up to minute 59
+    return f"{hour}[{start}-{59 if end == 60 else end}]"
+
+
+@lru_cache(maxsize=1024)
+def _compile(bounds_key):
+    mask = day_mask(bounds_key)
+    specs = []
+    for hour in range(24):
+        bits = (mask >> (hour * 60)) & HOUR_MASK
+        if bits:
+            specs.append(_hour_spec(hour, bits))
+    return tuple(specs)
+
+
+def compile_day(bounds_list):
+    """
+    Compile a day's intervals to timekpr hour specs, e.g. ('9', '10', '14[30-59]').
+    Raises IntervalError for invalid intervals or hours with several ranges.
+    """
+    return _compile(tuple(sorted(tuple(b) for b in bounds_list)))
+
+
+def validate_day(bounds_list):
+    """Return an error message for a day's intervals, or None when they compile"""
+    try:
+        compile_day(bounds_list)
+    except IntervalError as e:
+        return str(e)
+    return None
+
@@ -0,0 +1,196 @@
+"""
+In-process metrics in the Prometheus text exposition format (/metrics).
+
+Counters, gauges and histograms are plain dicts keyed by label values and
+guarded by one lock, so recording is a dict update; nothing is computed
+until the endpoint renders them. Metrics live for the lifetime of the
+process and reset on restart.
+
+instrument_database() hooks SQLAlchemy events to time commits and count
+rows written; rows written by the current thread are also available via
+thread_rows_written() so the task loop can report them per cycle.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CYCLE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _render_sample(self, labels, value):
+        return [f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with _lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with _lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def _render_sample(self, labels, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+            cumulative += count
+            bucket_labels = _format_labels(self.label_names, labels, [('le', _format_value(bound))])
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+        label_text = _format_labels(self.label_names, labels)
+        lines.append(f'{self.name}_sum{label_text} {_format_value(state[-1])}')
+        lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+    def time(self, *labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def render():
+    """All metrics in the text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+cycle_duration = Histogram(
+    'timekpr_cycle_duration_seconds', 'Duration of background poll cycles', buckets=CYCLE_BUCKETS)
+cycle_rows_written = Histogram(
+    'timekpr_cycle_rows_written', 'Database rows written by one poll cycle', buckets=ROW_BUCKETS)
+ssh_connect_latency = Histogram(
+    'timekpr_ssh_connect_seconds', 'Time to open an authenticated SSH connection', ['host'])
+ssh_exec_latency = Histogram(
+    'timekpr_ssh_exec_seconds', 'Time to run one remote command', ['host'])
+ssh_connections = Counter(
+    'timekpr_ssh_connections_total', 'SSH connections used, by whether they were opened or reused', ['state'])
+ssh_connect_failures = Counter(
+    'timekpr_ssh_connect_failures_total', 'SSH connections that could not be opened', ['host'])
+command_failures = Counter(
+    'timekpr_command_failures_total', 'Remote operations that failed, by kind', ['kind'])
+outbox_depth = Gauge(
+    'timekpr_outbox_pending_commands', 'Commands waiting in the outbox')
+db_commit_latency = Histogram(
+    'timekpr_db_commit_seconds', 'Session commit latency, including the flush')
+db_rows_written = Counter(
+    'timekpr_db_rows_written_total', 'Rows inserted, updated or deleted')
+template_fragments = Counter(
+    'timekpr_template_fragments_total', 'Cached template fragments served, by hit or miss', ['result'])
+
+_thread_state = threading.local()
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def thread_rows_written():
+    """Rows written so far by the current thread"""
+    return getattr(_thread_state, 'rows', 0)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip()[:6].upper() in _WRITE_PREFIXES and cursor.rowcount > 0:
+        db_rows_written.inc(amount=cursor.rowcount)
+        _thread_state.rows = thread_rows_written() + cursor.rowcount
+
+
+def _before_commit(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        db_commit_latency.observe(time.perf_counter() - started)
+
+
+def instrument_database(engine):
+    """Time session commits and count written rows for an engine"""
+    if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    if not event.contains(Session, 'before_commit', _before_commit):
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_commit', _after_commit)
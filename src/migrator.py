@@ -22,7 +22,7 @@ MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migra
 def _db_path(app):
     uri = app.config['SQLALCHEMY_DATABASE_URI']
     if uri.startswith('sqlite:////'):
-        return uri[len('sqlite:////'):]
+        return uri[len('sqlite:///'):]  # Absolute path, keep its leading slash
     if uri.startswith('sqlite:///'):
         return os.path.join(app.instance_path, uri[len('sqlite:///'):])
     raise ValueError(f"Unsupported DB URI for migration runner: {uri}")
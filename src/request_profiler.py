@@ -0,0 +1,161 @@
+"""
+Opt-in per-request profiling (REQUEST_PROFILING=1).
+
+For every request it records wall time, the number and total time of SQL
+statements (SQLAlchemy engine events) and template render time (Flask
+template signals). The last RING_SIZE requests are kept in memory and
+summarised per route by /api/request-profile.
+
+Query budgets catch N+1 regressions: REQUEST_QUERY_BUDGET sets a default
+statement limit per request and REQUEST_QUERY_BUDGETS overrides it per
+endpoint. Over budget, a warning is logged, or with
+REQUEST_PROFILING_STRICT (meant for tests) QueryBudgetExceeded is raised.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import request, template_rendered, before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+RING_SIZE = 500
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL statements than its route's budget allows"""
+
+
+class _RequestStats:
+    __slots__ = ('started', 'queries', 'sql_time', 'template_time', 'template_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+
+
+class RequestProfiler:
+    def __init__(self, app=None, db=None):
+        self._current = threading.local()
+        self._recent = deque(maxlen=RING_SIZE)
+        self._lock = threading.Lock()
+        self.enabled = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.enabled = bool(app.config.get('REQUEST_PROFILING'))
+        if not self.enabled:
+            return
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    def _stats(self):
+        return getattr(self._current, 'stats', None)
+
+    def _start(self):
+        self._current.stats = _RequestStats()
+
+    def _teardown(self, exc):
+        self._current.stats = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._stats() is not None:
+            conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._stats()
+        started = conn.info.get('profiler_started')
+        if stats is not None and started:
+            stats.queries += 1
+            stats.sql_time += time.perf_counter() - started.pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = self._stats()
+        if stats is not None:
+            stats.template_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self._stats()
+        if stats is not None and stats.template_started is not None:
+            stats.template_time += time.perf_counter() - stats.template_started
+            stats.template_started = None
+
+    def _finish(self, response):
+        stats = self._stats()
+        if stats is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        entry = {
+            'route': f'{request.method} {route}',
+            'status': response.status_code,
+            'wall_ms': round((time.perf_counter() - stats.started) * 1000, 2),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_time * 1000, 2),
+            'template_ms': round(stats.template_time * 1000, 2),
+            'time': time.time(),
+        }
+        with self._lock:
+            self._recent.append(entry)
+
+        budget = self.app.config.get('REQUEST_QUERY_BUDGETS', {}).get(
+            request.endpoint, self.app.config.get('REQUEST_QUERY_BUDGET')
+        )
+        if budget is not None and stats.queries > budget:
+            message = f"{entry['route']} ran {stats.queries} SQL statements, budget is {budget}"
+            if self.app.config.get('REQUEST_PROFILING_STRICT'):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def summary(self):
+        """Per-route aggregates over the requests in the ring buffer, slowest first"""
+        with self._lock:
+            recent = list(self._recent)
+        routes = {}
+        for entry in recent:
+            route = routes.setdefault(entry['route'], {
+                'route': entry['route'], 'count': 0, 'wall_ms': 0.0, 'max_wall_ms': 0.0,
+                'queries': 0, 'max_queries': 0, 'sql_ms': 0.0, 'template_ms': 0.0,
+            })
+            route['count'] += 1
+            route['wall_ms'] += entry['wall_ms']
+            route['max_wall_ms'] = max(route['max_wall_ms'], entry['wall_ms'])
+            route['queries'] += entry['queries']
+            route['max_queries'] = max(route['max_queries'], entry['queries'])
+            route['sql_ms'] += entry['sql_ms']
+            route['template_ms'] += entry['template_ms']
+        result = []
+        for route in routes.values():
+            count = route.pop('count')
+            result.append({
+                'route': route['route'],
+                'count': count,
+                'avg_wall_ms': round(route['wall_ms'] / count, 2),
+                'max_wall_ms': route['max_wall_ms'],
+                'avg_queries': round(route['queries'] / count, 1),
+                'max_queries': route['max_queries'],
+                'avg_sql_ms': round(route['sql_ms'] / count, 2),
+                'avg_template_ms': round(route['template_ms'] / count, 2),
+            })
+        result.sort(key=lambda r: r['avg_wall_ms'], reverse=True)
+        return result
+
+    def recent(self, limit=50):
+        if limit <= 0:
+            return []
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
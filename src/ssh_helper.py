@@ -1,12 +1,154 @@
 import paramiko
 import time
 from datetime import datetime
-import re
+from contextlib import contextmanager
+import gzip
+import logging
 import json
 import os
+import threading
+
+from src.intervals import compile_day, IntervalError
+from src.userinfo import parse_userinfo
+from src import metrics
+from src.sync_trace import tracer
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = ['', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+class SSHKeyError(Exception):
+    """The private key used for all remote connections is missing or unreadable"""
+
+
+class TranscriptRecorder:
+    """
+    Appends every remote command with its exit status, output and timing to a
+    gzipped JSON-lines transcript (see start_recording).
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._write({'version': self.VERSION, 'recorded_at': datetime.utcnow().isoformat()})
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self._file.flush()
+
+    def record(self, address, command, exit_status, output, error, started, duration):
+        self._write({
+            't': round(started - self._started, 4),  # Offset from the start of the recording
+            'h': address,
+            'c': command,
+            'x': exit_status,
+            'o': output,
+            'e': error,
+            'd': round(duration, 4),
+        })
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TranscriptReplayer:
+    """
+    Serves recorded command results instead of connecting (see start_replay).
+    Each (address, command) pair replays its recorded results in order and
+    then starts over, so repeated poll cycles stay deterministic. speed 0
+    answers instantly; otherwise each command takes its recorded duration
+    divided by speed.
+    """
+    def __init__(self, path, speed=0):
+        self.path = path
+        self.speed = speed
+        self._results = {}  # (address, command) -> [(exit_status, output, error, duration)]
+        self._cursors = {}
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'c' in entry:
+                    self._results.setdefault((entry['h'], entry['c']), []).append(
+                        (entry['x'], entry['o'], entry['e'], entry['d'])
+                    )
+
+    def addresses(self):
+        return sorted({address for address, _ in self._results})
+
+    def commands(self, address):
+        return [command for host, command in self._results if host == address]
+
+    def run(self, address, command):
+        """Returns (exit_status, output, error) as recorded"""
+        results = self._results.get((address, command))
+        if not results:
+            return 127, '', f'Not in transcript {self.path}: {command}'
+        with self._lock:
+            index = self._cursors.get((address, command), 0)
+            self._cursors[(address, command)] = (index + 1) % len(results)
+        exit_status, output, error, duration = results[index]
+        if self.speed:
+            time.sleep(duration / self.speed)
+        return exit_status, output, error
+
+
+class _ReplaySession:
+    """Stands in for a paramiko connection while replaying"""
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return True
+
+    def close(self):
+        pass
+
+
+_transcript = None  # Active TranscriptRecorder or TranscriptReplayer, if any
+
+
+def start_recording(path):
+    """Record the commands of every SSHClient to a transcript file"""
+    global _transcript
+    stop_transcript()
+    _transcript = TranscriptRecorder(path)
+    return _transcript
+
+
+def start_replay(path, speed=0):
+    """Answer every SSHClient command from a recorded transcript; nothing connects"""
+    global _transcript
+    stop_transcript()
+    _transcript = TranscriptReplayer(path, speed)
+    return _transcript
+
+
+def stop_transcript():
+    global _transcript
+    if isinstance(_transcript, TranscriptRecorder):
+        _transcript.close()
+    _transcript = None
+
+
+if os.environ.get('TIMEKPR_SSH_REPLAY'):
+    start_replay(os.environ['TIMEKPR_SSH_REPLAY'], float(os.environ.get('TIMEKPR_SSH_REPLAY_SPEED', 0)))
+elif os.environ.get('TIMEKPR_SSH_RECORD'):
+    start_recording(os.environ['TIMEKPR_SSH_RECORD'])
 
 class SSHClient:
-    def __init__(self, hostname, username='timekpr-remote', key_path=None, port=22):
+    def __init__(self, hostname, username='timekpr-remote', key_path=None, port=22, persistent=False):
+        self.address = hostname  # As configured; identifies the computer in transcripts
+        # "host:port" selects a non-standard SSH port
+        host, _, port_string = hostname.partition(':')
+        if port_string.isdigit():
+            hostname, port = host, int(port_string)
         self.hostname = hostname
         self.username = username
         # Auto-detect key path based on environment
@@ -16,6 +158,7 @@ class SSHClient:
             
             # Try different possible paths
             possible_paths = [
+                os.environ.get('TIMEKPR_SSH_KEY', ''),  # Explicit override
                 '/app/ssh/timekpr_ui_key',  # Docker path
                 os.path.join(project_root, 'ssh', 'timekpr_ui_key'),  # Local path
                 os.path.join(os.getcwd(), 'ssh', 'timekpr_ui_key'),  # Current working directory
@@ -34,26 +177,27 @@ class SSHClient:
         else:
             self.key_path = key_path
         self.port = port
+        # Persistent clients keep one connection open and reuse it for every command
+        self.persistent = persistent
+        self._session = None
+        self.last_used = None
+    
+    def _new_connection(self):
+        """Open a new authenticated SSH connection"""
+        if isinstance(_transcript, TranscriptReplayer):
+            return _ReplaySession()
+        if not os.path.exists(self.key_path):
+            raise SSHKeyError(f"SSH private key not found at {self.key_path}")
         
-    def validate_user(self, username):
-        """
-        Check if a user exists by running the timekpra --userinfo command
-        Returns: (is_valid, message, config_dict)
-        """
-        client = None
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Load private key
-            if not os.path.exists(self.key_path):
-                return False, f"SSH private key not found at {self.key_path}", None
-            
-            try:
-                private_key = paramiko.RSAKey.from_private_key_file(self.key_path)
-            except Exception as e:
-                return False, f"Failed to load SSH private key: {str(e)}", None
-            
+            private_key = paramiko.RSAKey.from_private_key_file(self.key_path)
+        except Exception as e:
+            raise SSHKeyError(f"Failed to load SSH private key: {str(e)}")
+        
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        started = time.perf_counter()
+        try:
             client.connect(
                 hostname=self.hostname,
                 username=self.username,
@@ -61,67 +205,120 @@ class SSHClient:
                 port=self.port,
                 timeout=10
             )
-            
-            command = f'timekpra --userinfo {username}'
-            stdin, stdout, stderr = client.exec_command(command)
-            
-            # Wait for command to complete
-            exit_status = stdout.channel.recv_exit_status()
-            
-            # Read output
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
+        except Exception:
+            metrics.ssh_connect_failures.inc(self.address)
+            client.close()
+            raise
+        metrics.ssh_connect_latency.observe(time.perf_counter() - started, self.address)
+        metrics.ssh_connections.inc('opened')
+        return client
+    
+    def is_connected(self):
+        """Check whether the persistent session is open"""
+        if self._session is None:
+            return False
+        transport = self._session.get_transport()
+        return transport is not None and transport.is_active()
+    
+    def close(self):
+        """Close the persistent session, if any"""
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+            self._session = None
+    
+    def __enter__(self):
+        self.persistent = True
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    @contextmanager
+    def _connection(self):
+        """
+        Yield a connected paramiko client: the persistent session when enabled,
+        otherwise a fresh connection closed on exit
+        """
+        self.last_used = time.time()
+        if not self.persistent:
+            client = self._new_connection()
+            try:
+                yield client
+            finally:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            return
+        
+        if not self.is_connected():
+            self.close()
+            self._session = self._new_connection()
+        else:
+            metrics.ssh_connections.inc('reused')
+        try:
+            yield self._session
+        except (paramiko.SSHException, OSError, EOFError):
+            # Broken session: drop it so the next command reconnects
+            self.close()
+            raise
+    
+    def _exec(self, client, command):
+        """Run a command and return (exit_status, output, error)"""
+        transcript = _transcript
+        if isinstance(client, _ReplaySession):
+            if not isinstance(transcript, TranscriptReplayer):
+                raise paramiko.SSHException('Replay stopped')  # Drops the session; next command connects
+            started = time.time()
+            exit_status, output, error = transcript.run(self.address, command)
+            tracer.record_command(command, exit_status, time.time() - started, len(command.encode('utf-8')),
+                                  len(output.encode('utf-8')) + len(error.encode('utf-8')))
+            return exit_status, output, error
+        
+        started = time.time()
+        stdin, stdout, stderr = client.exec_command(command)
+        
+        # Wait for command to complete
+        exit_status = stdout.channel.recv_exit_status()
+        
+        # Read output
+        raw_output = stdout.read()
+        raw_error = stderr.read()
+        output = raw_output.decode('utf-8')
+        error = raw_error.decode('utf-8')
+        duration = time.time() - started
+        metrics.ssh_exec_latency.observe(duration, self.address)
+        tracer.record_command(command, exit_status, duration, len(command.encode('utf-8')),
+                              len(raw_output) + len(raw_error))
+        if isinstance(transcript, TranscriptRecorder):
+            transcript.record(self.address, command, exit_status, output, error, started, duration)
+        return exit_status, output, error
+        
+    def validate_user(self, username):
+        """
+        Check if a user exists by running the timekpra --userinfo command
+        Returns: (is_valid, message, UserInfo snapshot)
+        """
+        try:
+            with self._connection() as client:
+                command = f'timekpra --userinfo {username}'
+                exit_status, output, error = self._exec(client, command)
             
             # Check for the error message indicating user not found
             if f'User "{username}" configuration is not found' in output or f'User "{username}" configuration is not found' in error:
                 return False, f"User '{username}' not found on system", None
             
-            # Parse the configuration
-            config_dict = self._parse_timekpr_output(output)
-            
             # If we get here, the user likely exists
-            return True, output, config_dict
+            return True, output, parse_userinfo(output)
             
+        except SSHKeyError as e:
+            return False, str(e), None
         except Exception as e:
             return False, f"Connection error: {str(e)}", None
-        finally:
-            if client is not None:
-                try:
-                    client.close()
-                except Exception:
-                    pass
     
-    def _parse_timekpr_output(self, output):
-        """Parse the output of timekpra --userinfo command into a dictionary"""
-        config_dict = {}
-        
-        # Regular expression to match key-value pairs
-        pattern = r'([A-Z_]+):\s*(.*)'
-        
-        for line in output.split('\n'):
-            match = re.search(pattern, line)
-            if match:
-                key = match.group(1)
-                value = match.group(2).strip()
-                
-                # Convert numeric values
-                if value.isdigit():
-                    value = int(value)
-                elif ';' in value:
-                    # Handle semicolon-separated lists
-                    value = value.split(';')
-                    # Convert to integers if possible
-                    if all(item.isdigit() for item in value):
-                        value = [int(item) for item in value]
-                elif value.lower() == 'true':
-                    value = True
-                elif value.lower() == 'false':
-                    value = False
-                
-                config_dict[key] = value
-                
-        return config_dict
-        
     def modify_time_left(self, username, operation, seconds):
         """
         Modify time left for a user using timekpra --settimeleft command
@@ -133,51 +330,20 @@ class SSHClient:
         if operation not in ['+', '-']:
             return False, "Invalid operation. Must be '+' or '-'"
         
-        client = None
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Load private key
-            if not os.path.exists(self.key_path):
-                return False, f"SSH private key not found at {self.key_path}"
-            
-            try:
-                private_key = paramiko.RSAKey.from_private_key_file(self.key_path)
-            except Exception as e:
-                return False, f"Failed to load SSH private key: {str(e)}"
-            
-            client.connect(
-                hostname=self.hostname,
-                username=self.username,
-                pkey=private_key,
-                port=self.port,
-                timeout=10
-            )
-            
-            command = f'timekpra --settimeleft {username} {operation} {seconds}'
-            stdin, stdout, stderr = client.exec_command(command)
-            
-            # Wait for command to complete
-            exit_status = stdout.channel.recv_exit_status()
-            
-            # Read output
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-            
+            with self._connection() as client:
+                command = f'timekpra --settimeleft {username} {operation} {seconds}'
+                exit_status, output, error = self._exec(client, command)
+                
             if exit_status == 0:
                 return True, f"Successfully modified time for {username}: {operation}{seconds} seconds"
             else:
                 return False, f"Error modifying time: {error}"
-            
+                
+        except SSHKeyError as e:
+            return False, str(e)
         except Exception as e:
             return False, f"Connection error: {str(e)}"
-        finally:
-            if client is not None:
-                try:
-                    client.close()
-                except Exception:
-                    pass
     
     def set_weekly_time_limits(self, username, schedule_dict):
         """
@@ -186,268 +352,225 @@ class SSHClient:
         
         Returns: (success, message)
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        client = None
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Load private key
-            if not os.path.exists(self.key_path):
-                return False, f"SSH private key not found at {self.key_path}"
-            
-            try:
-                private_key = paramiko.RSAKey.from_private_key_file(self.key_path)
-            except Exception as e:
-                return False, f"Failed to load SSH private key: {str(e)}"
-            
-            client.connect(
-                hostname=self.hostname,
-                username=self.username,
-                pkey=private_key,
-                port=self.port,
-                timeout=10
-            )
-            
-            # First, let's check what the current user configuration looks like
-            check_command = f'timekpra --userinfo {username}'
-            logger.info(f"Checking current user config: {check_command}")
-            stdin, stdout, stderr = client.exec_command(check_command)
-            exit_status = stdout.channel.recv_exit_status()
-            user_info = stdout.read().decode('utf-8')
-            logger.info(f"Current user info: {user_info}")
-            
-            # Step 1: Set allowed days (1=Monday, 7=Sunday)
-            # Find days that have time limits > 0
-            allowed_days = []
-            day_order = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            
-            for i, day in enumerate(day_order):
-                hours = schedule_dict.get(day, 0)
-                if hours > 0:
-                    allowed_days.append(str(i + 1))  # 1=Monday, 7=Sunday
-            
-            if not allowed_days:
-                logger.warning("No days with time limits > 0 found")
-                return False, "No days with time limits configured"
-            
-            # Set allowed days
-            allowed_days_string = ';'.join(allowed_days)
-            # Try without sudo first, then with sudo if needed
-            days_command = f'timekpra --setalloweddays {username} \'{allowed_days_string}\''
-            logger.info(f"Setting allowed days: {days_command}")
-            
-            stdin, stdout, stderr = client.exec_command(days_command)
-            exit_status = stdout.channel.recv_exit_status()
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-            
-            logger.info(f"Set allowed days - exit status: {exit_status}, output: {output}, error: {error}")
-            
-            if exit_status != 0:
-                logger.info("Trying with sudo...")
-                days_command = f'sudo timekpra --setalloweddays {username} \'{allowed_days_string}\''
-                logger.info(f"Setting allowed days with sudo: {days_command}")
+            with self._connection() as client:
+                # First, let's check what the current user configuration looks like
+                # Only worth a round trip when someone reads the debug log
+                if logger.isEnabledFor(logging.DEBUG):
+                    check_command = f'timekpra --userinfo {username}'
+                    exit_status, user_info, error = self._exec(client, check_command)
+                    logger.debug("Current user info: %s", user_info)
                 
-                stdin, stdout, stderr = client.exec_command(days_command)
-                exit_status = stdout.channel.recv_exit_status()
-                output = stdout.read().decode('utf-8')
-                error = stderr.read().decode('utf-8')
+                # Step 1: Set allowed days (1=Monday, 7=Sunday)
+                # Find days that have time limits > 0
+                allowed_days = []
+                day_order = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
                 
-                logger.info(f"Set allowed days with sudo - exit status: {exit_status}, output: {output}, error: {error}")
+                for i, day in enumerate(day_order):
+                    hours = schedule_dict.get(day, 0)
+                    if hours > 0:
+                        allowed_days.append(str(i + 1))  # 1=Monday, 7=Sunday
                 
-                if exit_status != 0:
-                    return False, f"Failed to set allowed days (tried with and without sudo): {error if error else output}"
-            
-            # Step 2: Set time limits for the allowed days only
-            time_limits = []
-            for i, day in enumerate(day_order):
-                hours = schedule_dict.get(day, 0)
-                if hours > 0:  # Only include days with limits
-                    seconds = int(hours * 3600)  # Convert to integer seconds
-                    time_limits.append(str(seconds))
-            
-            if time_limits:
-                time_limit_string = ';'.join(time_limits)
-                # Try without sudo first, then with sudo if needed  
-                limits_command = f'timekpra --settimelimits {username} \'{time_limit_string}\''
-                logger.info(f"Setting time limits: {limits_command}")
+                if not allowed_days:
+                    logger.warning("No days with time limits > 0 found")
+                    return False, "No days with time limits configured"
+                
+                # Set allowed days
+                allowed_days_string = ';'.join(allowed_days)
+                # Try without sudo first, then with sudo if needed
+                days_command = f'timekpra --setalloweddays {username} \'{allowed_days_string}\''
+                logger.debug("Setting allowed days: %s", days_command)
                 
-                stdin, stdout, stderr = client.exec_command(limits_command)
-                exit_status = stdout.channel.recv_exit_status()
-                output = stdout.read().decode('utf-8')
-                error = stderr.read().decode('utf-8')
+                exit_status, output, error = self._exec(client, days_command)
                 
-                logger.info(f"Set time limits - exit status: {exit_status}, output: {output}, error: {error}")
-                logger.info(f"DEBUG - schedule_dict received: {schedule_dict}")
-                logger.info(f"DEBUG - time_limits calculated: {time_limits}")
-                logger.info(f"DEBUG - allowed_days: {allowed_days}")
+                logger.debug("Set allowed days - exit status: %s, output: %s, error: %s", exit_status, output, error)
                 
                 if exit_status != 0:
-                    logger.info("Trying time limits with sudo...")
-                    limits_command = f'sudo timekpra --settimelimits {username} \'{time_limit_string}\''
-                    logger.info(f"Setting time limits with sudo: {limits_command}")
+                    logger.debug("Trying with sudo...")
+                    days_command = f'sudo timekpra --setalloweddays {username} \'{allowed_days_string}\''
+                    logger.debug("Setting allowed days with sudo: %s", days_command)
                     
-                    stdin, stdout, stderr = client.exec_command(limits_command)
-                    exit_status = stdout.channel.recv_exit_status()
-                    output = stdout.read().decode('utf-8')
-                    error = stderr.read().decode('utf-8')
+                    exit_status, output, error = self._exec(client, days_command)
                     
-                    logger.info(f"Set time limits with sudo - exit status: {exit_status}, output: {output}, error: {error}")
+                    logger.debug("Set allowed days with sudo - exit status: %s, output: %s, error: %s", exit_status, output, error)
                     
                     if exit_status != 0:
-                        return False, f"Failed to set time limits (tried with and without sudo): {error if error else output}"
-            
-            return True, f"Successfully configured daily time limits for {username}. Days: {allowed_days_string}, Limits: {time_limits}"
-            
+                        return False, f"Failed to set allowed days (tried with and without sudo): {error if error else output}"
+                
+                # Step 2: Set time limits for the allowed days only
+                time_limits = []
+                for i, day in enumerate(day_order):
+                    hours = schedule_dict.get(day, 0)
+                    if hours > 0:  # Only include days with limits
+                        seconds = int(hours * 3600)  # Convert to integer seconds
+                        time_limits.append(str(seconds))
+                
+                if time_limits:
+                    time_limit_string = ';'.join(time_limits)
+                    # Try without sudo first, then with sudo if needed  
+                    limits_command = f'timekpra --settimelimits {username} \'{time_limit_string}\''
+                    logger.debug("Setting time limits: %s", limits_command)
+                    
+                    exit_status, output, error = self._exec(client, limits_command)
+                    
+                    logger.debug("Set time limits - exit status: %s, output: %s, error: %s", exit_status, output, error)
+                    logger.debug("schedule_dict received: %s", schedule_dict)
+                    logger.debug("time_limits calculated: %s", time_limits)
+                    logger.debug("allowed_days: %s", allowed_days)
+                    
+                    if exit_status != 0:
+                        logger.debug("Trying time limits with sudo...")
+                        limits_command = f'sudo timekpra --settimelimits {username} \'{time_limit_string}\''
+                        logger.debug("Setting time limits with sudo: %s", limits_command)
+                        
+                        exit_status, output, error = self._exec(client, limits_command)
+                        
+                        logger.debug("Set time limits with sudo - exit status: %s, output: %s, error: %s", exit_status, output, error)
+                        
+                        if exit_status != 0:
+                            return False, f"Failed to set time limits (tried with and without sudo): {error if error else output}"
+                
+                return True, f"Successfully configured daily time limits for {username}. Days: {allowed_days_string}, Limits: {time_limits}"
+        except SSHKeyError as e:
+            return False, str(e)
         except Exception as e:
             logger.error(f"Exception in set_weekly_time_limits: {str(e)}")
             return False, f"Connection error: {str(e)}"
-        finally:
-            if client is not None:
-                try:
-                    client.close()
-                except Exception:
-                    pass
     
-    def set_allowed_hours(self, username, intervals_dict):
+    def set_allowed_hours(self, username, intervals_dict, days=None):
         """
         Set allowed hours for a user using timekpra --setallowedhours command.
         intervals_dict maps day_of_week (1-7) to a list of UserDailyTimeInterval objects.
+        days limits the update to those days (default: all seven).
 
         Returns: (success, message)
         """
-        import logging
-        logger = logging.getLogger(__name__)
+        day_order = sorted(days) if days else [1, 2, 3, 4, 5, 6, 7]  # Monday to Sunday
+        specs_by_day = {}
+        error_messages = []
+        for day_num in day_order:
+            day_intervals = intervals_dict.get(day_num, [])
+            # Accept both a single object (legacy) and a list
+            if not isinstance(day_intervals, list):
+                day_intervals = [day_intervals]
+            enabled = [iv for iv in day_intervals if iv and iv.is_enabled and iv.is_valid_interval()]
+            # Overlapping intervals are merged; specs come out ordered by hour
+            try:
+                specs_by_day[day_num] = compile_day([iv.get_bounds() for iv in enabled])
+            except IntervalError as e:
+                error_messages.append(f"{DAY_NAMES[day_num]}: {str(e)}")
         
-        client = None
+        return self.set_allowed_hour_specs(username, specs_by_day, error_messages)
+    
+    def set_allowed_hour_specs(self, username, specs_by_day, error_messages=None):
+        """
+        Send precompiled allowed hours (see src.intervals.compile_day) for the given days.
+        specs_by_day maps day_of_week (1-7) to a tuple of hour specs; an empty tuple allows the whole day.
+
+        Returns: (success, message)
+        """
+        error_messages = list(error_messages or [])
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Load private key
-            if not os.path.exists(self.key_path):
-                return False, f"SSH private key not found at {self.key_path}"
-            
-            try:
-                private_key = paramiko.RSAKey.from_private_key_file(self.key_path)
-            except Exception as e:
-                return False, f"Failed to load SSH private key: {str(e)}"
-            
-            client.connect(
-                hostname=self.hostname,
-                username=self.username,
-                pkey=private_key,
-                port=self.port,
-                timeout=10
-            )
-            
-            # Process intervals for each day
-            day_order = [1, 2, 3, 4, 5, 6, 7]  # Monday to Sunday
-            day_names = ['', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            
-            success_count = 0
-            error_messages = []
-            
-            for day_num in day_order:
-                day_name = day_names[day_num]
-                day_intervals = intervals_dict.get(day_num, [])
-                # Accept both a single object (legacy) and a list
-                if not isinstance(day_intervals, list):
-                    day_intervals = [day_intervals]
-                enabled = [iv for iv in day_intervals if iv and iv.is_enabled and iv.is_valid_interval()]
-
-                if enabled:
-                    # Merge hour specs from all intervals for this day
-                    all_specs = []
-                    for iv in enabled:
-                        specs = iv.to_timekpr_format()
-                        if specs:
-                            all_specs.extend(specs)
-                    # Sort by numeric hour prefix so the string is ordered
-                    all_specs.sort(key=lambda x: int(x.split('[')[0]))
-                    hour_specs = all_specs
+            with self._connection() as client:
+                success_count = 0
+                
+                for day_num in sorted(specs_by_day):
+                    day_name = DAY_NAMES[day_num]
+                    hour_specs = specs_by_day[day_num]
 
                     if hour_specs:
                         hour_string = ';'.join(hour_specs)
                         
                         # Try setting allowed hours for this specific day
                         hours_command = f'timekpra --setallowedhours {username} {day_num} \'{hour_string}\''
-                        logger.info(f"Setting allowed hours for {day_name}: {hours_command}")
+                        logger.debug("Setting allowed hours for %s: %s", day_name, hours_command)
                         
-                        stdin, stdout, stderr = client.exec_command(hours_command)
-                        exit_status = stdout.channel.recv_exit_status()
-                        output = stdout.read().decode('utf-8')
-                        error = stderr.read().decode('utf-8')
+                        exit_status, output, error = self._exec(client, hours_command)
                         
-                        logger.info(f"Set allowed hours for {day_name} - exit status: {exit_status}, output: {output}, error: {error}")
+                        logger.debug("Set allowed hours for %s - exit status: %s, output: %s, error: %s", day_name, exit_status, output, error)
                         
                         if exit_status != 0:
                             # Try with sudo
-                            logger.info(f"Trying with sudo for {day_name}...")
+                            logger.debug("Trying with sudo for %s...", day_name)
                             hours_command = f'sudo timekpra --setallowedhours {username} {day_num} \'{hour_string}\''
-                            logger.info(f"Setting allowed hours with sudo: {hours_command}")
+                            logger.debug("Setting allowed hours with sudo: %s", hours_command)
                             
-                            stdin, stdout, stderr = client.exec_command(hours_command)
-                            exit_status = stdout.channel.recv_exit_status()
-                            output = stdout.read().decode('utf-8')
-                            error = stderr.read().decode('utf-8')
+                            exit_status, output, error = self._exec(client, hours_command)
                             
-                            logger.info(f"Set allowed hours with sudo for {day_name} - exit status: {exit_status}, output: {output}, error: {error}")
+                            logger.debug("Set allowed hours with sudo for %s - exit status: %s, output: %s, error: %s", day_name, exit_status, output, error)
                             
                             if exit_status != 0:
                                 error_messages.append(f"{day_name}: {error if error else output}")
                                 continue
                         
                         success_count += 1
-                        logger.info(f"Successfully set allowed hours for {day_name}: {hour_string}")
-                else:
-                    # Clear allowed hours for this day (no interval or disabled)
-                    logger.info(f"Clearing allowed hours for {day_name} (no interval or disabled)")
-                    
-                    # Set full day access (0-23 hours) when interval is disabled
-                    # This allows unlimited access within the daily time limits
-                    full_day_hours = ';'.join([str(h) for h in range(24)])
-                    hours_command = f'timekpra --setallowedhours {username} {day_num} \'{full_day_hours}\''
-                    
-                    stdin, stdout, stderr = client.exec_command(hours_command)
-                    exit_status = stdout.channel.recv_exit_status()
-                    output = stdout.read().decode('utf-8')
-                    error = stderr.read().decode('utf-8')
-                    
-                    logger.info(f"Set full day access for {day_name} - exit status: {exit_status}, output: {output}, error: {error}")
-                    
-                    if exit_status != 0:
-                        # Try with sudo
-                        logger.info(f"Trying full day access with sudo for {day_name}...")
-                        hours_command = f'sudo timekpra --setallowedhours {username} {day_num} \'{full_day_hours}\''
-                        stdin, stdout, stderr = client.exec_command(hours_command)
-                        exit_status = stdout.channel.recv_exit_status()
-                        output = stdout.read().decode('utf-8')
-                        error = stderr.read().decode('utf-8')
+                        logger.debug("Successfully set allowed hours for %s: %s", day_name, hour_string)
+                    else:
+                        # Clear allowed hours for this day (no interval or disabled)
+                        logger.debug("Clearing allowed hours for %s (no interval or disabled)", day_name)
+                        
+                        # Set full day access (0-23 hours) when interval is disabled
+                        # This allows unlimited access within the daily time limits
+                        full_day_hours = ';'.join([str(h) for h in range(24)])
+                        hours_command = f'timekpra --setallowedhours {username} {day_num} \'{full_day_hours}\''
                         
-                        logger.info(f"Set full day access with sudo for {day_name} - exit status: {exit_status}, output: {output}, error: {error}")
+                        exit_status, output, error = self._exec(client, hours_command)
+                        
+                        logger.debug("Set full day access for %s - exit status: %s, output: %s, error: %s", day_name, exit_status, output, error)
                         
                         if exit_status != 0:
-                            error_messages.append(f"{day_name}: Failed to set full day access - {error if error else output}")
-                            continue
-                    
-                    logger.info(f"Successfully set full day access for {day_name}")
-                    success_count += 1  # Count disabled days as successful too
-            
-            if success_count > 0 or not error_messages:
-                return True, f"Successfully configured allowed hours for {username}. Days configured: {success_count}/7"
-            else:
-                return False, f"Failed to configure allowed hours: {'; '.join(error_messages)}"
-            
+                            # Try with sudo
+                            logger.debug("Trying full day access with sudo for %s...", day_name)
+                            hours_command = f'sudo timekpra --setallowedhours {username} {day_num} \'{full_day_hours}\''
+                            exit_status, output, error = self._exec(client, hours_command)
+                            
+                            logger.debug("Set full day access with sudo for %s - exit status: %s, output: %s, error: %s", day_name, exit_status, output, error)
+                            
+                            if exit_status != 0:
+                                error_messages.append(f"{day_name}: Failed to set full day access - {error if error else output}")
+                                continue
+                        
+                        logger.debug("Successfully set full day access for %s", day_name)
+                        success_count += 1  # Count disabled days as successful too
+                
+                if success_count > 0 or not error_messages:
+                    return True, f"Successfully configured allowed hours for {username}. Days configured: {success_count}/{len(specs_by_day) + len(error_messages)}"
+                else:
+                    return False, f"Failed to configure allowed hours: {'; '.join(error_messages)}"
+        except SSHKeyError as e:
+            return False, str(e)
         except Exception as e:
             logger.error(f"Exception in set_allowed_hours: {str(e)}")
             return False, f"Connection error: {str(e)}"
-        finally:
-            if client is not None:
-                try:
-                    client.close()
-                except Exception:
-                    pass
\ No newline at end of file
+
+
+class SSHSessionPool:
+    """
+    Persistent SSHClient per host, shared by the poll cycle and queued jobs
+    so a reachable host is only connected to once. Not thread-safe: owned by
+    the background task thread.
+    """
+    def __init__(self, idle_timeout=60):
+        self.idle_timeout = idle_timeout  # Seconds before an unused session is closed
+        self._clients = {}
+    
+    def get(self, hostname):
+        """Get the persistent client for a host, connecting lazily on first command"""
+        client = self._clients.get(hostname)
+        if client is None:
+            client = SSHClient(hostname=hostname, persistent=True)
+            self._clients[hostname] = client
+        return client
+    
+    def close_idle(self):
+        """Close sessions that have not been used within idle_timeout"""
+        now = time.time()
+        for hostname, client in list(self._clients.items()):
+            if client.last_used is None or now - client.last_used > self.idle_timeout:
+                client.close()
+                del self._clients[hostname]
+    
+    def close_all(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
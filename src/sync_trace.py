@@ -0,0 +1,152 @@
+"""
+Structured per-user sync traces.
+
+Each poll cycle produces one trace per user it touched: phase timings
+(deliver, poll, store, policy), every remote command with its exit
+status, duration and bytes sent/received, and the outcome. Traces are
+kept in a bounded in-memory ring buffer (TRACE_RING_SIZE) and served by
+/api/sync-traces, so the log only needs one summary line per cycle.
+
+The trace being filled is thread-local: SSHClient reports commands via
+record_command() without knowing which user they belong to, and the
+parallel per-host workers each fill their own traces. Deliveries outside
+a poll cycle (bulk requests, time adjustment jobs) run inside delivery(),
+which likewise keeps one trace per user until the delivery ends.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_RING_SIZE = 2000  # Traces kept in memory
+MAX_COMMAND_LENGTH = 200  # Longer command lines are truncated in traces
+
+
+class SyncTracer:
+    def __init__(self, size=TRACE_RING_SIZE):
+        self._ring = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cycle = 0
+        self._cycle_started = None
+        self._open = {}  # user id -> trace of the running cycle
+
+    def start_cycle(self):
+        """Begin collecting traces for a new poll cycle. Returns its number."""
+        with self._lock:
+            self._cycle += 1
+            self._cycle_started = time.perf_counter()
+            self._open = {}
+            return self._cycle
+
+    def finish_cycle(self):
+        """Move the cycle's traces to the ring buffer. Returns summary counts."""
+        with self._lock:
+            traces = list(self._open.values())
+            self._ring.extend(traces)
+            self._open = {}
+            started, self._cycle_started = self._cycle_started, None
+        results = {}
+        for trace in traces:
+            results[trace['result']] = results.get(trace['result'], 0) + 1
+        return {
+            'cycle': self._cycle,
+            'seconds': time.perf_counter() - started if started else 0.0,
+            'users': len(traces),
+            'hosts': len({trace['host'] for trace in traces}),
+            'commands': sum(len(trace['commands']) for trace in traces),
+            'results': results,
+        }
+
+    @contextmanager
+    def delivery(self):
+        """Collect one trace per user for an out-of-cycle delivery; they are kept when it ends"""
+        if getattr(self._local, 'delivery', None) is not None:
+            yield  # Nested: the outer delivery keeps the traces
+            return
+        self._local.delivery = {}
+        try:
+            yield
+        finally:
+            traces, self._local.delivery = self._local.delivery, None
+            with self._lock:
+                self._ring.extend(traces.values())
+
+    def _trace_for(self, user_id, username, host):
+        """The user's open trace, or a new one. Returns: (trace, whether to keep it right away)"""
+        with self._lock:
+            in_cycle = self._cycle_started is not None
+            # A running cycle collects every trace, including deliveries made during it
+            open_traces = self._open if in_cycle else getattr(self._local, 'delivery', None)
+            trace = open_traces.get(user_id) if open_traces is not None else None
+            if trace is None:
+                trace = {
+                    'cycle': self._cycle if in_cycle else None,
+                    'user_id': user_id,
+                    'username': username,
+                    'host': host,
+                    'started': datetime.utcnow().isoformat(),
+                    'result': 'ok',
+                    'error': None,
+                    'phases': {},
+                    'commands': [],
+                }
+                if open_traces is not None:
+                    open_traces[user_id] = trace
+            return trace, open_traces is None
+
+    @contextmanager
+    def phase(self, user_id, username, host, name):
+        """Time a phase of a user's sync; remote commands run inside it are attached to the trace"""
+        trace, keep = self._trace_for(user_id, username, host)
+        previous = getattr(self._local, 'trace', None)
+        self._local.trace = trace
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            trace['phases'][name] = round(trace['phases'].get(name, 0) + elapsed, 2)
+            self._local.trace = previous
+            if keep:
+                # Outside a poll cycle and delivery: nothing else will add to it
+                with self._lock:
+                    self._ring.append(trace)
+
+    def mark(self, user_id, username, host, result, error=None):
+        """Set the outcome of a user's sync in this cycle (ok, failed, offline, pushed, error)"""
+        trace, keep = self._trace_for(user_id, username, host)
+        trace['result'] = result
+        trace['error'] = error
+        if keep:
+            with self._lock:
+                self._ring.append(trace)
+
+    def record_command(self, command, exit_status, seconds, bytes_sent, bytes_received):
+        """Attach a remote command to the trace of the current thread, if any"""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        trace['commands'].append({
+            'command': command[:MAX_COMMAND_LENGTH],
+            'exit_status': exit_status,
+            'ms': round(seconds * 1000, 2),
+            'bytes_sent': bytes_sent,
+            'bytes_received': bytes_received,
+        })
+
+    def traces(self, user_id=None, limit=100):
+        """Finished traces, newest first"""
+        with self._lock:
+            ring = list(self._ring)
+        result = []
+        for trace in reversed(ring):
+            if user_id is None or trace['user_id'] == user_id:
+                result.append(trace)
+                if len(result) >= limit:
+                    break
+        return result
+
+
+tracer = SyncTracer()
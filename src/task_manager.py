@@ -1,24 +1,44 @@
+import os
 import threading
 import time
 import sqlite3
-from datetime import datetime, date
+from datetime import datetime, timedelta
 import logging
 import json
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.database import (
     db,
     ManagedUser,
-    UserTimeUsage,
     Settings,
     UserWeeklySchedule,
-    UserDailyTimeInterval,
-    coerce_time_spent_day,
+    Job,
+    RemoteCommand,
+    Agent,
 )
-from src.ssh_helper import SSHClient
+from src.ssh_helper import SSHClient, SSHSessionPool
+from src.archiver import archive_usage
+from src.events import broker
+from src.intervals import compile_day
+from src import metrics
+from src.cycle_profiles import CycleProfiler
+from src.sync_trace import tracer
 
 logger = logging.getLogger(__name__)
 
+POLL_INTERVAL = 10  # Seconds between user data update cycles
+WEEK_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+ARCHIVE_INTERVAL = 24 * 3600  # Seconds between usage archival runs
+JOB_RETENTION = 24 * 3600  # Seconds finished jobs are kept for status lookups
+BULK_WORKERS = 8  # Computers contacted in parallel by bulk operations
+AGENT_STALE_AFTER = 180  # Seconds without an agent push before polling a computer again
+
+def has_positive_limits(schedule_dict):
+    """True when at least one day has a time limit to push"""
+    return any((schedule_dict.get(d, 0) or 0) > 0 for d in WEEK_DAYS)
+
+
 class BackgroundTaskManager:
     def __init__(self, app=None):
         self.app = app
@@ -26,9 +46,20 @@ class BackgroundTaskManager:
         self.thread = None
         self.last_error = None
         self._task_lock = threading.Lock()  # Add a lock to prevent concurrent executions
+        self._last_archive = None  # Time of the last usage archival run
+        self._published_status = None  # Last task status pushed to live clients
+        self._wakeup = threading.Event()  # Set when a job is queued or the loop should stop
+        self.sessions = SSHSessionPool()  # SSH sessions reused across cycles and jobs
+        self._host_locks = {}  # One delivery at a time per computer (task loop vs bulk requests)
+        self._host_locks_guard = threading.Lock()
+        self._policy_batches = {}  # (policy id, revision) -> compiled push batch
+        self.cycle_profiler = CycleProfiler()  # On-demand cProfile captures of poll cycles
+        if app is not None:
+            self.init_app(app)
     
     def init_app(self, app):
         self.app = app
+        self.cycle_profiler.directory = os.path.join(app.instance_path, 'profiles')
     
     def start(self):
         """Start the background task manager"""
@@ -40,11 +71,13 @@ class BackgroundTaskManager:
         self.thread = threading.Thread(target=self._run_tasks, daemon=True)
         self.thread.start()
         logger.info("Background task manager started with thread ID: %s", self.thread.ident)
+        self._publish_status()
     
     def stop(self):
         """Stop the background task manager"""
         logger.info("Stopping background task manager...")
         self.running = False
+        self._wakeup.set()
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5)
             if self.thread.is_alive():
@@ -52,6 +85,7 @@ class BackgroundTaskManager:
             else:
                 logger.info("Thread stopped successfully")
         logger.info("Background task manager stopped")
+        self._publish_status()
     
     def restart(self):
         """Restart the background task manager"""
@@ -60,41 +94,65 @@ class BackgroundTaskManager:
         time.sleep(1)  # Give it a moment to fully stop
         self.start()
         logger.info("Background task manager restarted")
+    
+    def wake(self):
+        """Signal the task loop that a job was queued so it runs without waiting for the next cycle"""
+        self._wakeup.set()
         
     def get_status(self):
         """Get the status of the background task manager"""
-        status = {
+        status = self._build_status()
+        logger.debug("Task manager status: %s", status)
+        return status
+    
+    def _build_status(self):
+        return {
             'running': self.running,
             'thread_alive': self.thread.is_alive() if self.thread else False,
             'last_error': self.last_error,
             'thread_id': self.thread.ident if self.thread else None
         }
-        logger.info("Task manager status: %s", status)
-        return status
+    
+    def _publish_status(self):
+        """Push a task_status event to live clients when the status changed"""
+        status = self._build_status()
+        if status != self._published_status:
+            self._published_status = status
+            broker.publish('task_status', {'status': status})
     
     def _run_tasks(self):
         """Main task loop"""
         logger.info("Task loop started in thread ID: %s", threading.current_thread().ident)
+        if self.app:
+            with self.app.app_context():
+                self._requeue_interrupted_jobs()
+        last_cycle = 0
         while self.running:
             try:
                 # Only process tasks if we can acquire the lock
                 if self._task_lock.acquire(blocking=False):
                     try:
-                        logger.info("Starting task execution cycle")
                         # Use a fresh app context
                         if self.app:
                             with self.app.app_context():
-                                logger.info("Updating user data")
-                                self._update_user_data()
-                                logger.info("User data update cycle complete")
+                                self._process_jobs()
+                                if time.time() - last_cycle >= POLL_INTERVAL:
+                                    last_cycle = time.time()
+                                    rows_before = metrics.thread_rows_written()
+                                    with self.cycle_profiler.cycle():
+                                        with metrics.cycle_duration.time():
+                                            self._update_user_data()
+                                        self._maybe_run_maintenance()
+                                    metrics.cycle_rows_written.observe(metrics.thread_rows_written() - rows_before)
+                                    self.last_error = None  # Clear error on successful run
+                                    logger.debug("Next cycle in %d seconds", POLL_INTERVAL)
+                                self.sessions.close_idle()
                         else:
                             logger.error("App is not initialized in task manager")
-                        
-                        self.last_error = None  # Clear error on successful run
                     finally:
                         self._task_lock.release()
                 else:
-                    logger.info("Task already running, skipping this cycle")
+                    logger.debug("Task already running, skipping this cycle")
             except Exception as e:
                 if self._task_lock.locked():
                     self._task_lock.release()
@@ -106,183 +164,466 @@ class BackgroundTaskManager:
                     'trace': trace,
                     'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
+            self._publish_status()
             
-            # Sleep for 10 seconds before next run
-            logger.info("Task cycle finished, sleeping for 10 seconds")
-            for i in range(10):
-                if not self.running:
-                    logger.info("Task loop stopping during sleep")
-                    break
-                time.sleep(1)
+            # Sleep until the next check, waking up early when a job is queued
+            self._wakeup.wait(timeout=1)
+        
+        self.sessions.close_all()
+        logger.info("Task loop stopped")
+    
+    def _requeue_interrupted_jobs(self):
+        """Jobs left running by a previous process never finished: run them again"""
+        Job.query.filter_by(status=Job.RUNNING).update({'status': Job.QUEUED})
+        db.session.commit()
+    
+    def _process_jobs(self):
+        """Run all queued jobs in submission order"""
+        self._wakeup.clear()
+        while self.running:
+            job = Job.query.filter_by(status=Job.QUEUED).order_by(Job.id).first()
+            if job is None:
+                return
+            self._run_job(job)
+    
+    def _run_job(self, job):
+        """Execute one job and record its outcome"""
+        logger.info("Running job %d (%s) for user %s", job.id, job.kind, job.user_id)
+        job.status = Job.RUNNING
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        
+        handlers = {
+            'modify_time': self._job_modify_time,
+            'validate_user': self._job_validate_user,
+        }
+        try:
+            handler = handlers.get(job.kind)
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            user = db.session.get(ManagedUser, job.user_id) if job.user_id else None
+            if user is None:
+                raise ValueError("User no longer exists")
+            status, message, result = handler(job, user)
+        except Exception as e:
+            logger.error(f"Error running job {job.id}: {str(e)}\n{traceback.format_exc()}")
+            db.session.rollback()
+            status, message, result = Job.FAILED, str(e), None
+        
+        job.status = status
+        job.message = message
+        job.result = json.dumps(result) if result is not None else None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info("Job %d finished: %s", job.id, status)
+        broker.publish('job_completed', job.to_dict())
+        if job.user_id:
+            broker.publish('user_updated', {'user_id': job.user_id})
+    
+    def _job_modify_time(self, job, user):
+        """Queue a time adjustment in the outbox and try to deliver it right away"""
+        payload = job.get_payload()
+        operation, seconds = payload['operation'], payload['seconds']
+        
+        RemoteCommand.queue_time_adjustment(user, operation, seconds)
+        user.bump_revision()
+        db.session.commit()
+        
+        reachable = self._deliver_outbox(user.system_ip)
+        pending = RemoteCommand.query.filter_by(user_id=user.id, kind=RemoteCommand.TIME_ADJUSTMENT).first()
+        if pending is None:
+            if reachable:
+                # Update user info to reflect changes
+                is_valid, _, info = self.sessions.get(user.system_ip).validate_user(user.username)
+                if is_valid and info:
+                    user.record_user_info(info)
+                    db.session.commit()
+            return Job.DONE, f"Successfully modified time for {user.username}: {operation}{seconds} seconds", {'pending': False}
+        
+        net_operation, net_seconds = pending.get_operation()
+        return Job.DONE, (
+            f"Computer seems to be offline. Time adjustment of {net_operation}{net_seconds} seconds "
+            f"has been queued and will be applied when the computer comes online."
+        ), {'pending': True}
+    
+    def _job_validate_user(self, job, user):
+        """Check that the user exists on the remote system and store its config"""
+        is_valid, message, info = self.sessions.get(user.system_ip).validate_user(user.username)
+        
+        if is_valid and info:
+            user.record_user_info(info)
+            db.session.commit()
+            return Job.DONE, f'User {user.username} validated successfully', {'is_valid': True}
+        
+        user.is_valid = False
+        user.last_checked = datetime.utcnow()
+        user.bump_revision()
+        db.session.commit()
+        return Job.FAILED, f'User validation failed: {message}', {'is_valid': False}
     
+    def _maybe_run_maintenance(self):
+        """Archive cold usage history and purge old jobs at most once a day"""
+        if self._last_archive and time.time() - self._last_archive < ARCHIVE_INTERVAL:
+            return
+        self._last_archive = time.time()
+        try:
+            archive_usage()
+        except Exception as e:
+            logger.error(f"Error archiving usage history: {str(e)}\n{traceback.format_exc()}")
+            db.session.rollback()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=JOB_RETENTION)
+            Job.query.filter(Job.status.in_([Job.DONE, Job.FAILED]), Job.finished_at < cutoff).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error purging finished jobs: {str(e)}")
+            db.session.rollback()
+
     def _update_user_data(self):
-        """Update data for all valid users"""
+        """Deliver queued commands and update data for all users, one computer at a time"""
+        tracer.start_cycle()
         try:
             # Get all users with SQLAlchemy in a single query
             users = ManagedUser.query.all()
-            logger.info("Found %d users in database", len(users))
-
+            logger.debug("Found %d users in database", len(users))
+            
+            self._sync_policies()
+            self._queue_missing_pushes()
+            
+            pushing_hosts = {
+                agent.system_ip for agent in Agent.query.filter_by(disable_polling=True).all()
+                if agent.is_pushing(AGENT_STALE_AFTER)
+            }
+            
+            hosts = {}
             for user in users:
-                try:
-                    logger.info("Processing user: %s @ %s", user.username, user.system_ip)
-                    
-                    # Connect to the system and get user info - use SSH key authentication
-                    ssh_client = SSHClient(hostname=user.system_ip)
-                    
-                    # Check if there's a pending time adjustment
-                    if user.pending_time_adjustment is not None and user.pending_time_operation is not None:
-                        logger.info(f"Attempting to apply pending time adjustment for {user.username}: {user.pending_time_operation}{user.pending_time_adjustment} seconds")
-                        
-                        success, message = ssh_client.modify_time_left(
-                            user.username, 
-                            user.pending_time_operation, 
-                            user.pending_time_adjustment
-                        )
-                        
-                        if success:
-                            logger.info(f"Successfully applied pending time adjustment for {user.username}")
-                            # Clear the pending adjustment immediately
-                            user.pending_time_adjustment = None
-                            user.pending_time_operation = None
-                            db.session.commit()
-                            logger.info("Cleared pending adjustment in database")
-                        else:
-                            logger.warning(f"Failed to apply pending time adjustment for {user.username}: {message}")
-                    else:
-                        logger.info(f"No pending time adjustment for {user.username}")
-                    
-                    # Check if there's a pending weekly schedule sync
-                    if user.weekly_schedule and not user.weekly_schedule.is_synced:
-                        schedule_dict = user.weekly_schedule.get_schedule_dict()
-                        logger.info(f"DEBUG - schedule_dict from database: {schedule_dict}")
-                        _week_days = (
-                            'monday', 'tuesday', 'wednesday', 'thursday',
-                            'friday', 'saturday', 'sunday',
-                        )
-                        has_positive_limits = any(
-                            (schedule_dict.get(d, 0) or 0) > 0 for d in _week_days
-                        )
-                        # set_weekly_time_limits rejects "all zero" — nothing to push; avoid endless WARNING loop
-                        if not has_positive_limits:
-                            logger.info(
-                                "No daily limits > 0 in UI for %s; marking weekly schedule synced (remote unchanged)",
-                                user.username,
-                            )
-                            user.weekly_schedule.mark_synced()
-                            db.session.commit()
-                        else:
-                            logger.info(f"Attempting to sync weekly schedule for {user.username}")
-                            success, message = ssh_client.set_weekly_time_limits(
-                                user.username, schedule_dict
-                            )
-                            if success:
-                                logger.info(f"Successfully synced weekly schedule for {user.username}")
-                                user.weekly_schedule.mark_synced()
-                                db.session.commit()
-                                logger.info("Marked weekly schedule as synced in database")
-                            else:
-                                logger.warning(
-                                    f"Failed to sync weekly schedule for {user.username}: {message}"
-                                )
-                    else:
-                        if user.weekly_schedule:
-                            logger.info(f"Weekly schedule already synced for {user.username}")
-                        else:
-                            logger.info(f"No weekly schedule configured for {user.username}")
-                    
-                    # Check if there are pending time interval syncs
-                    unsynced_intervals = UserDailyTimeInterval.query.filter_by(
-                        user_id=user.id,
-                        is_synced=False
-                    ).all()
-                    
-                    if unsynced_intervals:
-                        logger.info(f"Attempting to sync {len(unsynced_intervals)} time intervals for {user.username}")
-                        
-                        # Build intervals dict for SSH command (list per day)
-                        intervals_dict = {}
-                        for interval in user.time_intervals:
-                            intervals_dict.setdefault(interval.day_of_week, []).append(interval)
-                        
-                        success, message = ssh_client.set_allowed_hours(user.username, intervals_dict)
-                        
-                        if success:
-                            logger.info(f"Successfully synced time intervals for {user.username}")
-                            # Mark all intervals as synced
-                            for interval in unsynced_intervals:
-                                interval.mark_synced()
-                            db.session.commit()
-                            logger.info("Marked time intervals as synced in database")
-                        else:
-                            logger.warning(f"Failed to sync time intervals for {user.username}: {message}")
-                    else:
-                        logger.info(f"No pending time interval syncs for {user.username}")
-                    
-                    # Then update user info
-                    logger.info("Validating user %s", user.username)
-                    try:
-                        is_valid, result_message, config_dict = ssh_client.validate_user(user.username)
-                        logger.info("Validation result for %s: %s", user.username, is_valid)
-                        
-                        if is_valid and config_dict:
-                            # Update the last checked time
-                            user.last_checked = datetime.utcnow()
-                            user.last_config = json.dumps(config_dict)
-                            user.is_valid = True  # Ensure is_valid is set to True
-                            
-                            # Update or create today's usage data
-                            today = date.today()
-                            time_spent = coerce_time_spent_day(config_dict.get('TIME_SPENT_DAY', 0))
-                            
-                            # Look for an existing record for today
-                            usage = UserTimeUsage.query.filter_by(
-                                user_id=user.id,
-                                date=today
-                            ).first()
-                            
-                            if usage:
-                                usage.time_spent = time_spent
-                                logger.info(f"Updated existing usage record for {user.username}, time_spent={time_spent}")
-                            else:
-                                # Create a new record
-                                usage = UserTimeUsage(
-                                    user_id=user.id,
-                                    date=today,
-                                    time_spent=time_spent
-                                )
-                                db.session.add(usage)
-                                logger.info(f"Created new usage record for {user.username}, time_spent={time_spent}")
-                            
-                            # Make sure to commit after each user update
-                            db.session.commit()
-                            logger.info(f"Database committed for {user.username}")
-                        else:
-                            # Just update the last checked time
-                            user.last_checked = datetime.utcnow()
-                            
-                            # Don't change is_valid status for temporary failures
-                            # This allows the user to stay visible on the dashboard
-                            # Only set is_valid to False during the initial validation
-                            if not user.is_valid and is_valid:
-                                # If the user was previously invalid but is now valid, update status
-                                user.is_valid = True
-                            
-                            db.session.commit()
-                            logger.warning(f"Failed to get data for {user.username}, keeping previous valid status")
-                    except Exception as e:
-                        # Connection error (e.g., PC is offline)
-                        logger.error(f"Connection error for user {user.username}: {str(e)}")
-                        
-                        # Update the last checked time but don't change validation status
+                hosts.setdefault(user.system_ip, []).append(user)
+            
+            for hostname, host_users in hosts.items():
+                # Don't keep interactive jobs waiting behind a long cycle
+                if self._wakeup.is_set():
+                    self._process_jobs()
+                
+                if not self._deliver_outbox(hostname):
+                    # Offline: don't try to connect again for every user
+                    for user in host_users:
                         user.last_checked = datetime.utcnow()
-                        db.session.commit()
-                        logger.info(f"Updated last_checked time for {user.username} but kept validation status")
+                        tracer.mark(user.id, user.username, hostname, 'offline')
+                    db.session.commit()
+                    logger.debug("%s is unreachable, skipping its users this cycle", hostname)
+                    continue
                 
+                if hostname in pushing_hosts:
+                    # Its agent pushes user info; SSH is only needed for queued commands
+                    for user in host_users:
+                        tracer.mark(user.id, user.username, hostname, 'pushed')
+                    logger.debug("Skipping polling for %s, agent is pushing", hostname)
+                    continue
+                for user in host_users:
+                    self._refresh_user(user)
+                    
+        except Exception as e:
+            logger.error(f"Error in user data update: {str(e)}\n{traceback.format_exc()}")
+            db.session.rollback()
+        finally:
+            summary = tracer.finish_cycle()
+            results = summary['results']
+            logger.info(
+                "Sync cycle %d: %d users on %d computers in %.2fs (%d commands, %d offline, %d errors)",
+                summary['cycle'], summary['users'], summary['hosts'], summary['seconds'], summary['commands'],
+                results.get('offline', 0), results.get('failed', 0) + results.get('error', 0),
+            )
+    
+    def _sync_policies(self):
+        """
+        Push changed schedule policies to their dirty subscribers. Each policy revision is
+        compiled once and sent to all affected computers in parallel.
+        """
+        queued = db.session.query(RemoteCommand.id).filter(
+            RemoteCommand.user_id == ManagedUser.id,
+            RemoteCommand.kind.in_(RemoteCommand.PUSH_KINDS),
+        ).exists()
+        users = ManagedUser.query_needs_sync().filter(
+            ManagedUser.policy_id.isnot(None),
+            ManagedUser.override_limits == False,
+            ManagedUser.override_intervals == False,
+            ~queued,
+        ).all()
+        if not users:
+            return
+        
+        work = {}
+        for user in users:
+            batch = self._policy_batch(user.policy)
+            work.setdefault(user.system_ip, []).append((user.id, user.username, user.desired_revision, batch))
+        logger.info("Pushing schedule policies to %d users on %d computers", len(users), len(work))
+        
+        def push(hostname, ssh_client):
+            return self._push_policy_batches(ssh_client, work[hostname])
+        
+        for hostname, reachable in self._for_each_host(list(work), push):
+            if not reachable:
+                logger.warning("Policy push to %s incomplete, retrying next cycle", hostname)
+        # Pushes were recorded by other sessions
+        db.session.expire_all()
+    
+    def _policy_batch(self, policy):
+        """(weekly limits, allowed hour specs per day) for a policy revision, compiled once"""
+        key = (policy.id, policy.revision)
+        batch = self._policy_batches.get(key)
+        if batch is None:
+            intervals_by_day = {}
+            for interval in policy.intervals:
+                intervals_by_day.setdefault(interval.day_of_week, []).append(interval.get_bounds())
+            specs_by_day = {day: compile_day(intervals_by_day.get(day, [])) for day in range(1, 8)}
+            batch = (policy.get_schedule_dict(), specs_by_day)
+            # Older revisions of this policy will not be pushed again
+            for old_key in [k for k in self._policy_batches if k[0] == policy.id]:
+                del self._policy_batches[old_key]
+            self._policy_batches[key] = batch
+        return batch
+    
+    def _push_policy_batches(self, ssh_client, entries):
+        """
+        Send compiled policy batches to users of one computer.
+        Returns: False when the computer could not be reached
+        """
+        for user_id, username, revision, (limits, specs_by_day) in entries:
+            with tracer.phase(user_id, username, ssh_client.address, 'policy'):
+                if has_positive_limits(limits):
+                    success, message = ssh_client.set_weekly_time_limits(username, limits)
+                else:
+                    success, message = True, "No daily limits > 0 in policy; remote unchanged"
+                if success:
+                    success, message = ssh_client.set_allowed_hour_specs(username, specs_by_day)
+            
+            if not success:
+                tracer.mark(user_id, username, ssh_client.address, 'failed', message)
+                logger.warning(f"Failed to push schedule policy for {username}: {message}")
+                if not ssh_client.is_connected():
+                    return False
+                continue
+            
+            user = db.session.get(ManagedUser, user_id)
+            if user is None:
+                continue
+            user.mark_applied(revision)
+            user.bump_revision()
+            db.session.commit()
+            logger.debug("Pushed schedule policy for %s", username)
+            broker.publish('sync_completed', {'user_id': user_id, 'kind': 'policy'})
+        return True
+    
+    def _queue_missing_pushes(self):
+        """
+        Users with config changes no queued push covers (policy edits, policy (un)subscription,
+        data from before the outbox) get a full push of schedule and intervals
+        """
+        covered = db.session.query(RemoteCommand.id).filter(
+            RemoteCommand.user_id == ManagedUser.id,
+            RemoteCommand.kind.in_(RemoteCommand.PUSH_KINDS),
+            RemoteCommand.revision >= ManagedUser.desired_revision,
+        ).exists()
+        users = ManagedUser.query_needs_sync().filter(
+            ~covered,
+            # Plain policy subscribers are handled by _sync_policies
+            db.or_(
+                ManagedUser.policy_id.is_(None),
+                ManagedUser.override_limits == True,
+                ManagedUser.override_intervals == True,
+            ),
+        ).all()
+        for user in users:
+            logger.info("Queueing a full config push for %s", user.username)
+            RemoteCommand.queue_push(user, RemoteCommand.WEEKLY_LIMITS)
+            RemoteCommand.queue_push(user, RemoteCommand.ALLOWED_HOURS)
+        if users:
+            db.session.commit()
+    
+    def deliver_now(self, hostnames, max_workers=BULK_WORKERS):
+        """
+        Deliver the outbox of several computers in parallel, one SSH connection per computer.
+        Runs in the calling thread (e.g. a bulk API request), not the task loop.
+        Yields (hostname, reachable) as each computer finishes.
+        """
+        return self._for_each_host(hostnames, self._deliver_host_commands, max_workers)
+    
+    def _for_each_host(self, hostnames, work, max_workers=BULK_WORKERS):
+        """
+        Run work(hostname, ssh_client) for several computers in parallel, each in its own
+        app context and SSH connection, holding the computer's delivery lock.
+        Yields (hostname, result) as each computer finishes; result is False on error.
+        """
+        def run(hostname):
+            with self.app.app_context():
+                try:
+                    with self._host_lock(hostname), SSHClient(hostname=hostname) as ssh_client:
+                        return hostname, work(hostname, ssh_client)
                 except Exception as e:
-                    logger.error(f"Error updating user {user.username}: {str(e)}\n{traceback.format_exc()}")
-                    # Continue with the next user, but make sure we commit any pending changes
+                    logger.error(f"Error talking to {hostname}: {str(e)}\n{traceback.format_exc()}")
                     db.session.rollback()
+                    return hostname, False
+        
+        if not hostnames:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hostnames))) as executor:
+            futures = [executor.submit(run, hostname) for hostname in hostnames]
+            for future in as_completed(futures):
+                yield future.result()
+    
+    def _host_lock(self, hostname):
+        """Lock serialising outbox delivery to one computer across threads"""
+        with self._host_locks_guard:
+            return self._host_locks.setdefault(hostname, threading.Lock())
+    
+    def _deliver_outbox(self, hostname, ssh_client=None):
+        """
+        Deliver every queued command for a computer, in sequence order, over one SSH session.
+        Returns: False when the computer could not be reached
+        """
+        with self._host_lock(hostname):
+            return self._deliver_host_commands(hostname, ssh_client or self.sessions.get(hostname))
+    
+    def _deliver_host_commands(self, hostname, ssh_client):
+        # Outside a poll cycle, one trace per user for the whole delivery
+        with tracer.delivery():
+            return self._deliver_commands(hostname, ssh_client)
+    
+    def _deliver_commands(self, hostname, ssh_client):
+        commands = RemoteCommand.query.join(ManagedUser).filter(
+            ManagedUser.system_ip == hostname
+        ).order_by(RemoteCommand.id).all()
+        if not commands:
+            return True
+        
+        logger.debug("Delivering %d queued commands to %s", len(commands), hostname)
+        delivered_revisions = {}  # user id -> highest config revision delivered in this run
+        for command in commands:
+            user, kind = command.user, command.kind
+            # What is being sent; the command may change while we are talking to the computer
+            sent = (command.seconds, command.updated_at)
+            days, revision = command.get_days(), command.revision
+            try:
+                with tracer.phase(user.id, user.username, hostname, 'deliver'):
+                    success, message = self._send_command(ssh_client, command)
+            except Exception as e:
+                logger.error(f"Error delivering {kind} for {user.username}: {str(e)}\n{traceback.format_exc()}")
+                db.session.rollback()
+                success, message = False, str(e)
+            
+            if not success:
+                tracer.mark(user.id, user.username, hostname, 'failed', message)
+                metrics.command_failures.inc(kind)
+                command.attempts += 1
+                command.last_error = message
+                db.session.commit()
+                logger.warning(f"Failed to deliver {kind} for {user.username}: {message}")
+                if not ssh_client.is_connected():
+                    # Later commands wait so they still apply in order once the computer is back
+                    return False
+                continue
+            
+            logger.debug("Delivered %s for %s: %s", kind, user.username, message)
+            if command.acknowledge(sent):
+                if kind == RemoteCommand.WEEKLY_LIMITS and user.weekly_schedule:
+                    user.weekly_schedule.mark_synced()
+                elif kind == RemoteCommand.ALLOWED_HOURS:
+                    for interval in user.time_intervals:
+                        if days is None or interval.day_of_week in days:
+                            interval.mark_synced()
+                if kind in RemoteCommand.PUSH_KINDS and revision is not None:
+                    delivered_revisions[user.id] = max(delivered_revisions.get(user.id, 0), revision)
+                    remaining = RemoteCommand.query.filter(
+                        RemoteCommand.user_id == user.id,
+                        RemoteCommand.kind.in_(RemoteCommand.PUSH_KINDS),
+                        RemoteCommand.id != command.id,
+                    ).count()
+                    if not remaining:
+                        user.mark_applied(delivered_revisions[user.id])
+            user.bump_revision()
+            db.session.commit()
+            
+            if kind == RemoteCommand.WEEKLY_LIMITS:
+                broker.publish('sync_completed', {'user_id': user.id, 'kind': 'schedule'})
+            elif kind == RemoteCommand.ALLOWED_HOURS:
+                broker.publish('sync_completed', {'user_id': user.id, 'kind': 'intervals'})
+            else:
+                broker.publish('user_updated', {'user_id': user.id})
+        return True
+    
+    def _send_command(self, ssh_client, command):
+        """Run one outbox command on the remote computer. Returns: (success, message)"""
+        user = command.user
+        if command.kind == RemoteCommand.TIME_ADJUSTMENT:
+            operation, seconds = command.get_operation()
+            return ssh_client.modify_time_left(user.username, operation, seconds)
+        
+        if command.kind == RemoteCommand.WEEKLY_LIMITS:
+            schedule_dict = user.get_effective_schedule_dict()
+            if schedule_dict is None:
+                return True, "No weekly schedule configured"
+            # set_weekly_time_limits rejects "all zero" — nothing to push; avoid endless WARNING loop
+            if not has_positive_limits(schedule_dict):
+                return True, "No daily limits > 0 in UI; remote unchanged"
+            return ssh_client.set_weekly_time_limits(user.username, schedule_dict)
+        
+        if command.kind == RemoteCommand.ALLOWED_HOURS:
+            # Build intervals dict for SSH command (list per day)
+            intervals_dict = {}
+            for interval in user.get_effective_intervals():
+                intervals_dict.setdefault(interval.day_of_week, []).append(interval)
+            return ssh_client.set_allowed_hours(user.username, intervals_dict, days=command.get_days())
+        
+        return False, f"Unknown command kind: {command.kind}"
+    
+    def _refresh_user(self, user):
+        """Fetch the user's current timekpr data and store it"""
+        try:
+            logger.debug("Validating user %s @ %s", user.username, user.system_ip)
+            try:
+                ssh_client = self.sessions.get(user.system_ip)
+                with tracer.phase(user.id, user.username, user.system_ip, 'poll'):
+                    is_valid, result_message, info = ssh_client.validate_user(user.username)
+                logger.debug("Validation result for %s: %s", user.username, is_valid)
+                
+                if is_valid and info:
+                    with tracer.phase(user.id, user.username, user.system_ip, 'store'):
+                        changed = user.record_user_info(info)
+                        # Make sure to commit after each user update
+                        db.session.commit()
+                    logger.debug("Database committed for %s", user.username)
+                    if changed:
+                        broker.publish('user_updated', {'user_id': user.id})
+                else:
+                    metrics.command_failures.inc('userinfo')
+                    # Just update the last checked time
+                    user.last_checked = datetime.utcnow()
+                    
+                    # Don't change is_valid status for temporary failures
+                    # This allows the user to stay visible on the dashboard
+                    # Only set is_valid to False during the initial validation
+                    if not user.is_valid and is_valid:
+                        # If the user was previously invalid but is now valid, update status
+                        user.is_valid = True
                     
+                    db.session.commit()
+                    tracer.mark(user.id, user.username, user.system_ip, 'failed', result_message if not is_valid else 'No timekpr data in output')
+                    logger.warning(f"Failed to get data for {user.username}, keeping previous valid status")
+            except Exception as e:
+                # Connection error (e.g., PC is offline)
+                metrics.command_failures.inc('userinfo')
+                tracer.mark(user.id, user.username, user.system_ip, 'error', str(e))
+                logger.error(f"Connection error for user {user.username}: {str(e)}")
+                
+                # Update the last checked time but don't change validation status
+                user.last_checked = datetime.utcnow()
+                db.session.commit()
+                logger.debug("Updated last_checked time for %s but kept validation status", user.username)
+        
         except Exception as e:
-            logger.error(f"Error in user data update: {str(e)}\n{traceback.format_exc()}")
-            db.session.rollback()
\ No newline at end of file
+            tracer.mark(user.id, user.username, user.system_ip, 'error', str(e))
+            logger.error(f"Error updating user {user.username}: {str(e)}\n{traceback.format_exc()}")
+            # Continue with the next user, but make sure we commit any pending changes
+            db.session.rollback()
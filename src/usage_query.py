@@ -0,0 +1,141 @@
+"""
+Usage totals over a date range, bucketed by day, week, month or year.
+
+Daily rows are summed per bucket in SQL; archived years (packed day
+arrays, see UserTimeUsageArchive) are summed in Python, one row per user
+and year. Archived days have no daily row left, so the two never overlap.
+The result is dense (empty buckets are 0) and has at most max_points
+buckets: when the range needs more, the next coarser bucket is used, and
+a range that does not fit even by year is refused.
+"""
+from datetime import date, timedelta
+
+from src.database import db, UserTimeUsage, UserTimeUsageArchive
+
+BUCKETS = ('day', 'week', 'month', 'year')
+DEFAULT_MAX_POINTS = 400
+MAX_POINTS = 2000  # Upper limit for max_points
+LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%d %b', 'month': '%b %Y', 'year': '%Y'}
+
+
+class UsageQueryError(ValueError):
+    """Invalid range, bucket or point limit"""
+
+
+def bucket_start(day, bucket):
+    """First day of the bucket containing `day` (weeks start on Monday)"""
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def _next_bucket(start, bucket):
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return date(start.year + 1, 1, 1)
+
+
+def _bucket_count(start, end, bucket):
+    first, last = bucket_start(start, bucket), bucket_start(end, bucket)
+    if bucket == 'day':
+        return (last - first).days + 1
+    if bucket == 'week':
+        return (last - first).days // 7 + 1
+    if bucket == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return last.year - first.year + 1
+
+
+def _sql_bucket(bucket):
+    """SQLite expression for the bucket start of UserTimeUsage.date, as 'YYYY-MM-DD'"""
+    column = UserTimeUsage.date
+    if bucket == 'day':
+        return db.func.date(column)
+    if bucket == 'week':
+        return db.func.date(column, 'weekday 0', '-6 days')
+    if bucket == 'month':
+        return db.func.strftime('%Y-%m-01', column)
+    return db.func.strftime('%Y-01-01', column)
+
+
+def choose_bucket(start, end, bucket, max_points):
+    """The requested bucket, or the first coarser one that fits in max_points (None when none does)"""
+    for candidate in BUCKETS[BUCKETS.index(bucket):]:
+        if _bucket_count(start, end, candidate) <= max_points:
+            return candidate
+    return None
+
+
+def earliest_usage_date(user_ids):
+    """First day with recorded usage for any of the users, or None"""
+    first_live = db.session.query(db.func.min(UserTimeUsage.date)).filter(
+        UserTimeUsage.user_id.in_(user_ids)
+    ).scalar()
+    first_year = db.session.query(db.func.min(UserTimeUsageArchive.year)).filter(
+        UserTimeUsageArchive.user_id.in_(user_ids)
+    ).scalar()
+    candidates = [d for d in (first_live, date(first_year, 1, 1) if first_year else None) if d]
+    return min(candidates) if candidates else None
+
+
+def usage_series(user_ids, start, end, bucket='day', max_points=DEFAULT_MAX_POINTS):
+    """
+    Usage of several users in [start, end].
+    Returns: {'bucket', 'from', 'to', 'days', 'buckets': [ISO dates], 'labels': [...],
+              'users': {user id: [seconds per bucket]}}
+    """
+    if bucket not in BUCKETS:
+        raise UsageQueryError(f"bucket must be one of {', '.join(BUCKETS)}")
+    if start > end:
+        raise UsageQueryError('from must not be after to')
+    if not 1 <= max_points <= MAX_POINTS:
+        raise UsageQueryError(f'max_points must be between 1 and {MAX_POINTS}')
+    bucket = choose_bucket(start, end, bucket, max_points)
+    if bucket is None:
+        raise UsageQueryError(f'The range needs more than {max_points} points even by year')
+
+    # Counted rather than stepped past `end`: the bucket after one ending in 9999 is not a date
+    starts = [bucket_start(start, bucket)]
+    for _ in range(_bucket_count(start, end, bucket) - 1):
+        starts.append(_next_bucket(starts[-1], bucket))
+    index = {day.isoformat(): i for i, day in enumerate(starts)}
+    totals = {user_id: [0] * len(starts) for user_id in user_ids}
+
+    if totals:
+        key = _sql_bucket(bucket)
+        rows = db.session.query(UserTimeUsage.user_id, key, db.func.sum(UserTimeUsage.time_spent)).filter(
+            UserTimeUsage.user_id.in_(user_ids),
+            UserTimeUsage.date >= start,
+            UserTimeUsage.date <= end
+        ).group_by(UserTimeUsage.user_id, key).all()
+        for user_id, bucket_key, seconds in rows:
+            totals[user_id][index[bucket_key]] += seconds or 0
+
+        archives = UserTimeUsageArchive.query.filter(
+            UserTimeUsageArchive.user_id.in_(user_ids),
+            UserTimeUsageArchive.year >= start.year,
+            UserTimeUsageArchive.year <= end.year
+        ).all()
+        for archive in archives:
+            user_totals = totals[archive.user_id]
+            for day, seconds in archive.iter_days():
+                if seconds and start <= day <= end:
+                    user_totals[index[bucket_start(day, bucket).isoformat()]] += seconds
+
+    return {
+        'bucket': bucket,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': (end - start).days + 1,
+        'buckets': list(index),
+        'labels': [day.strftime(LABEL_FORMATS[bucket]) for day in starts],
+        'users': totals,
+    }
@@ -0,0 +1,226 @@
+"""
+Typed snapshot of ``timekpra --userinfo`` output.
+
+The output is parsed in one pass with a compiled pattern against a known
+schema: every key has a fixed type (int, list of ints, bool, string or a
+per-weekday allowed-hours map), so "LIMITS_PER_WEEKDAYS: 3600" is still a
+list and "ALLOWED_HOURS_1: 9" still an hour map. Keys outside the schema
+are kept as raw strings in ``extra``.
+
+A snapshot serializes to compact JSON with sorted keys (``dumps``), which
+is what ManagedUser.last_config stores; equal snapshots give equal text,
+so change detection is a string comparison. ``load_userinfo`` reads it
+back (also accepting the loosely typed dicts stored by older versions) and
+caches the result per stored text.
+"""
+import json
+import re
+from functools import lru_cache
+
+LINE_RE = re.compile(r'^[ \t]*([A-Z][A-Z0-9_]*):[ \t]*(.*?)[ \t]*$', re.MULTILINE)
+HOUR_SPEC_RE = re.compile(r'^(\d{1,2})(?:\[(\d{1,2})-(\d{1,2})\])?$')
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError('boolean is not an int')
+    if isinstance(value, (list, tuple)):
+        # Older snapshots stored "1;2" style values as lists
+        if len(value) != 1:
+            raise ValueError('expected a single value')
+        value = value[0]
+    return int(value)
+
+
+def _to_int_list(value):
+    if isinstance(value, (list, tuple)):
+        return [_to_int(item) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return [value]
+    return [int(item) for item in value.split(';') if item]
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in ('true', '1'):
+        return True
+    if lowered in ('false', '0'):
+        return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+def _to_str(value):
+    if isinstance(value, (list, tuple)):
+        return ';'.join(str(item) for item in value)
+    return str(value)
+
+
+@lru_cache(maxsize=512)
+def _parse_hours_spec(spec):
+    """Cached: the same few specs come back on every poll of every user"""
+    hours = []
+    for item in spec.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        if item.isdigit() and int(item) < 24:
+            hours.append((int(item), (0, 59)))  # Most entries are whole hours
+            continue
+        match = HOUR_SPEC_RE.match(item)
+        if not match:
+            raise ValueError(f'bad hour spec: {item!r}')
+        hour = int(match.group(1))
+        start = int(match.group(2) or 0)
+        end = int(match.group(3) or 59)
+        if not (0 <= hour < 24 and 0 <= start <= end <= 59):
+            raise ValueError(f'bad hour spec: {item!r}')
+        hours.append((hour, (start, end)))
+    return tuple(hours)
+
+
+def _to_hours(value):
+    """
+    timekpr allowed-hours spec ("7;8;14[30-59]") as {hour: (start_minute, end_minute)}.
+    A plain hour is the whole hour, (0, 59).
+    """
+    if isinstance(value, dict):
+        return {int(hour): tuple(bounds) for hour, bounds in value.items()}
+    if isinstance(value, (list, tuple)):
+        value = ';'.join(str(item) for item in value)
+    return dict(_parse_hours_spec(str(value)))
+
+
+def format_hours(hours):
+    """Inverse of _to_hours: {hour: (start, end)} back to a timekpr spec string"""
+    return ';'.join(
+        str(hour) if (start, end) == (0, 59) else f'{hour}[{start}-{end}]'
+        for hour, (start, end) in sorted(hours.items())
+    )
+
+
+# timekpr key -> converter; the attribute is the lowercased key
+SCHEMA = {
+    'TIME_LEFT_DAY': _to_int,
+    'TIME_SPENT_DAY': _to_int,
+    'TIME_SPENT_WEEK': _to_int,
+    'TIME_SPENT_MONTH': _to_int,
+    'TIME_SPENT_BALANCE': _to_int,
+    'LIMIT_PER_WEEK': _to_int,
+    'LIMIT_PER_MONTH': _to_int,
+    'ALLOWED_WEEKDAYS': _to_int_list,
+    'LIMITS_PER_WEEKDAYS': _to_int_list,
+    'WAKEUP_HOUR_INTERVAL': _to_int_list,
+    'TRACK_INACTIVE': _to_bool,
+    'HIDE_TRAY_ICON': _to_bool,
+    'LOCKOUT_TYPE': _to_str,
+    'PLAYTIME_ENABLED': _to_bool,
+    'PLAYTIME_LIMIT_OVERRIDE_ENABLED': _to_bool,
+    'PLAYTIME_UNACCOUNTED_INTERMEDIATE_PROCESSES_ENABLED': _to_bool,
+    'PLAYTIME_ALLOWED_WEEKDAYS': _to_int_list,
+    'PLAYTIME_LIMITS_PER_WEEKDAYS': _to_int_list,
+    'PLAYTIME_ACTIVITIES': _to_str,
+    'ACTUAL_TIME_SPENT_SESSION': _to_int,
+    'ACTUAL_TIME_INACTIVE_SESSION': _to_int,
+    'ACTUAL_TIME_SPENT_BALANCE': _to_int,
+    'ACTUAL_TIME_SPENT_DAY': _to_int,
+    'ACTUAL_TIME_LEFT_DAY': _to_int,
+    'ACTUAL_TIME_LEFT_CONTINUOUS': _to_int,
+    'ACTUAL_PLAYTIME_LEFT_DAY': _to_int,
+    'ACTUAL_ACTIVE_PLAYTIME_ACTIVITY_COUNT': _to_int,
+    'ACTUAL_ACTIVE_PLAYTIME_ACTIVITY_LIST': _to_str,
+}
+FIELDS = tuple(key.lower() for key in SCHEMA)
+_ATTRS = {key: key.lower() for key in SCHEMA}
+HOURS_PREFIX = 'ALLOWED_HOURS_'
+
+
+class UserInfo:
+    """One user's timekpr state; fields absent from the output are None"""
+    __slots__ = FIELDS + ('allowed_hours', 'extra')
+
+    def __init__(self):
+        for attr in FIELDS:
+            setattr(self, attr, None)
+        self.allowed_hours = {}  # weekday (1-7) -> {hour: (start_minute, end_minute)}
+        self.extra = {}  # Keys outside the schema, raw strings
+
+    def _set(self, key, value):
+        """Store one key, converting it by the schema; unparseable values go to extra"""
+        try:
+            converter = SCHEMA.get(key)
+            if converter is not None:
+                setattr(self, _ATTRS[key], converter(value))
+                return
+            if key.startswith(HOURS_PREFIX):
+                day = int(key[len(HOURS_PREFIX):])
+                if 1 <= day <= 7:
+                    self.allowed_hours[day] = _to_hours(value)
+                    return
+        except (TypeError, ValueError):
+            pass
+        self.extra[key] = _to_str(value)
+
+    def __bool__(self):
+        return bool(self.extra or self.allowed_hours) or any(
+            getattr(self, attr) is not None for attr in FIELDS
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, UserInfo):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'UserInfo({self.dumps()})'
+
+    def get(self, key, default=None):
+        """Value by timekpr key, e.g. get('TIME_LEFT_DAY')"""
+        attr = _ATTRS.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            return default if value is None else value
+        if key.startswith(HOURS_PREFIX) and key[len(HOURS_PREFIX):].isdigit():
+            hours = self.allowed_hours.get(int(key[len(HOURS_PREFIX):]))
+            return default if hours is None else hours
+        return self.extra.get(key, default)
+
+    def to_dict(self):
+        """Canonical dict keyed by timekpr names; absent fields are omitted"""
+        result = dict(self.extra)
+        for key, attr in _ATTRS.items():
+            value = getattr(self, attr)
+            if value is not None:
+                result[key] = value
+        for day, hours in self.allowed_hours.items():
+            result[f'{HOURS_PREFIX}{day}'] = format_hours(hours)
+        return result
+
+    def dumps(self):
+        """Compact canonical JSON, stable for equal snapshots"""
+        return json.dumps(self.to_dict(), separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, data):
+        info = cls()
+        for key, value in data.items():
+            info._set(key, value)
+        return info
+
+
+def parse_userinfo(output):
+    """Parse `timekpra --userinfo` output into a UserInfo snapshot"""
+    info = UserInfo()
+    for key, value in LINE_RE.findall(output):
+        info._set(key, value)
+    return info
+
+
+@lru_cache(maxsize=256)
+def load_userinfo(text):
+    """
+    UserInfo from stored JSON (canonical or from older versions).
+    Cached per text, so callers must not modify the returned snapshot.
+    """
+    return UserInfo.from_dict(json.loads(text))
@@ -0,0 +1,70 @@
+// Live updates over Server-Sent Events (/api/events).
+// handlers maps event names to callbacks receiving the parsed event data.
+// While the stream is down, refused (the server is at its stream limit) or
+// EventSource is unsupported, fallbackPoll runs every fallbackInterval ms so
+// the page keeps working without SSE.
+function subscribeLiveUpdates(handlers, fallbackPoll, fallbackInterval) {
+    let pollTimer = null;
+
+    function startPolling() {
+        if (!pollTimer) {
+            pollTimer = setInterval(fallbackPoll, fallbackInterval);
+        }
+    }
+
+    function stopPolling() {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return null;
+    }
+
+    const source = new EventSource('/api/events');
+    source.onopen = () => {
+        stopPolling();
+        // Catch up on anything missed while disconnected
+        fallbackPoll();
+    };
+    source.onerror = () => startPolling();
+
+    for (const [event, handler] of Object.entries(handlers)) {
+        source.addEventListener(event, e => handler(JSON.parse(e.data)));
+    }
+
+    window.addEventListener('beforeunload', () => source.close());
+    return source;
+}
+
+// Collapse bursts of events into a single call after `delay` ms
+function debounce(fn, delay) {
+    let timer = null;
+    return function() {
+        clearTimeout(timer);
+        timer = setTimeout(fn, delay);
+    };
+}
+
+// Poll a background job (/api/jobs/<id>) until it finishes.
+// Resolves with the job dict; rejects if the job cannot be fetched.
+function waitForJob(jobId, interval = 500) {
+    return new Promise((resolve, reject) => {
+        function check() {
+            fetch(`/api/jobs/${jobId}`, { cache: 'no-cache' })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        reject(new Error(data.message));
+                    } else if (data.job.status === 'done' || data.job.status === 'failed') {
+                        resolve(data.job);
+                    } else {
+                        setTimeout(check, interval);
+                    }
+                })
+                .catch(reject);
+        }
+        check();
+    });
+}
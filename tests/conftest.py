@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench', action='store_true', help='Also run the route benchmark (SQL statements against its baseline)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'bench: slow benchmark compared with a tracked baseline (run with --bench)')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --bench')
+    for item in items:
+        if 'bench' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,18 @@
+"""Route benchmark: SQL statements per request against benchmarks/baselines/routes.json (opt-in: pytest --bench)"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.mark.bench
+def test_route_queries_within_baseline():
+    # A separate process: the benchmark points the app at its scratch database before importing it
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'bench_routes.py')],
+        cwd=ROOT, capture_output=True, text=True, timeout=900,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
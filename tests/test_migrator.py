@@ -0,0 +1,33 @@
+"""Database path resolution of the migration runner"""
+import os
+import sqlite3
+
+from flask import Flask
+
+from src.migrator import _db_path, run_migrations
+
+
+def make_app(uri, instance_path):
+    app = Flask(__name__, instance_path=str(instance_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    return app
+
+
+def test_absolute_path_keeps_leading_slash(tmp_path):
+    path = os.path.join(str(tmp_path), 'timekpr.db')
+    assert _db_path(make_app(f'sqlite:///{path}', tmp_path / 'instance')) == path
+
+
+def test_relative_path_is_in_instance_folder(tmp_path):
+    instance = tmp_path / 'instance'
+    assert _db_path(make_app('sqlite:///timekpr.db', instance)) == os.path.join(str(instance), 'timekpr.db')
+
+
+def test_migrations_applied_to_absolute_path(tmp_path):
+    path = os.path.join(str(tmp_path), 'timekpr.db')
+    run_migrations(make_app(f'sqlite:///{path}', tmp_path / 'instance'))
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM schema_migrations').fetchone()[0] > 0
+    finally:
+        conn.close()
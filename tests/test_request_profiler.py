@@ -0,0 +1,56 @@
+"""Query budget enforcement of RequestProfiler (REQUEST_PROFILING_STRICT)"""
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from src.database import db
+from src.request_profiler import RequestProfiler, QueryBudgetExceeded
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        REQUEST_PROFILING=True,
+        **config,
+    )
+    db.init_app(app)
+
+    @app.route('/three-queries')
+    def three_queries():
+        for _ in range(3):
+            db.session.execute(text('SELECT 1'))
+        return 'ok'
+
+    @app.route('/one-query')
+    def one_query():
+        db.session.execute(text('SELECT 1'))
+        return 'ok'
+
+    return app, RequestProfiler(app, db)
+
+
+def test_strict_mode_raises_over_budget():
+    app, _ = make_app(REQUEST_QUERY_BUDGET=2, REQUEST_PROFILING_STRICT=True)
+    client = app.test_client()
+    assert client.get('/one-query').status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match='ran 3 SQL statements, budget is 2'):
+        client.get('/three-queries')
+
+
+def test_per_endpoint_budget_overrides_default():
+    app, _ = make_app(REQUEST_QUERY_BUDGET=2, REQUEST_QUERY_BUDGETS={'three_queries': 3},
+                      REQUEST_PROFILING_STRICT=True)
+    assert app.test_client().get('/three-queries').status_code == 200
+
+
+def test_over_budget_only_warns_without_strict(caplog):
+    app, profiler = make_app(REQUEST_QUERY_BUDGET=2)
+    with caplog.at_level(logging.WARNING, logger='src.request_profiler'):
+        assert app.test_client().get('/three-queries').status_code == 200
+    assert 'budget is 2' in caplog.text
+    assert profiler.recent(1)[0]['queries'] == 3
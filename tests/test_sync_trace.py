@@ -0,0 +1,60 @@
+"""Sync traces of deliveries made outside a poll cycle (bulk requests)"""
+import logging
+
+import paramiko
+import pytest
+from flask import Flask
+
+from benchmarks.fake_timekpr import FakeFleet
+from src.database import db, ManagedUser, RemoteCommand
+from src.sync_trace import tracer
+from src.task_manager import BackgroundTaskManager
+
+
+@pytest.fixture
+def fleet_app(tmp_path, monkeypatch):
+    # Any key is accepted by the fake servers; it only has to exist
+    key_path = tmp_path / 'client_key'
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(key_path))
+    monkeypatch.setenv('TIMEKPR_SSH_KEY', str(key_path))
+    logging.getLogger('src').setLevel(logging.CRITICAL)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'traces.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with FakeFleet(hosts=1, users_per_host=1) as fleet, app.app_context():
+        db.create_all()
+        yield app, fleet.hosts[0].address
+
+
+def test_bulk_delivery_makes_one_trace_per_user(fleet_app):
+    app, address = fleet_app
+    user = ManagedUser(username='user0', system_ip=address, is_valid=True)
+    # Not on the fake computer: its commands fail
+    ghost = ManagedUser(username='ghost', system_ip=address, is_valid=True)
+    db.session.add_all([user, ghost])
+    db.session.commit()
+    RemoteCommand.queue_time_adjustment(user, '+', 900)
+    RemoteCommand.queue_push(user, RemoteCommand.ALLOWED_HOURS)
+    RemoteCommand.queue_time_adjustment(ghost, '+', 600)
+    db.session.commit()
+
+    manager = BackgroundTaskManager(app)  # Not started: delivery runs in this thread's pool
+    assert list(manager.deliver_now([address])) == [(address, True)]
+
+    traces = tracer.traces(user.id)
+    assert len(traces) == 1
+    trace = traces[0]
+    assert trace['cycle'] is None
+    assert set(trace['phases']) == {'deliver'}
+    assert len(trace['commands']) >= 2
+    assert trace['result'] == 'ok'
+
+    traces = tracer.traces(ghost.id)
+    assert len(traces) == 1
+    trace = traces[0]
+    assert set(trace['phases']) == {'deliver'}
+    assert trace['commands'][0]['exit_status'] == 1
+    assert trace['result'] == 'failed'
+    assert trace['error']
@@ -0,0 +1,33 @@
+"""Round trip of timekpra --userinfo output through UserInfo.parse and dumps/loads"""
+import random
+
+import pytest
+
+from benchmarks.bench_userinfo import check_round_trip, load_samples, random_output
+from src.userinfo import parse_userinfo
+
+SAMPLES = load_samples()
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLES))
+def test_recorded_output_round_trips(name):
+    info = check_round_trip(SAMPLES[name])
+    assert info, f'{name} parsed to an empty snapshot'
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_output_round_trips(seed):
+    rng = random.Random(seed)
+    for _ in range(25):
+        lines = random_output(rng)
+        info = check_round_trip('\n'.join(lines))
+        rng.shuffle(lines)
+        assert parse_userinfo('\n'.join(lines)).dumps() == info.dumps(), 'line order changed the snapshot'
+
+
+def test_blank_lines_are_ignored_and_unknown_keys_kept_as_text():
+    output = SAMPLES['single_values.txt']
+    info = parse_userinfo('\n\n'.join(output.splitlines()) + '\nSOME_FUTURE_KEY: 1;two\n')
+    assert info.get('SOME_FUTURE_KEY') == '1;two'
+    assert info.get('TIME_LEFT_DAY') == parse_userinfo(output).get('TIME_LEFT_DAY')
+    check_round_trip(output + '\nSOME_FUTURE_KEY: 1;two\n')